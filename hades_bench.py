@@ -0,0 +1,443 @@
+"""
+HADES v2 - hades_bench.py
+Scan and export benchmarks on synthetic data
+--suite: scan / diff / save / export on a generated mount tree, results as JSON
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_scan import scan_files, peak_rss_mb, SCAN_DEPTH, EXCLUDE_DIRS
+from hades_metrics import Metrics, recording
+
+BENCH_EXTS = [".jpg", ".jpeg", ".png", ".heic", ".mov", ".mp4", ".mp3", ".flac", ".pdf", ".txt", ".zip", ".py", ".bin"]
+BENCH_EPOCH_NS = 1_600_000_000 * 10**9
+BENCH_MAX_SIZE_LOG2 = 33      # sparse files up to 8 GB, log-uniform
+SUITE_STEPS = ["scan", "save_initial", "diff", "save", "export"]
+SUITE_CHANGE = 0.01           # share of files modified, and again added / removed, before the diff
+REGRESSION_THRESHOLD = 0.10   # --compare: slower than the baseline by more than this fails
+
+
+def _rand_name(rng, length):
+    return "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789_-", k=length))
+
+
+def _write_file(path, size, mtime_ns):
+    """Sparse file of the given size and mtime (no data blocks written)."""
+    with open(path, "wb") as f:
+        f.truncate(size)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def make_tree(root, n_files, fanout=8, depth=4, name_len=12, seed=0):
+    """Reproducible synthetic mount: n_files sparse files over the leaves of a fanout^depth tree.
+
+    Names (name_len random characters, a counter, an extension), sizes and mtimes
+    come from a seeded RNG: the same arguments always give the same scan result.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    dirs = [root]
+    for _ in range(depth):
+        dirs = [d / f"{_rand_name(rng, name_len)}{i:x}" for d in dirs for i in range(fanout)]
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        name = f"{_rand_name(rng, name_len)}{i:x}{rng.choice(BENCH_EXTS)}"
+        _write_file(dirs[i % len(dirs)] / name, int(2 ** rng.uniform(0, BENCH_MAX_SIZE_LOG2)) - 1,
+                    BENCH_EPOCH_NS + rng.randrange(10**17))
+    return root
+
+
+def mutate_tree(root, fraction=SUITE_CHANGE, name_len=12, seed=1):
+    """Modify, remove and add fraction of the files each (seeded), like a disk between two scans.
+
+    Returns {modified, removed, added} counts.
+    """
+    rng = random.Random(seed)
+    files = sorted(str(Path(d) / f) for d, _, names in os.walk(root) for f in names)
+    n = max(1, int(len(files) * fraction))
+    picked = rng.sample(files, min(len(files), 2 * n))
+    for path in picked[:n]:
+        st = os.stat(path)
+        _write_file(path, st.st_size + 1, st.st_mtime_ns + 10**9)
+    for path in picked[n:]:
+        os.remove(path)
+    dirs = sorted({str(Path(f).parent) for f in files})
+    for i in range(n):
+        _write_file(Path(rng.choice(dirs)) / f"new_{_rand_name(rng, name_len)}{i:x}.jpg",
+                    rng.randrange(1024**3), BENCH_EPOCH_NS + rng.randrange(10**17))
+    return {"modified": n, "removed": len(picked) - n, "added": n}
+
+
+def legacy_scan_files(mount_point, max_depth=SCAN_DEPTH):
+    """Pre-scandir walker (Path.iterdir + recursion), kept as the reference."""
+    files = {}
+    mount_str = str(mount_point)
+    def _scan(path, depth):
+        if depth > max_depth:
+            return
+        try:
+            for entry in path.iterdir():
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir():
+                        if entry.name in EXCLUDE_DIRS:
+                            continue
+                        _scan(entry, depth + 1)
+                    elif entry.is_file():
+                        rel_path = str(entry).replace(mount_str, "")
+                        stat = entry.stat()
+                        files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+                except (PermissionError, OSError):
+                    pass
+        except PermissionError:
+            pass
+    _scan(Path(mount_point), 0)
+    return files
+
+
+def bench(fn, mount, rounds):
+    """Best wall time of `rounds` runs, and the last result."""
+    best, result = None, None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(mount)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_bench(n_files=100_000, rounds=3, root=None, workers=4):
+    tmp = Path(root) if root else Path(tempfile.mkdtemp(prefix="hades_bench_"))
+    try:
+        print(f"[HADES] Building synthetic tree: {n_files} files @ {tmp}")
+        make_tree(tmp, n_files)
+        legacy_t, legacy = bench(legacy_scan_files, tmp, rounds)
+        new_t, new = bench(scan_files, tmp, rounds)
+        if legacy != new:
+            print("[HADES] ❌ Result mismatch between walkers!")
+            return 1
+        print(f"[HADES] iterdir walker : {legacy_t:.2f}s | {len(legacy) / legacy_t:,.0f} files/s")
+        print(f"[HADES] scandir walker : {new_t:.2f}s | {len(new) / new_t:,.0f} files/s")
+        print(f"[HADES] Speedup        : {legacy_t / new_t:.2f}x")
+        if workers > 1:
+            par_t, par = bench(lambda m: scan_files(m, workers=workers), tmp, rounds)
+            if par != new:
+                print("[HADES] ❌ Result mismatch in parallel walker!")
+                return 1
+            print(f"[HADES] scandir x{workers:<2} walker: {par_t:.2f}s | {len(par) / par_t:,.0f} files/s")
+        return 0
+    finally:
+        if not root:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Export benchmark ---
+# Each step runs in its own process (HOME = temp dir) so peak RSS is per step.
+
+def seed_db(n_files, n_disks):
+    """Fill a fresh DB with n_disks synthetic disks of n_files files each (some 20/50 GB+ ones)."""
+    from hades_db import init_db, session, get_or_create_disk, save_new_version
+    with session():
+        init_db()
+        for d in range(n_disks):
+            disk_id = get_or_create_disk(f"BENCH{d}", platform="linux")
+            files = {
+                f"/dir{i % 97:02d}/sub{i % 13:02d}/file{i:07d}{('.jpg', '.mov', '.txt', '.bin')[i % 4]}": {
+                    "size": 60 * 1024**3 if i % 50_000 == 7 else (i * 7919) % (512 * 1024**2),
+                    "mtime_ns": 1_700_000_000_000_000_000 + i * 1_000_003,
+                }
+                for i in range(n_files)
+            }
+            save_new_version(disk_id, files, {"added": list(files), "removed": [], "modified": []})
+
+
+def _legacy_border():
+    from openpyxl.styles import Border, Side
+    s = Side(style="thin", color="CCCCCC")
+    return Border(left=s, right=s, top=s, bottom=s)
+
+
+def legacy_export(path):
+    """Pre-streaming export of the disk sheets (fetchall + full cell grid + style objects per cell).
+
+    Kept as the reference; the dashboard and history sheets are a few dozen
+    cells in both versions and are left out.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+    from hades_db import VERSION_ENTRIES_SQL, EXT_CATEGORIES, CAT_OTHER, session, get_conn, format_mtime
+    import hades_export as hx
+
+    def data_style(cell, bold=False, color="000000", bg=None, align="left"):
+        cell.font = Font(name="Arial", bold=bold, color=color, size=10)
+        cell.alignment = Alignment(horizontal=align, vertical="center")
+        cell.border = _legacy_border()
+        if bg:
+            cell.fill = PatternFill("solid", start_color=bg)
+
+    with session():
+        c = get_conn().cursor()
+        wb = Workbook()
+        for disk_id, label in c.execute("SELECT id, label FROM disks ORDER BY label").fetchall():
+            ver = c.execute("SELECT id FROM scan_versions WHERE disk_id = ? ORDER BY scanned_at DESC LIMIT 1",
+                            (disk_id,)).fetchone()
+            files = c.execute(VERSION_ENTRIES_SQL + " ORDER BY f.size_bytes DESC", (ver[0],)).fetchall()
+            ws = wb.create_sheet(title=f"💾 {label}")
+            for i, w in enumerate([6, 35, 45, 14, 20, 14], 1):
+                ws.column_dimensions[get_column_letter(i)].width = w
+            for idx, (folder, filename, size, mtime_ns) in enumerate(files, 1):
+                row = idx + 4
+                ws.row_dimensions[row].height = 18
+                bg = hx.C_ROW_ALT if idx % 2 == 0 else "FFFFFF"
+                mb = hx.format_mb(size)
+                ext = Path(filename).suffix.lower()
+                cat = EXT_CATEGORIES.get(ext, CAT_OTHER)
+                gb = mb / 1024
+                col_bg = hx.C_RED if gb >= 50 else (hx.C_ORANGE if gb >= 20 else None)
+                vals = [idx, filename, folder or "/", mb, format_mtime(mtime_ns), cat]
+                for j, v in enumerate(vals, 1):
+                    cell = ws.cell(row=row, column=j, value=v)
+                    if j == 4 and col_bg:
+                        cell.fill = PatternFill("solid", start_color=col_bg)
+                        cell.font = Font(name="Arial", bold=True, color="FFFFFF", size=10)
+                        cell.alignment = Alignment(horizontal="right", vertical="center")
+                        cell.border = _legacy_border()
+                    else:
+                        data_style(cell, bg=bg, align="right" if j in [1, 4] else "left")
+            ws.auto_filter.ref = f"A4:F{len(files)+4}"
+            ws.freeze_panes = "A5"
+        wb.save(path)
+
+
+def stream_export(path):
+    import hades_export as hx
+    hx.EXPORT_PATH = Path(path)
+    hx.export()
+
+
+def _quiet(*_):
+    pass
+
+
+def _suite_step(step, tree, out, rounds):
+    """One --suite step against the DB under HOME, returns its result dict.
+
+    Only the named operation is timed; the scan a diff / save needs first is not.
+    """
+    import hades_db
+    from hades_db import (init_db, session, get_or_create_disk, get_last_version, get_version_files,
+                          compute_diff, save_new_version, backup_once, maintenance)
+    with session():
+        init_db()
+        disk_id = get_or_create_disk("BENCH", platform="linux")
+        if step == "scan":
+            seconds, files = bench(lambda m: scan_files(m, log=_quiet), tree, rounds)
+            return {"seconds": seconds, "files": len(files), "files_per_s": len(files) / seconds}
+        if step == "export":
+            seconds, _ = bench(stream_export, out, rounds)
+            return {"seconds": seconds, "xlsx_mb": Path(out).stat().st_size / 1024**2}
+
+        files = scan_files(tree, log=_quiet)
+        if step == "save_initial":
+            start = time.perf_counter()
+            with recording(Metrics("save")) as metrics:
+                save_new_version(disk_id, files, {"added": list(files), "removed": [], "modified": []})
+            seconds = time.perf_counter() - start
+            return {"seconds": seconds, "files": len(files), "files_per_s": len(files) / seconds,
+                    "phases": metrics.phases}
+
+        def diff(_):
+            return compute_diff(get_version_files(get_last_version(disk_id)["id"]), files)
+        seconds, d = bench(diff, None, rounds)
+        changes = {k: len(d[k]) for k in ("added", "removed", "modified")}
+        if step == "diff":
+            return {"seconds": seconds, **changes}
+
+        # save: backup, delta insert + rollups + search index, version prune, then the deferred row prune
+        hades_db.MAX_VERSIONS_PER_DISK = 1
+        t0 = time.perf_counter()
+        backup_once()
+        t1 = time.perf_counter()
+        with recording(Metrics("save")) as metrics:
+            save_new_version(disk_id, files, d, get_last_version(disk_id)["id"])
+        t2 = time.perf_counter()
+        pruned = maintenance(log=_quiet)["rows"]
+        t3 = time.perf_counter()
+        return {"seconds": t3 - t0, "backup_s": t1 - t0, "save_s": t2 - t1, "maintenance_s": t3 - t2,
+                "pruned_rows": pruned, "phases": metrics.phases, **changes}
+
+
+def _bench_step(step, n_files, n_disks, out, tree=None, rounds=1):
+    """Child process body: run one step, print {seconds, peak_rss_mb, ...} as JSON."""
+    start = time.perf_counter()
+    result = {}
+    if step == "seed":
+        seed_db(n_files, n_disks)
+    elif step == "legacy":
+        legacy_export(out)
+    elif step == "stream":
+        stream_export(out)
+    else:
+        result = _suite_step(step, tree, out, rounds)
+    print(json.dumps({"seconds": time.perf_counter() - start, **result, "peak_rss_mb": peak_rss_mb()}))
+
+
+def _run_step(step, home, n_files=0, n_disks=0, out="", tree="", rounds=1):
+    proc = subprocess.run(
+        [sys.executable, __file__, "--step", step, "--files", str(n_files), "--disks", str(n_disks), "--out", out,
+         "--root", str(tree), "--rounds", str(rounds)],
+        env={**os.environ, "HOME": str(home)}, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_export_bench(n_files=100_000, n_disks=2, root=None):
+    tmp = Path(root) if root else Path(tempfile.mkdtemp(prefix="hades_bench_"))
+    try:
+        print(f"[HADES] Seeding DB: {n_disks} disks x {n_files} files @ {tmp}")
+        seed = _run_step("seed", tmp, n_files, n_disks)
+        print(f"[HADES] Seed           : {seed['seconds']:.1f}s")
+        results = {}
+        for step in ("legacy", "stream"):
+            out = tmp / f"{step}.xlsx"
+            results[step] = _run_step(step, tmp, n_files, n_disks, str(out))
+            r = results[step]
+            print(f"[HADES] {step:<6} export  : {r['seconds']:.2f}s | peak RSS {r['peak_rss_mb']:.0f} MB"
+                  f" | {out.stat().st_size / 1024**2:.1f} MB xlsx")
+        old, new = results["legacy"], results["stream"]
+        print(f"[HADES] Speedup        : {old['seconds'] / new['seconds']:.2f}x time, "
+              f"{old['peak_rss_mb'] / new['peak_rss_mb']:.1f}x less memory")
+        return 0
+    finally:
+        if not root:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Suite: scan -> save -> change -> diff -> save (backup + prune) -> export ---
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", "-C", str(Path(__file__).parent), *args],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_meta():
+    """Where the numbers come from: commit, interpreter, SQLite, machine."""
+    commit = _git("rev-parse", "--short", "HEAD")
+    return {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")) if commit else None,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(n_files=100_000, depth=4, fanout=8, name_len=12, seed=0, rounds=1, root=None, json_path=None):
+    """Every SUITE_STEPS step in its own process on one generated tree; results to json_path."""
+    tmp = Path(root) if root else Path(tempfile.mkdtemp(prefix="hades_bench_"))
+    tree, home = tmp / "mount", tmp / "home"
+    params = {"files": n_files, "depth": depth, "fanout": fanout, "name_len": name_len, "seed": seed,
+              "rounds": rounds}
+    try:
+        print(f"[HADES] Generating tree: {n_files} files, depth {depth}, fan-out {fanout} @ {tree}")
+        start = time.perf_counter()
+        make_tree(tree, n_files, fanout, depth, name_len, seed)
+        print(f"[HADES] Generated in {time.perf_counter() - start:.1f}s")
+
+        results = {}
+        for step in SUITE_STEPS:
+            if step == "diff":
+                params["changes"] = mutate_tree(tree, name_len=name_len, seed=seed + 1)
+            results[step] = r = _run_step(step, home, out=str(tmp / "export.xlsx"), tree=tree,
+                                          rounds=1 if step in ("save_initial", "save") else rounds)
+            print(f"[HADES] {step:<12} : {r['seconds']:8.2f}s | peak RSS {r['peak_rss_mb']:6.0f} MB")
+
+        report = {"meta": bench_meta(), "params": params, "results": results}
+        json_path = Path(json_path or f"hades_bench_{report['meta']['commit'] or 'nogit'}_{n_files}.json")
+        json_path.write_text(json.dumps(report, indent=1))
+        print(f"[HADES] Results: {json_path}")
+        return report
+    finally:
+        if not root:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare_results(base, new, threshold=REGRESSION_THRESHOLD):
+    """Print time / memory of new against base (suite JSON dicts), return the steps that got slower."""
+    print(f"\n=== HADES BENCH: {base['meta']['commit']} → {new['meta']['commit']} ===")
+    if base["params"] != new["params"]:
+        print(f"   ⚠️  Different parameters: {base['params']} vs {new['params']}")
+    slower = []
+    for step, r in new["results"].items():
+        old = base["results"].get(step)
+        if not old:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        flag = "❌" if ratio > 1 + threshold else "✅"
+        if ratio > 1 + threshold:
+            slower.append(step)
+        print(f"   {flag} {step:<12} {old['seconds']:8.2f}s → {r['seconds']:8.2f}s ({ratio - 1:+.0%})"
+              f" | RSS {old['peak_rss_mb']:.0f} → {r['peak_rss_mb']:.0f} MB")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES scan / export benchmark")
+    parser.add_argument("--files", type=int, default=100_000, help="synthetic file count")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per walker (best is reported)")
+    parser.add_argument("--workers", type=int, default=4, help="threads for the parallel walker run")
+    parser.add_argument("--root", help="build the tree here instead of a temp dir (kept afterwards)")
+    parser.add_argument("--export", action="store_true", help="benchmark export() instead of the walker")
+    parser.add_argument("--disks", type=int, default=2, help="synthetic disks for --export")
+    parser.add_argument("--suite", action="store_true",
+                        help="scan / diff / save / export suite on a generated tree, results as JSON")
+    parser.add_argument("--depth", type=int, default=4, help="tree depth")
+    parser.add_argument("--fanout", type=int, default=8, help="sub-folders per folder")
+    parser.add_argument("--name-len", type=int, default=12, help="random characters per file / folder name")
+    parser.add_argument("--seed", type=int, default=0, help="generator seed")
+    parser.add_argument("--json", help="suite results file (default hades_bench_<commit>_<files>.json)")
+    parser.add_argument("--compare", metavar="BASE_JSON",
+                        help="with --suite: compare against an earlier run, exit 1 on a regression; "
+                             "with --json too and no --suite: compare two result files")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="allowed slowdown per step for --compare (0.1 = 10%%)")
+    parser.add_argument("--step", choices=["seed", "legacy", "stream", *SUITE_STEPS], help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.step:
+        _bench_step(args.step, args.files, args.disks, args.out, args.root, args.rounds)
+    elif args.compare and not args.suite:
+        if not args.json:
+            parser.error("--compare needs --suite or a second result file in --json")
+        base, new = (json.loads(Path(p).read_text()) for p in (args.compare, args.json))
+        sys.exit(1 if compare_results(base, new, args.threshold) else 0)
+    elif args.suite:
+        report = run_suite(args.files, args.depth, args.fanout, args.name_len, args.seed,
+                           args.rounds, args.root, args.json)
+        if args.compare:
+            base = json.loads(Path(args.compare).read_text())
+            sys.exit(1 if compare_results(base, report, args.threshold) else 0)
+    elif args.export:
+        sys.exit(run_export_bench(args.files, args.disks, args.root))
+    else:
+        sys.exit(run_bench(args.files, args.rounds, args.root, args.workers))
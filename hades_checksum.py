@@ -0,0 +1,212 @@
+"""
+HADES v2 - hades_checksum.py
+Content checksums and bit-rot detection
+New or changed files are hashed, a rotating slice of old digests is re-verified
+every run; both under a time / byte budget so a big archive disk is covered
+over several runs instead of all at once
+"""
+
+import os
+import sys
+import mmap
+import time
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_db import (
+    HASH_DIGEST_SQL, HASH_MISSING_SQL, HASH_PRUNE_DISK_SQL, HASH_VERIFY_SQL, HASH_VERIFIED_SQL, MISMATCH_INSERT_SQL, MISMATCHES_SQL,
+    init_db, session, transaction, get_conn, get_dir_path
+)
+from hades_scan import detect_disks, format_bytes
+
+HASH_CHUNK = 4 * 1024**2
+HASH_WORKERS = 4
+CHECKSUM_TIME_BUDGET = 10 * 60     # seconds per run, all disks together
+CHECKSUM_BYTE_BUDGET = 50 * 1024**3
+HASH_SLICE = 1000                  # files per query / write transaction
+
+
+def file_digest(path):
+    """blake2b-256 of a file, read through mmap (no read() copies; the GIL is released while hashing)."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as view:
+                    for off in range(0, len(view), HASH_CHUNK):
+                        h.update(view[off:off + HASH_CHUNK])
+    return h.digest()
+
+
+class Budget:
+    """Seconds and bytes left for this run; hashing stops handing out work once either runs out."""
+
+    def __init__(self, seconds=CHECKSUM_TIME_BUDGET, nbytes=CHECKSUM_BYTE_BUDGET):
+        self.deadline = time.monotonic() + seconds
+        self.bytes_left = nbytes
+
+    def take(self, size):
+        if self.bytes_left < size or time.monotonic() >= self.deadline:
+            return False
+        self.bytes_left -= size
+        return True
+
+    @property
+    def exhausted(self):
+        return self.bytes_left <= 0 or time.monotonic() >= self.deadline
+
+
+def _hash_budgeted(pool, rows, mount, budget, workers, on_result):
+    """Hash the files of rows [(dir_id, name, size, mtime_ns, ...)] on the pool within budget.
+
+    Calls on_result(row, digest) in the caller's thread (the DB writer); a file
+    that is missing or changed since the scan is skipped without being charged to
+    the budget. Returns (files, bytes, done) where done is False if the budget ran
+    out before the rows did.
+    """
+    c = get_conn()
+    dir_paths = {}
+    in_flight = set()
+    files = nbytes = 0
+
+    def run(row, path):
+        try:
+            return row, file_digest(path)
+        except OSError:
+            return row, None
+
+    def collect():
+        nonlocal files, nbytes
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            in_flight.discard(future)
+            row, digest = future.result()
+            if digest is not None:
+                files += 1
+                nbytes += row[2]
+                on_result(row, digest)
+
+    complete = True
+    for row in rows:
+        path = f"{mount}{get_dir_path(c, row[0], dir_paths)}/{row[1]}"
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_size != row[2] or st.st_mtime_ns != row[3]:
+            continue  # rescan first
+        if not budget.take(row[2] or 0):
+            complete = False
+            break
+        in_flight.add(pool.submit(run, row, path))
+        if len(in_flight) >= 2 * workers:
+            collect()
+    while in_flight:
+        collect()
+    return files, nbytes, complete
+
+
+def checksum_disk(disk_id, label, mount, budget, workers=HASH_WORKERS, log=print):
+    """Hash new/changed files of one mounted disk, then re-verify its oldest digests with what is left.
+
+    Results are written one HASH_SLICE per transaction, so a scan can save in between.
+    Returns {hashed, hashed_bytes, verified, verified_bytes, mismatches, complete}.
+    """
+    conn = get_conn()
+    report = {"hashed": 0, "hashed_bytes": 0, "verified": 0, "verified_bytes": 0, "mismatches": 0}
+    run_start = datetime.now().isoformat()
+
+    def store(row, digest):
+        conn.execute(HASH_DIGEST_SQL, (disk_id, row[0], row[1], row[2], row[3], digest, datetime.now().isoformat()))
+
+    def verify(row, digest):
+        now = datetime.now().isoformat()
+        if digest != row[4]:
+            conn.execute(MISMATCH_INSERT_SQL, (disk_id, row[0], row[1], row[2], row[3], row[4], digest, now))
+            report["mismatches"] += 1
+            log(f"[HADES] ❌ Checksum mismatch on {label}: "
+                f"{get_dir_path(conn, row[0], {})}/{row[1]} (size and mtime unchanged)")
+        conn.execute(HASH_VERIFIED_SQL, (now, disk_id, row[0], row[1]))
+
+    with transaction(conn):
+        pruned = conn.execute(HASH_PRUNE_DISK_SQL, (disk_id,)).rowcount
+    if pruned:
+        log(f"[HADES] {label}: dropped {pruned} hashes of files that are gone")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 1. New or changed files (no digest for the current size + mtime)
+        missing = conn.execute(HASH_MISSING_SQL, (disk_id,)).fetchall()
+        complete = True
+        for i in range(0, len(missing), HASH_SLICE):
+            with transaction(conn):
+                files, nbytes, complete = _hash_budgeted(pool, missing[i:i + HASH_SLICE], mount, budget, workers, store)
+            report["hashed"] += files
+            report["hashed_bytes"] += nbytes
+            if not complete:
+                log(f"[HADES] {label}: budget used up, {len(missing) - i - files} files left to hash next run")
+                break
+
+        # 2. Rotating verification with what is left: least recently verified first, once per run
+        after = ("", 0, "")
+        while complete:
+            rows = conn.execute(HASH_VERIFY_SQL, (disk_id, run_start, *after, HASH_SLICE)).fetchall()
+            if not rows:
+                break
+            after = (rows[-1][5], rows[-1][0], rows[-1][1])
+            with transaction(conn):
+                files, nbytes, complete = _hash_budgeted(pool, rows, mount, budget, workers, verify)
+            report["verified"] += files
+            report["verified_bytes"] += nbytes
+
+    report["complete"] = complete
+    log(f"[HADES] {label}: hashed {report['hashed']} ({format_bytes(report['hashed_bytes'])}), "
+        f"verified {report['verified']} ({format_bytes(report['verified_bytes'])}), "
+        f"{report['mismatches']} mismatches")
+    return report
+
+
+def run_checksums(disks=None, seconds=CHECKSUM_TIME_BUDGET, nbytes=CHECKSUM_BYTE_BUDGET,
+                  workers=HASH_WORKERS, log=print):
+    """checksum_disk for each {label, mount_point} (default: every mounted disk), sharing one budget."""
+    budget = Budget(seconds, nbytes)
+    reports = {}
+    for disk in disks if disks is not None else detect_disks():
+        row = get_conn().execute("SELECT id FROM disks WHERE label = ?", (disk["label"],)).fetchone()
+        if row is None:
+            log(f"[HADES] {disk['label']}: not scanned yet, no checksums")
+        elif budget.exhausted:
+            log(f"[HADES] Checksum budget used up, skipping {disk['label']}")
+        else:
+            reports[disk["label"]] = checksum_disk(row[0], disk["label"], str(disk["mount_point"]),
+                                                   budget, workers, log)
+    return reports
+
+
+def get_mismatches():
+    """[(label, folder, name, size, mtime_ns, expected, actual, detected_at, still_same)], newest first."""
+    return get_conn().execute(MISMATCHES_SQL).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES checksums / bit-rot check")
+    parser.add_argument("label", nargs="?", help="only this disk")
+    parser.add_argument("--minutes", type=float, default=CHECKSUM_TIME_BUDGET / 60, help="time budget")
+    parser.add_argument("--gb", type=float, default=CHECKSUM_BYTE_BUDGET / 1024**3, help="bytes read budget")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="hashing threads")
+    args = parser.parse_args()
+    with session():
+        init_db()
+        disks = detect_disks()
+        if args.label:
+            disks = [d for d in disks if d["label"].upper() == args.label.upper()]
+        if not disks:
+            print("[HADES] No mounted disk to check.")
+            sys.exit(1)
+        reports = run_checksums(disks, args.minutes * 60, int(args.gb * 1024**3), max(1, args.workers))
+    sys.exit(1 if any(r["mismatches"] for r in reports.values()) else 0)
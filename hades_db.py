@@ -4,143 +4,1354 @@ Core SQLite database module
 Personal file indexer - persistent + version history
 """
 
+import re
+import sys
+import json
+import argparse
 import sqlite3
 import os
+import gzip
 import shutil
+import tempfile
+import subprocess
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_metrics import phase
+
 # --- Config ---
 HADES_DIR = Path.home() / "Desktop" / "HADES"
 DB_PATH = HADES_DIR / "hades.db"
 BACKUP_DIR = HADES_DIR / "db_backup"
 DB_PATH = HADES_DIR / "hades.db"
-MAX_VERSIONS_PER_DISK = 3
+MAX_VERSIONS_PER_DISK = 10
 MAX_BACKUPS = 4
+BACKUP_PAGES = 1024               # pages copied per backup step
+BACKUP_COMPRESS = False           # gzip generations older than bak1
+BACKUP_GZIP_LEVEL = 1
+METRICS_LOG = HADES_DIR / "hades_metrics.jsonl"   # one JSON line per disk scan / export
+
+# PRAGMAs applied to every connection; override per session via session(**pragmas)
+DB_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # only takes effect on a new DB or after maintenance(vacuum=True)
+    "journal_mode": "WAL",        # export can read while a scan writes
+    "synchronous": "NORMAL",      # durable at checkpoints, fsync-light per commit in WAL
+    "cache_size": -64_000,        # negative = KiB -> ~64 MB page cache
+    "mmap_size": 256 * 1024**2,
+    "temp_store": "FILE",         # the scan_stage temp table can hold a whole disk
+    "foreign_keys": "ON",
+}
+
+ROOT_DIR_ID = 1
+MTIME_TOLERANCE_NS = 2000  # see _same_file
+TOP_FILES_PER_VERSION = 100
+
+# Size histogram: upper bounds of the buckets, the last bucket is open-ended
+SIZE_BUCKETS = [1024, 1024**2, 10 * 1024**2, 100 * 1024**2, 1024**3, 10 * 1024**3]
+SIZE_BUCKET_LABELS = ["< 1 KB", "1 KB – 1 MB", "1 – 10 MB", "10 – 100 MB", "100 MB – 1 GB", "1 – 10 GB", "≥ 10 GB"]
+
+# Extension -> category; synced into the extensions table by init_db, edit here
+EXT_CATEGORIES = {
+    **dict.fromkeys([".jpg", ".jpeg", ".png", ".gif", ".heic", ".raw", ".cr2"], "📷 Kép"),
+    **dict.fromkeys([".mp4", ".mov", ".avi", ".mkv"], "🎬 Videó"),
+    **dict.fromkeys([".mp3", ".flac", ".wav", ".aac"], "🎵 Zene"),
+    **dict.fromkeys([".pdf", ".doc", ".docx", ".txt", ".pages"], "📄 Dokument"),
+    **dict.fromkeys([".zip", ".rar", ".tar", ".gz", ".7z"], "📦 Archív"),
+    **dict.fromkeys([".py", ".sh", ".js", ".ts", ".html", ".css"], "💻 Kód"),
+}
+CAT_OTHER = "📁 Egyéb"
+
+# Full path of every dirs row: root is '', children are '<parent>/<name>'
+DIR_PATHS_CTE = """
+    WITH RECURSIVE dir_paths(id, path) AS (
+        SELECT id, '' FROM dirs WHERE parent_id IS NULL
+        UNION ALL
+        SELECT d.id, p.path || '/' || d.name FROM dirs d JOIN dir_paths p ON d.parent_id = p.id
+    )
+"""
+
+# Entries of version ? as (folder, name, size, mtime_ns):
+# rows whose [valid_from_version, valid_to_version) covers it
+VERSION_ENTRIES_SQL = DIR_PATHS_CTE + """
+    SELECT p.path, f.name, f.size_bytes, f.mtime_ns
+    FROM scan_versions v
+    JOIN files f ON f.disk_id = v.disk_id
+    JOIN dir_paths p ON p.id = f.dir_id
+    WHERE v.id = ?
+      AND f.valid_from_version <= v.id
+      AND (f.valid_to_version IS NULL OR f.valid_to_version > v.id)
+"""
+
+# Same, with the full path rebuilt: (path, size, mtime_ns)
+VERSION_FILES_SQL = DIR_PATHS_CTE + """
+    SELECT p.path || '/' || f.name, f.size_bytes, f.mtime_ns
+    FROM scan_versions v
+    JOIN files f ON f.disk_id = v.disk_id
+    JOIN dir_paths p ON p.id = f.dir_id
+    WHERE v.id = ?
+      AND f.valid_from_version <= v.id
+      AND (f.valid_to_version IS NULL OR f.valid_to_version > v.id)
+"""
+
+# Entries of version ? with their category: (folder, name, size, mtime_ns, category),
+# the first ? is the category of extensions missing from the table
+VERSION_SHEET_SQL = DIR_PATHS_CTE + """
+    SELECT p.path, f.name, f.size_bytes, f.mtime_ns, COALESCE(x.category, ?)
+    FROM scan_versions v
+    JOIN files f ON f.disk_id = v.disk_id
+    JOIN dir_paths p ON p.id = f.dir_id
+    LEFT JOIN extensions x ON x.ext = f.ext
+    WHERE v.id = ?
+      AND f.valid_from_version <= v.id
+      AND (f.valid_to_version IS NULL OR f.valid_to_version > v.id)
+"""
+
+LAST_VERSION_SQL = """
+    SELECT id, scanned_at, file_count, total_bytes
+    FROM scan_versions
+    WHERE disk_id = ?
+    ORDER BY scanned_at DESC
+"""
+
+VERSION_DIRS_SQL = DIR_PATHS_CTE + """
+    SELECT p.path, s.mtime_ns, s.inode
+    FROM dir_state s JOIN dir_paths p ON p.id = s.dir_id
+    WHERE s.version_id = ?
+"""
+
+CLOSE_FILE_SQL = """
+    UPDATE files SET valid_to_version = ?
+    WHERE disk_id = ? AND dir_id = ? AND name = ? AND valid_to_version IS NULL
+"""
+
+# Rows that closed before the oldest kept version are invisible everywhere
+PRUNE_FILES_SQL = """
+    DELETE FROM files
+    WHERE disk_id = ? AND valid_to_version IS NOT NULL AND valid_to_version <= ?
+"""
+
+# Oldest surviving version per disk: rows closed at or before it are invisible to every version
+OLDEST_VERSIONS_SQL = "SELECT disk_id, MIN(id) FROM scan_versions GROUP BY disk_id"
+
+# --- Staged (SQL-side) diff: new scan in TEMP scan_stage vs the disk's open rows ---
+# Rows carry disk_id, so walkers of several disks can be staged interleaved
+STAGE_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS scan_stage (
+        disk_id     INTEGER NOT NULL,
+        dir_id      INTEGER NOT NULL,
+        name        TEXT NOT NULL,
+        size_bytes  INTEGER,
+        mtime_ns    INTEGER
+    )
+"""
+
+STAGE_INDEX = "CREATE INDEX IF NOT EXISTS temp.idx_scan_stage ON scan_stage(disk_id, dir_id, name)"
+
+# Open row matching a staged (disk_id, dir_id, name)
+_OPEN_MATCH = """
+    f.disk_id = s.disk_id AND f.dir_id = s.dir_id AND f.name = s.name AND f.valid_to_version IS NULL
+"""
+
+
+def _same_file(f, s):
+    """SQL: stored row f and scanned row s have the same size and mtime.
+
+    Rows migrated from ISO strings only kept microseconds (through a float),
+    so a whole-microsecond stored mtime matches within 2 µs.
+    """
+    return f"""({f}.size_bytes = {s}.size_bytes AND ({f}.mtime_ns IS {s}.mtime_ns OR COALESCE(
+        {f}.mtime_ns % 1000 = 0 AND abs({f}.mtime_ns - {s}.mtime_ns) < {MTIME_TOLERANCE_NS}, 0)))"""
+
+
+# Any staged row of disk ? that is new or differs from its open row?
+STAGE_CHANGED_SQL = f"""
+    SELECT EXISTS (
+        SELECT 1 FROM scan_stage s
+        LEFT JOIN files f ON {_OPEN_MATCH}
+        WHERE s.disk_id = ?
+          AND (f.id IS NULL OR NOT {_same_file("f", "s")})
+    )
+"""
+
+# Added / modified / removed file counts of the staged scan of disk ? (the save applies
+# the delta set-based, so no path is ever built for it)
+STAGE_ADDED_COUNT_SQL = f"""
+    SELECT COUNT(*) FROM scan_stage s
+    WHERE s.disk_id = ? AND NOT EXISTS (SELECT 1 FROM files f WHERE {_OPEN_MATCH})
+"""
+
+STAGE_MODIFIED_COUNT_SQL = f"""
+    SELECT COUNT(*) FROM scan_stage s
+    JOIN files f ON {_OPEN_MATCH}
+    WHERE s.disk_id = ? AND NOT {_same_file("f", "s")}
+"""
+
+STAGE_REMOVED_COUNT_SQL = """
+    SELECT COUNT(*) FROM files f
+    WHERE f.disk_id = ? AND f.valid_to_version IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM scan_stage s
+          WHERE s.disk_id = f.disk_id AND s.dir_id = f.dir_id AND s.name = f.name
+      )
+"""
+
+# Copy the open rows of an unchanged dir forward into the stage (incremental scans)
+STAGE_COPY_DIR_SQL = """
+    INSERT INTO scan_stage (disk_id, dir_id, name, size_bytes, mtime_ns)
+    SELECT disk_id, dir_id, name, size_bytes, mtime_ns FROM files
+    WHERE disk_id = ? AND dir_id = ? AND valid_to_version IS NULL
+"""
+
+# Close open rows that are gone or differ from the stage
+STAGE_CLOSE_SQL = f"""
+    UPDATE files SET valid_to_version = ?
+    WHERE disk_id = ? AND valid_to_version IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM scan_stage s
+          WHERE s.disk_id = files.disk_id AND s.dir_id = files.dir_id AND s.name = files.name
+            AND {_same_file("files", "s")}
+      )
+"""
+
+# ...then open a row for every staged file left without one
+STAGE_INSERT_SQL = f"""
+    INSERT INTO files (disk_id, dir_id, name, ext, size_bytes, mtime_ns, valid_from_version)
+    SELECT s.disk_id, s.dir_id, s.name, file_ext(s.name), s.size_bytes, s.mtime_ns, ?
+    FROM scan_stage s
+    WHERE s.disk_id = ? AND NOT EXISTS (SELECT 1 FROM files f WHERE {_OPEN_MATCH})
+"""
+
+STAGE_TOTALS_SQL = "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM scan_stage WHERE disk_id = ?"
+
+DIFF_HISTORY_SQL = """
+    SELECT logged_at, added, removed, modified
+    FROM diff_log WHERE disk_id = ?
+    ORDER BY logged_at DESC LIMIT 10
+"""
+
+# --- Scan metrics (hades_metrics): one row per disk scan, linked to the version it saved or confirmed ---
+METRICS_TABLES = """
+    CREATE TABLE IF NOT EXISTS scan_metrics (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        version_id  INTEGER REFERENCES scan_versions(id) ON DELETE SET NULL,
+        started_at  TEXT NOT NULL,
+        mode        TEXT NOT NULL,
+        seconds     REAL NOT NULL,
+        files       INTEGER,
+        bytes       INTEGER,
+        walk_s      REAL,
+        stat_s      REAL,
+        stage_s     REAL,
+        diff_s      REAL,
+        save_s      REAL,
+        backup_s    REAL,
+        insert_s    REAL,
+        prune_s     REAL,
+        detail      TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_scan_metrics_disk ON scan_metrics(disk_id, started_at);
+    CREATE INDEX IF NOT EXISTS idx_scan_metrics_version ON scan_metrics(version_id)
+"""
+
+# Columns of scan_metrics filled from Metrics.phases (<phase>_s)
+METRIC_PHASES = ["walk", "stat", "stage", "diff", "save", "backup", "insert", "prune"]
+
+SCAN_METRICS_INSERT_SQL = f"""
+    INSERT INTO scan_metrics (disk_id, version_id, started_at, mode, seconds, files, bytes,
+                              {", ".join(f"{p}_s" for p in METRIC_PHASES)}, detail)
+    VALUES ({", ".join("?" * (8 + len(METRIC_PHASES)))})
+"""
+
+# Last ? scans of disk ?, newest first: (started_at, mode, seconds, files, walk_s, diff_s, save_s)
+SCAN_TREND_SQL = """
+    SELECT started_at, mode, seconds, files, walk_s, diff_s, save_s
+    FROM scan_metrics WHERE disk_id = ?
+    ORDER BY started_at DESC LIMIT ?
+"""
+
+# Newest first / full (not incremental) scan of disk ?1 and the incremental scans since it:
+# (started_at, incremental_since)
+LAST_FULL_SCAN_SQL = """
+    SELECT m.started_at, (SELECT COUNT(*) FROM scan_metrics i
+                          WHERE i.disk_id = ?1 AND i.started_at > m.started_at AND i.mode = 'incremental')
+    FROM scan_metrics m WHERE m.disk_id = ?1 AND m.mode != 'incremental'
+    ORDER BY m.started_at DESC LIMIT 1
+"""
+
+# --- Per-version rollups, written at save time while the new version's rows are the open ones ---
+# Subtree totals of every dir holding files: direct counts, pushed up to each ancestor
+ROLLUP_DIRS_SQL = f"""
+    WITH RECURSIVE direct(dir_id, n, bytes) AS (
+        SELECT dir_id, COUNT(*), SUM(size_bytes) FROM files
+        WHERE disk_id = ? AND valid_to_version IS NULL
+        GROUP BY dir_id
+    ),
+    up(dir_id, n, bytes) AS (
+        SELECT dir_id, n, bytes FROM direct
+        UNION ALL
+        SELECT d.parent_id, up.n, up.bytes FROM up JOIN dirs d ON d.id = up.dir_id
+        WHERE d.parent_id IS NOT NULL
+    ),
+    rollup(dir_id, n, bytes) AS (
+        SELECT dir_id, SUM(n), SUM(bytes) FROM up GROUP BY dir_id
+    ),
+    level(id, depth) AS (
+        SELECT {ROOT_DIR_ID}, 0
+        UNION ALL
+        SELECT d.id, level.depth + 1 FROM level JOIN dirs d ON d.parent_id = level.id
+        WHERE d.id IN (SELECT dir_id FROM rollup)
+    )
+    INSERT INTO dir_rollup (version_id, dir_id, depth, file_count, total_bytes)
+    SELECT ?, r.dir_id, l.depth, r.n, r.bytes FROM rollup r JOIN level l ON l.id = r.dir_id
+"""
+
+# Rollups read every open row of one disk. Without this index a DB analyzed by
+# PRAGMA optimize plans them as a scan of all disks' rows, history included.
+# Covers the histogram and ext rollup (valid_to_version is listed because SQLite
+# does not count the partial index's WHERE as covered); top files reads it in size order.
+ROLLUP_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_files_open_disk
+        ON files(disk_id, size_bytes, ext, valid_to_version) WHERE valid_to_version IS NULL
+"""
+
+ROLLUP_TOP_FILES_SQL = """
+    INSERT INTO version_top_files (version_id, rank, dir_id, name, size_bytes, mtime_ns)
+    SELECT ?, ROW_NUMBER() OVER (ORDER BY size_bytes DESC, id), dir_id, name, size_bytes, mtime_ns
+    FROM files
+    WHERE disk_id = ? AND valid_to_version IS NULL
+    ORDER BY size_bytes DESC, id LIMIT ?
+"""
+
+_SIZE_BUCKET_SQL = ("CASE " + " ".join(f"WHEN size_bytes < {b} THEN {i}" for i, b in enumerate(SIZE_BUCKETS))
+                    + f" ELSE {len(SIZE_BUCKETS)} END")
+
+ROLLUP_HISTOGRAM_SQL = f"""
+    INSERT INTO size_histogram (version_id, bucket, file_count, total_bytes)
+    SELECT ?, {_SIZE_BUCKET_SQL} AS bucket, COUNT(*), SUM(size_bytes)
+    FROM files
+    WHERE disk_id = ? AND valid_to_version IS NULL
+    GROUP BY bucket
+"""
+
+
+def _dir_paths_up(src: str) -> str:
+    """CTE up(dir_id, parent_id, path) for the dir_ids of CTE src, built leaf to root.
+
+    Only the ancestors of those dirs are visited (DIR_PATHS_CTE walks the
+    whole tree); finished rows are the ones with IFNULL(parent_id, ROOT_DIR_ID) = ROOT_DIR_ID.
+    """
+    return f"""
+    up(dir_id, parent_id, path) AS (
+        SELECT d.id, d.parent_id, CASE WHEN d.parent_id IS NULL THEN '' ELSE '/' || d.name END
+        FROM dirs d WHERE d.id IN (SELECT dir_id FROM {src})
+        UNION ALL
+        SELECT u.dir_id, d.parent_id, '/' || d.name || u.path FROM up u JOIN dirs d ON d.id = u.parent_id
+        WHERE d.parent_id IS NOT NULL
+    )"""
+
+
+# Biggest dirs of version ? with 1 <= depth <= ?, at most ?: (path, file_count, total_bytes, depth)
+TOP_DIRS_SQL = f"""
+    WITH RECURSIVE top AS (
+        SELECT dir_id, file_count, total_bytes, depth FROM dir_rollup
+        WHERE version_id = ? AND depth BETWEEN 1 AND ?
+        ORDER BY total_bytes DESC LIMIT ?
+    ),
+    {_dir_paths_up("top")}
+    SELECT u.path, t.file_count, t.total_bytes, t.depth
+    FROM top t JOIN up u ON u.dir_id = t.dir_id
+    WHERE IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID}
+    ORDER BY t.total_bytes DESC
+"""
+
+# Largest files of version ?, at most ?: (folder, name, size, mtime_ns)
+TOP_FILES_SQL = f"""
+    WITH RECURSIVE top AS (
+        SELECT rank, dir_id, name, size_bytes, mtime_ns FROM version_top_files
+        WHERE version_id = ? AND rank <= ?
+    ),
+    {_dir_paths_up("top")}
+    SELECT u.path, t.name, t.size_bytes, t.mtime_ns
+    FROM top t JOIN up u ON u.dir_id = t.dir_id
+    WHERE IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID}
+    ORDER BY t.rank
+"""
+
+ROLLUP_EXT_SQL = """
+    INSERT INTO ext_rollup (version_id, ext, file_count, total_bytes)
+    SELECT ?, ext, COUNT(*), SUM(size_bytes)
+    FROM files
+    WHERE disk_id = ? AND valid_to_version IS NULL
+    GROUP BY ext
+"""
+
+# (category, file_count, total_bytes) of version ?, biggest first; the first ? is CAT_OTHER
+CATEGORY_STATS_SQL = """
+    SELECT COALESCE(x.category, ?) AS category, SUM(r.file_count), SUM(r.total_bytes)
+    FROM ext_rollup r LEFT JOIN extensions x ON x.ext = r.ext
+    WHERE r.version_id = ?
+    GROUP BY category ORDER BY 3 DESC
+"""
+
+# (ext, category, file_count, total_bytes) of version ?, biggest first; the first ? is CAT_OTHER
+EXT_STATS_SQL = """
+    SELECT r.ext, COALESCE(x.category, ?), r.file_count, r.total_bytes
+    FROM ext_rollup r LEFT JOIN extensions x ON x.ext = r.ext
+    WHERE r.version_id = ? ORDER BY r.total_bytes DESC LIMIT ?
+"""
+
+SIZE_HISTOGRAM_SQL = """
+    SELECT bucket, file_count, total_bytes FROM size_histogram
+    WHERE version_id = ? ORDER BY bucket
+"""
+
+# --- Content hashes (hades_dupes): valid while the file keeps the size and mtime they were taken at ---
+# Open files of every disk whose size occurs more than once (>= ? bytes), with any usable cached hash:
+# (disk_id, label, dir_id, folder, name, size, mtime_ns, partial, digest)
+DUPE_CANDIDATES_SQL = f"""
+    WITH RECURSIVE sizes AS (
+        SELECT size_bytes FROM files
+        WHERE valid_to_version IS NULL AND size_bytes >= ?
+        GROUP BY size_bytes HAVING COUNT(*) > 1
+    ),
+    cand AS (
+        SELECT f.disk_id, f.dir_id, f.name, f.size_bytes, f.mtime_ns
+        FROM sizes s JOIN files f ON f.size_bytes = s.size_bytes AND f.valid_to_version IS NULL
+    ),
+    {_dir_paths_up("cand")}
+    SELECT c.disk_id, k.label, c.dir_id, u.path, c.name, c.size_bytes, c.mtime_ns, h.partial, h.digest
+    FROM cand c
+    JOIN up u ON u.dir_id = c.dir_id AND IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID}
+    JOIN disks k ON k.id = c.disk_id
+    LEFT JOIN file_hashes h ON h.disk_id = c.disk_id AND h.dir_id = c.dir_id AND h.name = c.name
+        AND h.size_bytes = c.size_bytes AND h.mtime_ns IS c.mtime_ns
+"""
+
+# Open files sharing a full digest with another hashed file:
+# (digest, label, folder, name, size, mtime_ns), biggest groups first.
+# The shared digests drive it and each is one idx_files_open lookup; left to the
+# planner, an analyzed DB walks every disk's open files and probes file_hashes
+DUPE_GROUPS_SQL = f"""
+    WITH RECURSIVE dup AS (
+        SELECT h.digest, f.disk_id, f.dir_id, f.name, f.size_bytes, f.mtime_ns
+        FROM file_hashes h
+        CROSS JOIN files f INDEXED BY idx_files_open
+            ON f.disk_id = h.disk_id AND f.dir_id = h.dir_id AND f.name = h.name
+            AND f.valid_to_version IS NULL AND f.size_bytes = h.size_bytes AND f.mtime_ns IS h.mtime_ns
+        WHERE h.digest IN (
+            SELECT digest FROM file_hashes WHERE digest IS NOT NULL GROUP BY digest HAVING COUNT(*) > 1
+        )
+    ),
+    {_dir_paths_up("dup")}
+    SELECT x.digest, k.label, u.path, x.name, x.size_bytes, x.mtime_ns
+    FROM dup x
+    JOIN up u ON u.dir_id = x.dir_id AND IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID}
+    JOIN disks k ON k.id = x.disk_id
+    ORDER BY x.size_bytes DESC, x.digest, k.label, u.path, x.name
+"""
+
+# The other hash of a row survives an upsert only if the file still has the same size and mtime
+def _keep_if_same(col):
+    return f"""CASE WHEN file_hashes.size_bytes = excluded.size_bytes AND file_hashes.mtime_ns IS excluded.mtime_ns
+        THEN file_hashes.{col} END"""
+
+
+HASH_PARTIAL_SQL = f"""
+    INSERT INTO file_hashes (disk_id, dir_id, name, size_bytes, mtime_ns, partial, digest, hashed_at)
+    VALUES (?, ?, ?, ?, ?, ?, NULL, ?)
+    ON CONFLICT (disk_id, dir_id, name) DO UPDATE SET
+        digest = {_keep_if_same("digest")}, verified_at = {_keep_if_same("verified_at")},
+        size_bytes = excluded.size_bytes, mtime_ns = excluded.mtime_ns,
+        partial = excluded.partial, hashed_at = excluded.hashed_at
+"""
+
+HASH_FULL_SQL = """
+    UPDATE file_hashes SET digest = ?1, hashed_at = ?2, verified_at = ?2
+    WHERE disk_id = ?3 AND dir_id = ?4 AND name = ?5
+"""
+
+# Full digest of a file (hades_checksum), counts as verified now
+HASH_DIGEST_SQL = f"""
+    INSERT INTO file_hashes (disk_id, dir_id, name, size_bytes, mtime_ns, partial, digest, hashed_at, verified_at)
+    VALUES (?1, ?2, ?3, ?4, ?5, NULL, ?6, ?7, ?7)
+    ON CONFLICT (disk_id, dir_id, name) DO UPDATE SET
+        partial = {_keep_if_same("partial")},
+        size_bytes = excluded.size_bytes, mtime_ns = excluded.mtime_ns,
+        digest = excluded.digest, hashed_at = excluded.hashed_at, verified_at = excluded.verified_at
+"""
+
+# Open files of disk ? without a digest for their current size and mtime: (dir_id, name, size, mtime_ns)
+HASH_MISSING_SQL = """
+    SELECT f.dir_id, f.name, f.size_bytes, f.mtime_ns
+    FROM files f
+    LEFT JOIN file_hashes h ON h.disk_id = f.disk_id AND h.dir_id = f.dir_id AND h.name = f.name
+        AND h.size_bytes = f.size_bytes AND h.mtime_ns IS f.mtime_ns AND h.digest IS NOT NULL
+    WHERE f.disk_id = ? AND f.valid_to_version IS NULL AND h.disk_id IS NULL
+"""
+
+# Least recently verified digests of disk ?1 not yet verified in this run (verified_at < ?2),
+# paged by the (verified_at, dir_id, name) of the last row seen: (dir_id, name, size, mtime_ns, digest, verified_at)
+HASH_VERIFY_SQL = """
+    SELECT dir_id, name, size_bytes, mtime_ns, digest, verified_at FROM file_hashes
+    WHERE disk_id = ?1 AND digest IS NOT NULL AND verified_at < ?2
+      AND (verified_at, dir_id, name) > (?3, ?4, ?5)
+    ORDER BY verified_at, dir_id, name LIMIT ?6
+"""
+
+HASH_VERIFIED_SQL = "UPDATE file_hashes SET verified_at = ? WHERE disk_id = ? AND dir_id = ? AND name = ?"
+
+# Recorded once per distinct bad content of an unchanged file, not on every verification
+MISMATCH_INSERT_SQL = """
+    INSERT INTO hash_mismatches (disk_id, dir_id, name, size_bytes, mtime_ns, expected, actual, detected_at)
+    SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8
+    WHERE NOT EXISTS (
+        SELECT 1 FROM hash_mismatches
+        WHERE disk_id = ?1 AND dir_id = ?2 AND name = ?3 AND size_bytes = ?4 AND mtime_ns IS ?5 AND actual = ?7
+    )
+"""
+
+# Every recorded mismatch, newest first, and whether the file is still that same unchanged file:
+# (label, folder, name, size, mtime_ns, expected, actual, detected_at, still_same)
+MISMATCHES_SQL = f"""
+    WITH RECURSIVE bad AS (SELECT * FROM hash_mismatches),
+    {_dir_paths_up("bad")}
+    SELECT k.label, u.path, b.name, b.size_bytes, b.mtime_ns, b.expected, b.actual, b.detected_at,
+           EXISTS (SELECT 1 FROM files f
+                   WHERE f.disk_id = b.disk_id AND f.dir_id = b.dir_id AND f.name = b.name
+                     AND f.valid_to_version IS NULL AND f.size_bytes = b.size_bytes AND f.mtime_ns IS b.mtime_ns)
+    FROM bad b
+    JOIN up u ON u.dir_id = b.dir_id AND IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID}
+    JOIN disks k ON k.id = b.disk_id
+    ORDER BY b.detected_at DESC, b.id
+"""
+
+CHECKSUM_TABLES = """
+    ALTER TABLE file_hashes ADD COLUMN verified_at TEXT;
+    UPDATE file_hashes SET verified_at = hashed_at WHERE digest IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_file_hashes_verify
+        ON file_hashes(disk_id, verified_at, dir_id, name) WHERE digest IS NOT NULL;
+
+    CREATE TABLE IF NOT EXISTS hash_mismatches (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        dir_id      INTEGER NOT NULL REFERENCES dirs(id),
+        name        TEXT NOT NULL,
+        size_bytes  INTEGER,
+        mtime_ns    INTEGER,
+        expected    BLOB NOT NULL,
+        actual      BLOB NOT NULL,
+        detected_at TEXT NOT NULL
+    )
+"""
+
+# Hashes of paths that have no open file any more
+HASH_PRUNE_SQL = """
+    DELETE FROM file_hashes
+    WHERE NOT EXISTS (
+        SELECT 1 FROM files f
+        WHERE f.disk_id = file_hashes.disk_id AND f.dir_id = file_hashes.dir_id
+          AND f.name = file_hashes.name AND f.valid_to_version IS NULL
+    )
+"""
+
+# ... of disk ?1 only; run before its checksum pass, or the digests of deleted files (the oldest
+# verified_at) head every verify slice and never get marked verified
+HASH_PRUNE_DISK_SQL = """
+    DELETE FROM file_hashes
+    WHERE disk_id = ?1 AND NOT EXISTS (
+        SELECT 1 FROM files f
+        WHERE f.disk_id = file_hashes.disk_id AND f.dir_id = file_hashes.dir_id
+          AND f.name = file_hashes.name AND f.valid_to_version IS NULL
+    )
+"""
+
+HASH_TABLES = """
+    CREATE TABLE IF NOT EXISTS file_hashes (
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        dir_id      INTEGER NOT NULL REFERENCES dirs(id),
+        name        TEXT NOT NULL,
+        size_bytes  INTEGER NOT NULL,
+        mtime_ns    INTEGER,
+        partial     BLOB,
+        digest      BLOB,
+        hashed_at   TEXT NOT NULL,
+        PRIMARY KEY (disk_id, dir_id, name)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_file_hashes_digest
+        ON file_hashes(digest) WHERE digest IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_files_open_size
+        ON files(size_bytes) WHERE valid_to_version IS NULL
+"""
+
+# --- Path search (hades_find): FTS5 trigram index of the open files, rowid = files.id ---
+SEARCH_TABLES = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS file_search USING fts5(name, folder, tokenize = 'trigram')
+"""
+
+# Open rows of disk ?1 opened at or after version ?2 (0 = all of them) into the index.
+# The planner has no stats to choose by: the new rows' dirs come from a range on
+# idx_files_disk_valid, paths are built once per dir, then rows are read per dir
+SEARCH_ADD_SQL = f"""
+    WITH RECURSIVE new AS (
+        SELECT DISTINCT dir_id FROM files INDEXED BY idx_files_disk_valid
+        WHERE disk_id = ?1 AND valid_to_version IS NULL AND valid_from_version >= ?2
+    ),
+    {_dir_paths_up("new")}
+    INSERT INTO file_search (rowid, name, folder)
+    SELECT f.id, f.name, u.path
+    FROM up u
+    CROSS JOIN files f INDEXED BY idx_files_open ON f.disk_id = ?1 AND f.dir_id = u.dir_id AND f.valid_to_version IS NULL
+    WHERE IFNULL(u.parent_id, {ROOT_DIR_ID}) = {ROOT_DIR_ID} AND f.valid_from_version >= ?2
+"""
+
+# Rows of disk ? closed by version ? out of the index
+SEARCH_DROP_SQL = """
+    DELETE FROM file_search
+    WHERE rowid IN (SELECT id FROM files WHERE disk_id = ? AND valid_to_version = ?)
+"""
+
+# Matches as (label, folder, name, size, mtime_ns); {where} is a condition on s (see hades_find),
+# ?1 = disk label or NULL for all, ?2 = limit. CROSS JOIN keeps the trigram index the outer
+# loop: with stats the planner would rather scan files and probe file_search per row
+FIND_FILES_SQL = """
+    SELECT k.label, s.folder, s.name, f.size_bytes, f.mtime_ns
+    FROM file_search s
+    CROSS JOIN files f ON f.id = s.rowid
+    JOIN disks k ON k.id = f.disk_id
+    WHERE {where} AND f.valid_to_version IS NULL AND (?1 IS NULL OR k.label = ?1)
+    ORDER BY k.label, s.folder, s.name
+    LIMIT ?2
+"""
+
+ROLLUP_TABLES = """
+    CREATE TABLE IF NOT EXISTS dir_rollup (
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        dir_id      INTEGER NOT NULL REFERENCES dirs(id),
+        depth       INTEGER NOT NULL,
+        file_count  INTEGER NOT NULL,
+        total_bytes INTEGER NOT NULL,
+        PRIMARY KEY (version_id, dir_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_dir_rollup_size
+        ON dir_rollup(version_id, total_bytes, depth);
+
+    CREATE TABLE IF NOT EXISTS version_top_files (
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        rank        INTEGER NOT NULL,
+        dir_id      INTEGER NOT NULL REFERENCES dirs(id),
+        name        TEXT NOT NULL,
+        size_bytes  INTEGER,
+        mtime_ns    INTEGER,
+        PRIMARY KEY (version_id, rank)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS size_histogram (
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        bucket      INTEGER NOT NULL,
+        file_count  INTEGER NOT NULL,
+        total_bytes INTEGER NOT NULL,
+        PRIMARY KEY (version_id, bucket)
+    ) WITHOUT ROWID
+"""
+
+EXT_TABLES = """
+    CREATE TABLE IF NOT EXISTS extensions (
+        ext         TEXT PRIMARY KEY,
+        category    TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS ext_rollup (
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        ext         TEXT NOT NULL,
+        file_count  INTEGER NOT NULL,
+        total_bytes INTEGER NOT NULL,
+        PRIMARY KEY (version_id, ext)
+    ) WITHOUT ROWID
+"""
+
+# One row per (path, size, mtime) state, valid from its version until valid_to_version (NULL = present)
+FILES_TABLE = """
+    CREATE TABLE IF NOT EXISTS files (
+        id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id            INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        dir_id             INTEGER NOT NULL REFERENCES dirs(id),
+        name               TEXT NOT NULL,
+        size_bytes         INTEGER DEFAULT 0,
+        modified_at        TEXT,
+        valid_from_version INTEGER NOT NULL,
+        valid_to_version   INTEGER
+    )
+"""
+
+DIR_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS dir_state (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        dir_id      INTEGER NOT NULL REFERENCES dirs(id),
+        mtime_ns    INTEGER,
+        inode       INTEGER
+    )
+"""
+
+
+BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS disks (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        label       TEXT UNIQUE NOT NULL,
+        serial      TEXT,
+        platform    TEXT,
+        last_seen   TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS scan_versions (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        scanned_at  TEXT NOT NULL,
+        file_count  INTEGER DEFAULT 0,
+        total_bytes INTEGER DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS dirs (
+        id          INTEGER PRIMARY KEY,
+        parent_id   INTEGER REFERENCES dirs(id),
+        name        TEXT NOT NULL,
+        UNIQUE (parent_id, name)
+    );
+    INSERT OR IGNORE INTO dirs (id, parent_id, name) VALUES (1, NULL, '');
+
+    CREATE TABLE IF NOT EXISTS diff_log (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        from_ver    INTEGER,
+        to_ver      INTEGER NOT NULL,
+        added       INTEGER DEFAULT 0,
+        removed     INTEGER DEFAULT 0,
+        modified    INTEGER DEFAULT 0,
+        logged_at   TEXT NOT NULL
+    )
+"""
+
+
+def file_ext(name: str) -> str:
+    """'IMG_01.JPG' -> '.jpg'; '' for no extension (dotfiles like '.bashrc' included)."""
+    stem, dot, ext = name.rpartition(".")
+    return "." + ext.lower() if dot and stem and ext else ""
+
+
+# --- Connection / session ---
+_conn = None
+_backed_up = False  # backup_once() already ran on this connection
+
+
+def connect(**pragmas) -> sqlite3.Connection:
+    """Open a tuned autocommit connection to DB_PATH (transactions via transaction())."""
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    for name, value in {**DB_PRAGMAS, **pragmas}.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    conn.create_function("file_ext", 1, file_ext, deterministic=True)
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    """Return the shared connection, opening it on first use."""
+    global _conn
+    if _conn is None:
+        _conn = connect()
+    return _conn
+
+
+def close_conn():
+    global _conn, _backed_up
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+    _backed_up = False
+
+
+@contextmanager
+def session(**pragmas):
+    """One connection for the life of a scan or export; nested sessions reuse the outer one."""
+    global _conn
+    if _conn is not None:
+        yield _conn
+        return
+    _conn = connect(**pragmas)
+    try:
+        yield _conn
+    finally:
+        close_conn()
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection = None):
+    """BEGIN ... COMMIT, ROLLBACK on error. Inside an open transaction it just joins it."""
+    conn = conn or get_conn()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def execute_script(c, sql: str):
+    """Run ;-separated statements one by one (executescript() would COMMIT mid-migration)."""
+    for stmt in sql.split(";"):
+        if stmt.strip():
+            c.execute(stmt)
+
+
+def _migrate_base_schema(conn):
+    """Base tables; converts pre-versioning DBs (full copy per version, path-keyed rows)."""
+    c = conn.cursor()
+    execute_script(c, BASE_SCHEMA)
+
+    cols = [row[1] for row in c.execute("PRAGMA table_info(files)")]
+    if "version_id" in cols or "path" in cols:
+        c.execute("ALTER TABLE files RENAME TO files_old")
+        c.execute(FILES_TABLE)
+        if "version_id" in cols:
+            migrate_files_to_intervals(conn)
+        else:
+            migrate_paths_to_dirs(conn)
+    cols = [row[1] for row in c.execute("PRAGMA table_info(dir_state)")]
+    if "path" in cols:
+        c.execute("ALTER TABLE dir_state RENAME TO dir_state_old")
+        c.execute(DIR_STATE_TABLE)
+        cache = {"": ROOT_DIR_ID}
+        rows = conn.execute("SELECT version_id, path, mtime_ns, inode FROM dir_state_old").fetchall()
+        c.executemany("INSERT INTO dir_state (version_id, dir_id, mtime_ns, inode) VALUES (?,?,?,?)",
+                      [(v, get_dir_id(c, p, cache), m, i) for v, p, m, i in rows])
+        c.execute("DROP TABLE dir_state_old")
+
+    execute_script(c, FILES_TABLE + ";" + DIR_STATE_TABLE + """;
+        CREATE INDEX IF NOT EXISTS idx_files_open
+            ON files(disk_id, dir_id, name) WHERE valid_to_version IS NULL
+    """)
+
+
+def _migrate_hot_indexes(conn):
+    """Covering indexes for get_last_version/prune, version reads, dir states and diff history."""
+    execute_script(conn.cursor(), """
+        CREATE INDEX IF NOT EXISTS idx_versions_disk
+            ON scan_versions(disk_id, scanned_at, file_count, total_bytes);
+        CREATE INDEX IF NOT EXISTS idx_files_disk_valid
+            ON files(disk_id, valid_to_version, valid_from_version);
+        CREATE INDEX IF NOT EXISTS idx_dir_state_version
+            ON dir_state(version_id, dir_id, mtime_ns, inode);
+        CREATE INDEX IF NOT EXISTS idx_diff_log_disk
+            ON diff_log(disk_id, logged_at, added, removed, modified)
+    """)
+
+
+def _iso_to_ns(text):
+    """ISO string written by datetime.fromtimestamp(st_mtime).isoformat() -> integer ns (local time)."""
+    if text is None:
+        return None
+    try:
+        dt = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    return int(dt.replace(microsecond=0).timestamp()) * 10**9 + dt.microsecond * 1000
+
+
+def _migrate_mtime_ns(conn):
+    """files.modified_at (ISO text) -> files.mtime_ns (integer ns, TZ-independent)."""
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+    if "mtime_ns" in cols:
+        return
+    conn.create_function("iso_to_ns", 1, _iso_to_ns, deterministic=True)
+    conn.execute("ALTER TABLE files ADD COLUMN mtime_ns INTEGER")
+    conn.execute("UPDATE files SET mtime_ns = iso_to_ns(modified_at)")
+    if sqlite3.sqlite_version_info >= (3, 35):
+        conn.execute("ALTER TABLE files DROP COLUMN modified_at")
+    else:
+        # No DROP COLUMN before SQLite 3.35: leave it, NULLs cost one header byte
+        conn.execute("UPDATE files SET modified_at = NULL")
+
+
+def save_rollups(c, disk_id: int, version_id: int):
+    """dir_rollup, version_top_files, size_histogram and ext_rollup of version_id.
+
+    The version's rows must be the disk's open ones (true right after a save).
+    """
+    c.execute(ROLLUP_DIRS_SQL, (disk_id, version_id))
+    c.execute(ROLLUP_TOP_FILES_SQL, (version_id, disk_id, TOP_FILES_PER_VERSION))
+    c.execute(ROLLUP_HISTOGRAM_SQL, (version_id, disk_id))
+    c.execute(ROLLUP_EXT_SQL, (version_id, disk_id))
+
+
+def _latest_versions(c) -> list:
+    """[(disk_id, latest version id)] of every disk that has a version."""
+    latest = [(disk_id, c.execute(LAST_VERSION_SQL + " LIMIT 1", (disk_id,)).fetchone())
+              for (disk_id,) in c.execute("SELECT id FROM disks").fetchall()]
+    return [(disk_id, row[0]) for disk_id, row in latest if row]
+
+
+def _migrate_rollups(conn):
+    """Rollup tables; backfilled for each disk's latest version (older ones age out by pruning)."""
+    c = conn.cursor()
+    execute_script(c, ROLLUP_TABLES)
+    for disk_id, version_id in _latest_versions(c):
+        c.execute(ROLLUP_DIRS_SQL, (disk_id, version_id))
+        c.execute(ROLLUP_TOP_FILES_SQL, (version_id, disk_id, TOP_FILES_PER_VERSION))
+        c.execute(ROLLUP_HISTOGRAM_SQL, (version_id, disk_id))
+
+
+def _migrate_extensions(conn):
+    """files.ext (lowercase, with the dot), the extensions lookup and ext_rollup."""
+    c = conn.cursor()
+    c.execute("ALTER TABLE files ADD COLUMN ext TEXT NOT NULL DEFAULT ''")
+    c.execute("UPDATE files SET ext = file_ext(name)")
+    execute_script(c, EXT_TABLES)
+    for disk_id, version_id in _latest_versions(c):
+        c.execute(ROLLUP_EXT_SQL, (version_id, disk_id))
+
+
+def _migrate_hashes(conn):
+    """file_hashes cache for hades_dupes, open files by size."""
+    execute_script(conn.cursor(), HASH_TABLES)
+
+
+def _migrate_checksums(conn):
+    """file_hashes.verified_at for rotating verification, hash_mismatches."""
+    execute_script(conn.cursor(), CHECKSUM_TABLES)
+
+
+def has_search(c) -> bool:
+    """file_search exists (it is skipped on SQLite builds without the FTS5 trigram tokenizer)."""
+    return c.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_search'").fetchone() is not None
+
+
+def update_search(c, disk_id: int, version_id: int):
+    """Bring the disk's file_search rows to version_id: drop the rows it closed, add the ones it opened."""
+    if has_search(c):
+        c.execute(SEARCH_DROP_SQL, (disk_id, version_id))
+        c.execute(SEARCH_ADD_SQL, (disk_id, version_id))
+
+
+def rebuild_search(conn) -> bool:
+    """(Re)create file_search from every disk's open rows; False if SQLite lacks FTS5 trigram."""
+    c = conn.cursor()
+    try:
+        c.execute("CREATE VIRTUAL TABLE temp.search_probe USING fts5(x, tokenize = 'trigram')")
+        c.execute("DROP TABLE temp.search_probe")
+    except sqlite3.OperationalError:
+        print(f"[HADES] ⚠️  SQLite {sqlite3.sqlite_version} has no FTS5 trigram tokenizer (3.34+): path search off")
+        return False
+    with transaction(conn):
+        c.execute("DROP TABLE IF EXISTS file_search")
+        execute_script(c, SEARCH_TABLES)
+        for (disk_id,) in c.execute("SELECT id FROM disks").fetchall():
+            c.execute(SEARCH_ADD_SQL, (disk_id, 0))
+    return True
+
+
+def save_scan_metrics(disk_id: int, version_id: int | None, mode: str, metrics: dict):
+    """One scan_metrics row from Metrics.to_dict() of a disk scan (mode: first / full / incremental)."""
+    phases, counters = metrics["phases"], metrics["counters"]
+    with transaction() as conn:
+        conn.execute(SCAN_METRICS_INSERT_SQL, (
+            disk_id, version_id, metrics["started_at"], mode, metrics["seconds"],
+            counters.get("files"), counters.get("bytes"), *(phases.get(p) for p in METRIC_PHASES),
+            json.dumps(metrics)))
+
+
+def get_scan_trend(disk_id: int, limit: int = 10) -> list:
+    """[(started_at, mode, seconds, files, walk_s, diff_s, save_s)] of the disk's last scans, newest first."""
+    return get_conn().execute(SCAN_TREND_SQL, (disk_id, limit)).fetchall()
+
+
+def get_last_full_scan(disk_id: int) -> tuple | None:
+    """(started_at, incremental scans since) of the disk's last non-incremental scan, None if none is recorded."""
+    return get_conn().execute(LAST_FULL_SCAN_SQL, (disk_id,)).fetchone()
+
+
+def _migrate_metrics(conn):
+    """scan_metrics: per-phase timings of every disk scan."""
+    execute_script(conn.cursor(), METRICS_TABLES)
+
+
+def _migrate_open_disk_index(conn):
+    """Covering index of each disk's open rows for the rollups (see ROLLUP_INDEX)."""
+    c = conn.cursor()
+    execute_script(c, ROLLUP_INDEX)
+    # A DB that PRAGMA optimize has already analyzed would otherwise plan without stats for it
+    if c.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        c.execute("ANALYZE idx_files_open_disk")
+
+
+def _migrate_search(conn):
+    """file_search trigram index over the names and folders of each disk's current files."""
+    rebuild_search(conn)
+
+
+def sync_extensions(conn):
+    """Make the extensions table match EXT_CATEGORIES (no write when it already does)."""
+    if dict(conn.execute("SELECT ext, category FROM extensions")) == EXT_CATEGORIES:
+        return
+    with transaction(conn):
+        conn.execute("DELETE FROM extensions")
+        conn.executemany("INSERT INTO extensions (ext, category) VALUES (?,?)", EXT_CATEGORIES.items())
+
+
+# Ordered schema migrations: (version, description, function). Append only, never renumber.
+MIGRATIONS = [
+    (1, "base schema (dirs tree, interval files)", _migrate_base_schema),
+    (2, "covering indexes for hot queries", _migrate_hot_indexes),
+    (3, "integer mtimes (files.mtime_ns)", _migrate_mtime_ns),
+    (4, "per-version dir rollups, top files, size histogram", _migrate_rollups),
+    (5, "file extensions, category lookup, ext rollup", _migrate_extensions),
+    (6, "content hash cache (file_hashes)", _migrate_hashes),
+    (7, "checksum verification (verified_at, hash_mismatches)", _migrate_checksums),
+    (8, "path search index (file_search)", _migrate_search),
+    (9, "scan metrics (scan_metrics)", _migrate_metrics),
+    (10, "covering index for per-disk rollups (idx_files_open_disk)", _migrate_open_disk_index),
+]
 
 
 def init_db():
-    """Create DB and schema if not exists."""
+    """Create DB and bring the schema up to date with MIGRATIONS."""
     HADES_DIR.mkdir(parents=True, exist_ok=True)
     BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
+    conn = get_conn()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            name        TEXT,
+            applied_at  TEXT NOT NULL
+        )
+    """)
+    current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+    for version, name, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with transaction(conn):
+            migrate(conn)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?,?,?)",
+                         (version, name, datetime.now().isoformat()))
+        print(f"[HADES] Schema migration {version}: {name}")
+
+    sync_extensions(conn)
+    print(f"[HADES] DB initialized: {DB_PATH}")
+
+
+def get_dir_id(c, path: str, cache: dict) -> int:
+    """Return dirs.id for a dir path like '/Photos/2019', creating missing levels.
+
+    cache maps already resolved dir paths to ids; seed it with {"": ROOT_DIR_ID}.
+    """
+    dir_id = cache.get(path)
+    if dir_id is None:
+        parent, _, name = path.rpartition("/")
+        parent_id = get_dir_id(c, parent, cache)
+        c.execute("INSERT OR IGNORE INTO dirs (parent_id, name) VALUES (?,?)", (parent_id, name))
+        c.execute("SELECT id FROM dirs WHERE parent_id = ? AND name = ?", (parent_id, name))
+        dir_id = cache[path] = c.fetchone()[0]
+    return dir_id
+
+
+def split_path(c, path: str, cache: dict) -> tuple:
+    """'/Photos/2019/a.jpg' -> (dir id of '/Photos/2019', 'a.jpg')."""
+    folder, _, name = path.rpartition("/")
+    return get_dir_id(c, folder, cache), name
+
+
+def get_dir_path(c, dir_id: int, cache: dict) -> str:
+    """Inverse of get_dir_id: dirs.id -> '/Photos/2019' (root is ''), walking up through cache."""
+    path = cache.get(dir_id)
+    if path is None:
+        parent_id, name = c.execute("SELECT parent_id, name FROM dirs WHERE id = ?", (dir_id,)).fetchone()
+        path = cache[dir_id] = "" if parent_id is None else f"{get_dir_path(c, parent_id, cache)}/{name}"
+    return path
+
+
+def load_dir_paths(c) -> dict:
+    """Return {dir id: full dir path} for every dir (parents always have lower ids)."""
+    paths = {}
+    for dir_id, parent_id, name in c.execute("SELECT id, parent_id, name FROM dirs ORDER BY id"):
+        paths[dir_id] = "" if parent_id is None else f"{paths[parent_id]}/{name}"
+    return paths
+
+
+def migrate_files_to_intervals(conn):
+    """Convert files_old (full copy per version) into validity intervals, then drop it."""
     c = conn.cursor()
+    cache = {"": ROOT_DIR_ID}
+    c.execute("SELECT DISTINCT disk_id FROM scan_versions ORDER BY disk_id")
+    for (disk_id,) in c.fetchall():
+        c.execute("SELECT id FROM scan_versions WHERE disk_id = ? ORDER BY id", (disk_id,))
+        open_rows = {}  # path -> (row id, size, modified)
+        for (ver_id,) in c.fetchall():
+            cur = conn.execute("SELECT path, size_bytes, modified_at FROM files_old WHERE version_id = ?", (ver_id,))
+            current = {row[0]: (row[1], row[2]) for row in cur}
+            closed = [p for p, row in open_rows.items() if row[1:] != current.get(p)]
+            conn.executemany("UPDATE files SET valid_to_version = ? WHERE id = ?",
+                             [(ver_id, open_rows.pop(p)[0]) for p in closed])
+            for path, (size, modified) in current.items():
+                if path not in open_rows:
+                    dir_id, name = split_path(c, path, cache)
+                    cur = conn.execute("""
+                        INSERT INTO files (disk_id, dir_id, name, size_bytes, modified_at, valid_from_version)
+                        VALUES (?,?,?,?,?,?)
+                    """, (disk_id, dir_id, name, size, modified, ver_id))
+                    open_rows[path] = (cur.lastrowid, size, modified)
+    c.execute("DROP TABLE files_old")
+    print(f"[HADES] Migrated files to validity intervals")
+
 
-    c.executescript("""
-        CREATE TABLE IF NOT EXISTS disks (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            label       TEXT UNIQUE NOT NULL,
-            serial      TEXT,
-            platform    TEXT,
-            last_seen   TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS scan_versions (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
-            scanned_at  TEXT NOT NULL,
-            file_count  INTEGER DEFAULT 0,
-            total_bytes INTEGER DEFAULT 0
-        );
-
-        CREATE TABLE IF NOT EXISTS files (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
-            path        TEXT NOT NULL,
-            size_bytes  INTEGER DEFAULT 0,
-            modified_at TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS diff_log (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
-            from_ver    INTEGER,
-            to_ver      INTEGER NOT NULL,
-            added       INTEGER DEFAULT 0,
-            removed     INTEGER DEFAULT 0,
-            modified    INTEGER DEFAULT 0,
-            logged_at   TEXT NOT NULL
-        );
+def migrate_paths_to_dirs(conn):
+    """Convert files_old (intervals keyed by full path) to (dir_id, name) rows, then drop it."""
+    c = conn.cursor()
+    cache = {"": ROOT_DIR_ID}
+    rows = conn.execute("""
+        SELECT id, disk_id, path, size_bytes, modified_at, valid_from_version, valid_to_version
+        FROM files_old
     """)
+    while True:
+        batch = rows.fetchmany(10_000)
+        if not batch:
+            break
+        c.executemany("""
+            INSERT INTO files (id, disk_id, dir_id, name, size_bytes, modified_at, valid_from_version, valid_to_version)
+            VALUES (?,?,?,?,?,?,?,?)
+        """, [(r[0], r[1], *split_path(c, r[2], cache), *r[3:]) for r in batch])
+    c.execute("DROP TABLE files_old")
+    print(f"[HADES] Migrated file paths to the dirs table ({len(cache)} dirs)")
 
-    conn.commit()
-    conn.close()
-    print(f"[HADES] DB initialized: {DB_PATH}")
 
+def backup_path(gen: int) -> Path:
+    """Existing file of backup generation gen (plain or .gz), or the plain name if there is none."""
+    bak = BACKUP_DIR / f"hades.db.bak{gen}"
+    gz = bak.with_name(bak.name + ".gz")
+    return gz if gz.exists() and not bak.exists() else bak
 
-def rotate_backup():
-    """Rotate backup files: bak4 drop, bak3->bak4, ..., db->bak1"""
-    bak = [BACKUP_DIR / f"hades.db.bak{i}" for i in range(1, MAX_BACKUPS + 1)]
+
+def backup_db(dest: Path, pages: int = BACKUP_PAGES):
+    """Consistent online copy of the live DB into dest via the SQLite backup API.
+
+    Copies `pages` pages per step, so a writer on another connection is only
+    locked out for one step at a time; a half-written dest is never left behind.
+    """
+    tmp = dest.with_name(dest.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    target = sqlite3.connect(tmp)
+    try:
+        get_conn().backup(target, pages=pages)
+    finally:
+        target.close()
+    os.replace(tmp, dest)
+
+
+def _compress(src: Path, dest: Path):
+    with open(src, "rb") as f_in, gzip.open(dest, "wb", compresslevel=BACKUP_GZIP_LEVEL) as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024**2)
+    src.unlink()
+
+
+def rotate_backup(compress: bool = None):
+    """Rotate backup files: bak4 drop, bak3->bak4, ..., db->bak1
+
+    bak1 always stays a plain DB (fast restore); with compress, it is gzipped
+    as it moves down to bak2, older generations are just renamed.
+    """
+    compress = BACKUP_COMPRESS if compress is None else compress
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
     # Drop oldest
-    if bak[3].exists():
-        bak[3].unlink()
-        print(f"[HADES] Dropped: {bak[3].name}")
+    oldest = backup_path(MAX_BACKUPS)
+    if oldest.exists():
+        oldest.unlink()
+        print(f"[HADES] Dropped: {oldest.name}")
 
     # Rotate: bak3->bak4, bak2->bak3, bak1->bak2
     for i in range(MAX_BACKUPS - 1, 0, -1):
-        if bak[i - 1].exists():
-            bak[i - 1].rename(bak[i])
-            print(f"[HADES] Rotated: {bak[i-1].name} → {bak[i].name}")
+        src = backup_path(i)
+        if not src.exists():
+            continue
+        dest = BACKUP_DIR / f"hades.db.bak{i + 1}"
+        if src.suffix == ".gz":
+            dest = dest.with_name(dest.name + ".gz")
+        elif compress:
+            _compress(src, dest.with_name(dest.name + ".gz"))
+            print(f"[HADES] Compressed: {src.name} → {dest.name}.gz")
+            continue
+        src.rename(dest)
+        print(f"[HADES] Rotated: {src.name} → {dest.name}")
 
     # Current DB -> bak1
     if DB_PATH.exists():
-        shutil.copy2(DB_PATH, bak[0])
-        print(f"[HADES] Backup created: {bak[0].name}")
+        bak1 = BACKUP_DIR / "hades.db.bak1"
+        backup_db(bak1)
+        print(f"[HADES] Backup created: {bak1.name}")
+
+
+def backup_once():
+    """rotate_backup() before the first write of a session; later saves in the same session skip it.
+
+    One scan session is one restore point, however many disks it saves.
+    """
+    global _backed_up
+    if not _backed_up:
+        rotate_backup()
+        _backed_up = True
+
+
+@contextmanager
+def _open_backup(gen: int):
+    """Read-only connection to backup generation gen (a .gz is unpacked to a temp file first)."""
+    path = backup_path(gen)
+    if not path.exists():
+        raise FileNotFoundError(f"No backup generation {gen}")
+    tmp = None
+    if path.suffix == ".gz":
+        tmp = BACKUP_DIR / f".restore_bak{gen}.tmp"
+        with gzip.open(path, "rb") as f_in, open(tmp, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024**2)
+        path = tmp
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        yield conn
+    finally:
+        conn.close()
+        if tmp:
+            tmp.unlink(missing_ok=True)
+
+
+def check_backup(gen: int) -> tuple:
+    """(ok, detail) of PRAGMA integrity_check on backup generation gen."""
+    try:
+        with _open_backup(gen) as conn:
+            result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            if result != ["ok"]:
+                return False, "; ".join(result[:5])
+            versions = conn.execute("SELECT COUNT(*) FROM scan_versions").fetchone()[0]
+            return True, f"{versions} versions"
+    except (sqlite3.DatabaseError, OSError) as e:
+        return False, str(e)
+
+
+def verify_backups() -> bool:
+    """Integrity-check every backup generation, return False if any present one is damaged."""
+    print("\n=== HADES BACKUP CHECK ===")
+    all_ok = True
+    for i in range(1, MAX_BACKUPS + 1):
+        path = backup_path(i)
+        if not path.exists():
+            print(f"   bak{i}: —")
+            continue
+        ok, detail = check_backup(i)
+        all_ok &= ok
+        print(f"   {'✅' if ok else '❌'} {path.name}: {detail}")
+    print()
+    return all_ok
+
+
+def restore_backup(gen: int = 1):
+    """Replace the live DB with backup generation gen, after checking it.
+
+    The current DB is saved to db_backup/hades.db.pre-restore first.
+    """
+    ok, detail = check_backup(gen)
+    if not ok:
+        raise sqlite3.DatabaseError(f"bak{gen} failed integrity check: {detail}")
+    if DB_PATH.exists():
+        backup_db(BACKUP_DIR / "hades.db.pre-restore")
+    with _open_backup(gen) as src:
+        src.backup(get_conn(), pages=BACKUP_PAGES)
+    print(f"[HADES] Restored {backup_path(gen).name} ({detail}) → {DB_PATH.name}")
 
 
 def get_or_create_disk(label: str, serial: str = None, platform: str = None) -> int:
     """Return disk id, create if not exists."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    c = conn.cursor()
-
     now = datetime.now().isoformat()
-    c.execute("SELECT id FROM disks WHERE label = ?", (label,))
-    row = c.fetchone()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM disks WHERE label = ?", (label,))
+        row = c.fetchone()
 
-    if row:
-        disk_id = row[0]
-        c.execute("UPDATE disks SET last_seen=?, serial=COALESCE(?,serial), platform=COALESCE(?,platform) WHERE id=?",
-                  (now, serial, platform, disk_id))
-    else:
-        c.execute("INSERT INTO disks (label, serial, platform, last_seen) VALUES (?,?,?,?)",
-                  (label, serial, platform, now))
-        disk_id = c.lastrowid
-        print(f"[HADES] New disk registered: {label} (id={disk_id})")
+        if row:
+            disk_id = row[0]
+            c.execute("UPDATE disks SET last_seen=?, serial=COALESCE(?,serial), platform=COALESCE(?,platform) WHERE id=?",
+                      (now, serial, platform, disk_id))
+        else:
+            c.execute("INSERT INTO disks (label, serial, platform, last_seen) VALUES (?,?,?,?)",
+                      (label, serial, platform, now))
+            disk_id = c.lastrowid
+            print(f"[HADES] New disk registered: {label} (id={disk_id})")
 
-    conn.commit()
-    conn.close()
     return disk_id
 
 
 def get_last_version(disk_id: int) -> dict | None:
     """Return latest scan version for disk, or None."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, scanned_at, file_count, total_bytes
-        FROM scan_versions
-        WHERE disk_id = ?
-        ORDER BY scanned_at DESC
-        LIMIT 1
-    """, (disk_id,))
-    row = c.fetchone()
-    conn.close()
+    row = get_conn().execute(LAST_VERSION_SQL + " LIMIT 1", (disk_id,)).fetchone()
     if row:
         return {"id": row[0], "scanned_at": row[1], "file_count": row[2], "total_bytes": row[3]}
     return None
 
 
 def get_version_files(version_id: int) -> dict:
-    """Return {path: {size, modified}} for a version."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT path, size_bytes, modified_at FROM files WHERE version_id = ?", (version_id,))
-    result = {row[0]: {"size": row[1], "modified": row[2]} for row in c.fetchall()}
-    conn.close()
-    return result
+    """Return {path: {size, mtime_ns}} for a version."""
+    c = get_conn().execute(VERSION_FILES_SQL, (version_id,))
+    return {row[0]: {"size": row[1], "mtime_ns": row[2]} for row in c}
+
+
+def get_version_dirs(version_id: int) -> dict:
+    """Return {dir_path: (mtime_ns, inode)} recorded with a version."""
+    c = get_conn().execute(VERSION_DIRS_SQL, (version_id,))
+    return {row[0]: (row[1], row[2]) for row in c}
+
+
+def get_top_dirs(version_id: int, max_depth: int = 2, limit: int = 10) -> list:
+    """Biggest dirs (subtree totals) of a version: [(path, file_count, total_bytes, depth)]."""
+    return get_conn().execute(TOP_DIRS_SQL, (version_id, max_depth, limit)).fetchall()
+
+
+def get_top_files(version_id: int, limit: int = TOP_FILES_PER_VERSION) -> list:
+    """Largest files of a version: [(folder, name, size, mtime_ns)]."""
+    return get_conn().execute(TOP_FILES_SQL, (version_id, limit)).fetchall()
+
+
+def get_category_stats(version_id: int) -> list:
+    """[(category, file_count, total_bytes)] of a version, biggest first."""
+    return get_conn().execute(CATEGORY_STATS_SQL, (CAT_OTHER, version_id)).fetchall()
+
+
+def get_ext_stats(version_id: int, limit: int = -1) -> list:
+    """[(ext, category, file_count, total_bytes)] of a version, biggest first; ext '' = none."""
+    return get_conn().execute(EXT_STATS_SQL, (CAT_OTHER, version_id, limit)).fetchall()
+
+
+def get_size_histogram(version_id: int) -> list:
+    """[(bucket, file_count, total_bytes)] of a version; bucket indexes SIZE_BUCKET_LABELS."""
+    return get_conn().execute(SIZE_HISTOGRAM_SQL, (version_id,)).fetchall()
+
+
+def same_mtime(old_ns, new_ns) -> bool:
+    """Python twin of the mtime half of _same_file."""
+    if old_ns == new_ns:
+        return True
+    if old_ns is None or new_ns is None:
+        return False
+    return old_ns % 1000 == 0 and abs(old_ns - new_ns) < MTIME_TOLERANCE_NS
+
+
+def format_mtime(mtime_ns) -> str:
+    """Local-time ISO string (seconds) for display; "—" if unknown."""
+    if mtime_ns is None:
+        return "—"
+    return datetime.fromtimestamp(mtime_ns // 10**9).isoformat()
 
 
 def compute_diff(old_files: dict, new_files: dict) -> dict:
@@ -154,7 +1365,7 @@ def compute_diff(old_files: dict, new_files: dict) -> dict:
     modified = {
         p for p in common
         if old_files[p]["size"] != new_files[p]["size"]
-        or old_files[p]["modified"] != new_files[p]["modified"]
+        or not same_mtime(old_files[p]["mtime_ns"], new_files[p]["mtime_ns"])
     }
 
     return {
@@ -165,59 +1376,359 @@ def compute_diff(old_files: dict, new_files: dict) -> dict:
     }
 
 
-def save_new_version(disk_id: int, files: dict, diff: dict, prev_version_id: int = None):
-    """Save new scan version, prune old ones, rotate backup."""
-    rotate_backup()
+def begin_stage(disk_id: int):
+    """Create scan_stage if needed and clear the disk's leftover rows."""
+    with transaction() as conn:
+        conn.execute(STAGE_TABLE)
+        conn.execute(STAGE_INDEX)
+        conn.execute("DELETE FROM scan_stage WHERE disk_id = ?", (disk_id,))
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    c = conn.cursor()
-    now = datetime.now().isoformat()
 
-    total_bytes = sum(f["size"] for f in files.values())
+def stage_batch(disk_id: int, rows, cache: dict) -> int:
+    """Append one batch of (path, size, mtime_ns) rows to the disk's stage."""
+    with transaction() as conn:
+        c = conn.cursor()
+        batch = [(disk_id, *split_path(c, path, cache), size, mtime) for path, size, mtime in rows]
+        c.executemany("""
+            INSERT INTO scan_stage (disk_id, dir_id, name, size_bytes, mtime_ns)
+            VALUES (?,?,?,?,?)
+        """, batch)
+    return len(batch)
+
+
+def stage_copy_dirs(disk_id: int, dir_paths, cache: dict):
+    """Carry the current rows of unchanged dirs forward into the stage, without reading them into Python."""
+    with transaction() as conn:
+        c = conn.cursor()
+        c.executemany(STAGE_COPY_DIR_SQL, [(disk_id, get_dir_id(c, path, cache)) for path in dir_paths])
+
+
+def stage_totals(disk_id: int) -> tuple:
+    """(file count, total bytes) staged for the disk."""
+    return get_conn().execute(STAGE_TOTALS_SQL, (disk_id,)).fetchone()
+
+
+def end_stage(disk_id: int):
+    with transaction() as conn:
+        conn.execute("DELETE FROM scan_stage WHERE disk_id = ?", (disk_id,))
+
+
+def stage_files(disk_id: int, files, batch_size: int = 10_000) -> int:
+    """Bulk-load a whole scan into the disk's stage, return the staged row count.
+
+    files is {path: {size, mtime_ns}} or an iterable of (path, size, mtime_ns).
+    Rows go in as fixed-size batches, so no full row list is ever built.
+    """
+    items = ((p, m["size"], m["mtime_ns"]) for p, m in files.items()) if isinstance(files, dict) else iter(files)
+    begin_stage(disk_id)
+    cache = {"": ROOT_DIR_ID}
+    staged = 0
+    while True:
+        n = stage_batch(disk_id, islice(items, batch_size), cache)
+        if not n:
+            break
+        staged += n
+    return staged
+
+
+def diff_counts(diff: dict) -> dict:
+    """{added_count, removed_count, modified_count} of a compute_diff() result."""
+    return {f"{kind}_count": len(diff[kind]) for kind in ("added", "removed", "modified")}
+
+
+def compute_staged_diff(disk_id: int) -> dict:
+    """Diff scan_stage against the disk's current rows inside SQLite.
+
+    Returns {added_count, removed_count, modified_count, has_changes}; no path is
+    materialized, and an unchanged disk returns after one EXISTS probe and two counts.
+    """
+    c = get_conn().cursor()
+    changed = c.execute(STAGE_CHANGED_SQL, (disk_id,)).fetchone()[0]
+    if not changed:
+        staged = c.execute(STAGE_TOTALS_SQL, (disk_id,)).fetchone()[0]
+        current = c.execute("SELECT COUNT(*) FROM files WHERE disk_id = ? AND valid_to_version IS NULL",
+                            (disk_id,)).fetchone()[0]
+        if staged == current:
+            return {"added_count": 0, "removed_count": 0, "modified_count": 0, "has_changes": False}
+
+    counts = {
+        "added_count": c.execute(STAGE_ADDED_COUNT_SQL, (disk_id,)).fetchone()[0],
+        "removed_count": c.execute(STAGE_REMOVED_COUNT_SQL, (disk_id,)).fetchone()[0],
+        "modified_count": c.execute(STAGE_MODIFIED_COUNT_SQL, (disk_id,)).fetchone()[0],
+    }
+    return {**counts, "has_changes": any(counts.values())}
+
 
-    # Insert new version
+def _insert_version(c, disk_id: int, now: str, file_count: int, total_bytes: int) -> int:
     c.execute("""
         INSERT INTO scan_versions (disk_id, scanned_at, file_count, total_bytes)
         VALUES (?,?,?,?)
-    """, (disk_id, now, len(files), total_bytes))
-    new_ver_id = c.lastrowid
+    """, (disk_id, now, file_count, total_bytes))
+    return c.lastrowid
 
-    # Insert files
-    c.executemany("""
-        INSERT INTO files (version_id, path, size_bytes, modified_at)
-        VALUES (?,?,?,?)
-    """, [(new_ver_id, path, meta["size"], meta["modified"]) for path, meta in files.items()])
+
+def _finish_version(c, disk_id: int, new_ver_id: int, now: str, counts: dict, prev_version_id: int, dirs: dict,
+                    cache: dict):
+    """Dir states, rollups, diff log and pruning shared by both save paths."""
+    # Dir states: next scan only re-lists dirs whose (mtime, inode) changed
+    if dirs:
+        with phase("insert"):
+            c.executemany("""
+                INSERT INTO dir_state (version_id, dir_id, mtime_ns, inode)
+                VALUES (?,?,?,?)
+            """, [(new_ver_id, get_dir_id(c, path, cache), state[0], state[1]) for path, state in dirs.items()])
+
+    # Rollups: the new version's rows are exactly the disk's open rows now
+    with phase("rollup"):
+        save_rollups(c, disk_id, new_ver_id)
+    with phase("search"):
+        update_search(c, disk_id, new_ver_id)
 
     # Log diff
     c.execute("""
         INSERT INTO diff_log (disk_id, from_ver, to_ver, added, removed, modified, logged_at)
         VALUES (?,?,?,?,?,?,?)
     """, (disk_id, prev_version_id, new_ver_id,
-          len(diff["added"]), len(diff["removed"]), len(diff["modified"]), now))
+          counts["added_count"], counts["removed_count"], counts["modified_count"], now))
 
     # Prune: keep only MAX_VERSIONS_PER_DISK newest
-    c.execute("""
-        SELECT id FROM scan_versions WHERE disk_id = ?
-        ORDER BY scanned_at DESC
-    """, (disk_id,))
+    c.execute(LAST_VERSION_SQL, (disk_id,))
     all_versions = [row[0] for row in c.fetchall()]
 
-    to_delete = all_versions[MAX_VERSIONS_PER_DISK:]
-    for vid in to_delete:
-        c.execute("DELETE FROM scan_versions WHERE id = ?", (vid,))
-        print(f"[HADES] Pruned old version: id={vid}")
+    # Only the version rows go here (their dir_state cascades by index); the file rows
+    # they leave invisible are deleted later by maintenance(), outside the save
+    with phase("prune"):
+        for vid in all_versions[MAX_VERSIONS_PER_DISK:]:
+            c.execute("DELETE FROM scan_versions WHERE id = ?", (vid,))
+            print(f"[HADES] Pruned old version: id={vid}")
+
+
+def save_new_version(disk_id: int, files: dict, diff: dict, prev_version_id: int = None, dirs: dict = None):
+    """Save new scan version as a delta against prev_version_id, prune old ones, rotate backup.
+
+    diff must be relative to prev_version_id: removed/modified rows are closed,
+    added/modified rows are inserted, everything else stays valid untouched.
+    """
+    with phase("backup"):
+        backup_once()
+
+    now = datetime.now().isoformat()
+    total_bytes = sum(f["size"] for f in files.values())
+
+    with phase("save"), transaction() as conn:
+        c = conn.cursor()
+        with phase("insert"):
+            new_ver_id = _insert_version(c, disk_id, now, len(files), total_bytes)
+
+            # Close rows that are gone or changed
+            cache = {"": ROOT_DIR_ID}
+            if prev_version_id is None:
+                c.execute("UPDATE files SET valid_to_version = ? WHERE disk_id = ? AND valid_to_version IS NULL",
+                          (new_ver_id, disk_id))
+                inserted = files.keys()
+            else:
+                c.executemany(CLOSE_FILE_SQL, [(new_ver_id, disk_id, *split_path(c, path, cache))
+                                               for path in diff["removed"] + diff["modified"]])
+                inserted = diff["added"] + diff["modified"]
+
+            # Open rows for new and changed files
+            c.executemany("""
+                INSERT INTO files (disk_id, dir_id, name, ext, size_bytes, mtime_ns, valid_from_version)
+                VALUES (?1, ?2, ?3, file_ext(?3), ?4, ?5, ?6)
+            """, [(disk_id, *split_path(c, path, cache), files[path]["size"], files[path]["mtime_ns"], new_ver_id)
+                  for path in inserted])
+
+        _finish_version(c, disk_id, new_ver_id, now, diff_counts(diff), prev_version_id, dirs, cache)
 
-    conn.commit()
-    conn.close()
     print(f"[HADES] New version saved: id={new_ver_id} | +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['modified'])}")
     return new_ver_id
 
 
+def save_staged_version(disk_id: int, counts: dict, prev_version_id: int = None, dirs: dict = None):
+    """Save scan_stage as the disk's new version: the delta is applied with two set-based statements.
+
+    counts ({added_count, removed_count, modified_count}, e.g. from compute_staged_diff) go to diff_log.
+    """
+    with phase("backup"):
+        backup_once()
+
+    now = datetime.now().isoformat()
+    with phase("save"), transaction() as conn:
+        c = conn.cursor()
+        with phase("insert"):
+            file_count, total_bytes = c.execute(STAGE_TOTALS_SQL, (disk_id,)).fetchone()
+            new_ver_id = _insert_version(c, disk_id, now, file_count, total_bytes)
+            c.execute(STAGE_CLOSE_SQL, (new_ver_id, disk_id))
+            c.execute(STAGE_INSERT_SQL, (new_ver_id, disk_id))
+        _finish_version(c, disk_id, new_ver_id, now, counts, prev_version_id, dirs, {"": ROOT_DIR_ID})
+
+    print(f"[HADES] New version saved: id={new_ver_id} | "
+          f"+{counts['added_count']} -{counts['removed_count']} ~{counts['modified_count']}")
+    return new_ver_id
+
+
+# Hot queries that must never fall back to a full table scan: name -> (sql, sample params)
+HOT_QUERIES = {
+    "get_version_files": (VERSION_FILES_SQL, (1,)),
+    "export version entries": (VERSION_ENTRIES_SQL, (1,)),
+    "export disk sheet": (VERSION_SHEET_SQL + " ORDER BY f.size_bytes DESC", ("x", 1)),
+    "get_version_dirs": (VERSION_DIRS_SQL, (1,)),
+    "get_last_version / prune": (LAST_VERSION_SQL + " LIMIT 1", (1,)),
+    "diff history": (DIFF_HISTORY_SQL, (1,)),
+    "close changed file": (CLOSE_FILE_SQL, (1, 1, 1, "x")),
+    "prune closed files": (PRUNE_FILES_SQL, (1, 1)),
+    "oldest kept versions": (OLDEST_VERSIONS_SQL, ()),
+    "prune version (cascade)": ("DELETE FROM dir_state WHERE version_id = ?", (1,)),
+    "staged diff: changed?": (STAGE_CHANGED_SQL, (1,)),
+    "staged diff: added": (STAGE_ADDED_COUNT_SQL, (1,)),
+    "staged diff: modified": (STAGE_MODIFIED_COUNT_SQL, (1,)),
+    "staged diff: removed": (STAGE_REMOVED_COUNT_SQL, (1,)),
+    "staged save: close": (STAGE_CLOSE_SQL, (1, 1)),
+    "staged save: insert": (STAGE_INSERT_SQL, (1, 1)),
+    "incremental copy-forward": (STAGE_COPY_DIR_SQL, (1, 1)),
+    "rollup: dirs": (ROLLUP_DIRS_SQL, (1, 1)),
+    "rollup: top files": (ROLLUP_TOP_FILES_SQL, (1, 1, 1)),
+    "rollup: size histogram": (ROLLUP_HISTOGRAM_SQL, (1, 1)),
+    "top dirs": (TOP_DIRS_SQL, (1, 2, 10)),
+    "top files": (TOP_FILES_SQL, (1, 10)),
+    "size histogram": (SIZE_HISTOGRAM_SQL, (1,)),
+    "rollup: extensions": (ROLLUP_EXT_SQL, (1, 1)),
+    "category stats": (CATEGORY_STATS_SQL, ("x", 1)),
+    "extension stats": (EXT_STATS_SQL, ("x", 1, 20)),
+    "dupes: candidates": (DUPE_CANDIDATES_SQL, (1,)),
+    "dupes: groups": (DUPE_GROUPS_SQL, ()),
+    "hash: store partial": (HASH_PARTIAL_SQL, (1, 1, "x", 1, 1, b"", "")),
+    "hash: store digest": (HASH_FULL_SQL, (b"", "", 1, 1, "x")),
+    "checksum: store": (HASH_DIGEST_SQL, (1, 1, "x", 1, 1, b"", "")),
+    "checksum: missing": (HASH_MISSING_SQL, (1,)),
+    "checksum: prune": (HASH_PRUNE_DISK_SQL, (1,)),
+    "checksum: verify slice": (HASH_VERIFY_SQL, (1, "", "", 0, "", 100)),
+    "checksum: verified": (HASH_VERIFIED_SQL, ("", 1, 1, "x")),
+    "search: add": (SEARCH_ADD_SQL, (1, 1)),
+    "scan trend": (SCAN_TREND_SQL, (1, 10)),
+    "last full scan": (LAST_FULL_SCAN_SQL, (1,)),
+    "search: drop": (SEARCH_DROP_SQL, (1, 1)),
+    "find: contains": (FIND_FILES_SQL.format(where="s.name LIKE ?3"), (None, 10, "%abc%")),
+    "find: glob": (FIND_FILES_SQL.format(where="s.name GLOB ?3 AND s.folder GLOB ?4"), (None, 10, "*.jpg", "*/abc")),
+    "find: folder on one disk": (FIND_FILES_SQL.format(where="s.folder LIKE ?3"), ("D1", 10, "%abc%")),
+}
+
+# Tables a query may walk in full, by HOT_QUERIES name (never blanket per table).
+# scan_versions holds at most MAX_VERSIONS_PER_DISK rows per disk: with a few versions the
+# planner walks it rather than look the version up, files is still searched by its disk_id
+FULL_SCAN_OK = {
+    "oldest kept versions": {"scan_versions"},
+    "get_version_files": {"scan_versions"},
+    "export version entries": {"scan_versions"},
+    "export disk sheet": {"scan_versions"},
+}
+SQL_KEYWORDS = {"WHERE", "ON", "JOIN", "LEFT", "INNER", "CROSS", "ORDER", "GROUP", "LIMIT", "SET", "USING", "AS",
+                "INDEXED"}
+
+
+def _plan_stats(disks, files, versions, history, dirs, hashed) -> list:
+    """sqlite_stat1 rows as PRAGMA optimize writes them for disks x files open rows, versions
+    kept per disk, history closed rows, dirs directories and hashed files with a digest."""
+    open_rows, rows, n_versions = disks * files, disks * files + history, disks * versions
+    per_version, per_disk_dirs, per_disk_hashed = n_versions * dirs // disks, dirs // disks, max(1, hashed // disks)
+    return [
+        ("files", None, str(rows)),
+        ("files", "idx_files_open", f"{open_rows} {files} {max(1, open_rows // dirs)} 1"),
+        ("files", "idx_files_disk_valid",
+         f"{rows} {rows // disks} {rows // n_versions} {max(1, rows // (n_versions * versions))}"),
+        ("files", "idx_files_open_size", f"{open_rows} 2"),
+        ("files", "idx_files_open_disk", f"{open_rows} {files} 2 2 2"),
+        ("dirs", "sqlite_autoindex_dirs_1", f"{dirs} 10 1"),
+        ("disks", "sqlite_autoindex_disks_1", f"{disks} 1"),
+        ("scan_versions", "idx_versions_disk", f"{n_versions} {versions} 1 1 1"),
+        ("dir_state", "idx_dir_state_version", f"{per_version} {per_disk_dirs} 1 1 1"),
+        ("diff_log", "idx_diff_log_disk", f"{n_versions} {versions} 1 1 1 1"),
+        ("dir_rollup", "dir_rollup", f"{per_version} {per_disk_dirs} 1"),
+        ("dir_rollup", "idx_dir_rollup_size", f"{per_version} {per_disk_dirs} 1 1"),
+        ("version_top_files", "version_top_files", f"{n_versions * TOP_FILES_PER_VERSION} {TOP_FILES_PER_VERSION} 1"),
+        ("size_histogram", "size_histogram", f"{n_versions * len(SIZE_BUCKET_LABELS)} {len(SIZE_BUCKET_LABELS)} 1"),
+        ("ext_rollup", "ext_rollup", f"{n_versions * 20} 20 1"),
+        ("extensions", "extensions", f"{len(EXT_CATEGORIES)} 1"),
+        ("file_hashes", "file_hashes", f"{max(1, hashed)} {per_disk_hashed} 5 1"),
+        ("file_hashes", "idx_file_hashes_digest", f"{max(1, hashed)} 2"),
+        ("file_hashes", "idx_file_hashes_verify", f"{max(1, hashed)} {per_disk_hashed} {per_disk_hashed} 5 1"),
+        ("scan_metrics", "idx_scan_metrics_disk", f"{n_versions * 10} {versions * 10} 1"),
+        ("scan_metrics", "idx_scan_metrics_version", f"{n_versions * 10} 10"),
+    ]
+
+
+# Collections check_query_plans() also plans for: ANALYZE is what turns index lookups
+# into scans (few disks: one disk's rows are a big share of files), and a fresh DB
+# has no stats to show it
+PLAN_STATS = {
+    "stats: 2 disks x 100k, first scans": _plan_stats(2, 100_000, 1, 0, 10_000, 20_000),
+    "stats: 2 disks x 100k, history": _plan_stats(2, 100_000, 4, 20_000, 10_000, 40_000),
+    "stats: 8 disks x 250k": _plan_stats(8, 250_000, MAX_VERSIONS_PER_DISK, 500_000, 200_000, 300_000),
+}
+
+
+def _plan_conn(stats=()) -> sqlite3.Connection:
+    """Empty in-memory copy of the DB's schema that plans with stats (sqlite_stat1 rows), or none."""
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.create_function("file_ext", 1, file_ext, deterministic=True)
+    objects = get_conn().execute("""
+        SELECT name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%'
+        ORDER BY type = 'index'
+    """).fetchall()
+    # FTS5 shadow tables (<name>_data, ...) come with their virtual table
+    vtabs = [name for name, sql in objects if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+    for name, sql in objects:
+        if not any(name.startswith(v + "_") for v in vtabs):
+            conn.execute(sql)
+    if stats:
+        conn.execute("ANALYZE")  # empty tables: only creates sqlite_stat1
+        conn.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?,?,?)", stats)
+        conn.execute("ANALYZE sqlite_master")  # reload the stats into the planner
+    return conn
+
+
+def _full_scans(conn) -> list:
+    """[(name, plan detail)] of the HOT_QUERIES full scans as conn plans them."""
+    conn.execute(STAGE_TABLE)
+    conn.execute(STAGE_INDEX)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    offenders = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        # alias -> table, so "SCAN f" can be traced back to files
+        aliases = {t: t for t in tables}
+        for table, alias in re.findall(r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(\w+))?", sql, re.I):
+            if alias and alias.upper() not in SQL_KEYWORDS:
+                aliases[alias] = table
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            # a virtual table scan with an index string (e.g. "0:L0", an FTS5 LIKE) is a lookup;
+            # a skip-scan (ANY(col) on the leading column) reads every key like a scan does
+            m = re.match(r"SCAN (\w+)(?! VIRTUAL TABLE INDEX \d+:\S)|SEARCH (\w+) USING .*\(ANY\(", row[3])
+            if m and aliases.get(m.group(1) or m.group(2)) in tables - FULL_SCAN_OK.get(name, set()):
+                offenders.append((name, row[3]))
+    return offenders
+
+
+def check_query_plans() -> list:
+    """EXPLAIN QUERY PLAN every HOT_QUERIES entry, return [(name, plan detail)] of full scans.
+
+    Plans are checked on the DB as it is, and on an empty copy of its schema
+    without stats and with each PLAN_STATS profile, so a plan that only goes bad
+    once PRAGMA optimize has analyzed the collection is caught on any DB.
+    """
+    found = {}
+    plans = [("this DB", get_conn()), ("no stats", _plan_conn())]
+    plans += [(label, _plan_conn(stats)) for label, stats in PLAN_STATS.items()]
+    for label, conn in plans:
+        for offender in _full_scans(conn):
+            found.setdefault(offender, []).append(label)
+        if conn is not get_conn():
+            conn.close()
+    return [(name, f"{detail} [{'; '.join(labels)}]") for (name, detail), labels in found.items()]
+
+
 def status():
     """Print current DB status."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    c = get_conn().cursor()
 
     c.execute("SELECT id, label, platform, last_seen FROM disks")
     disks = c.fetchall()
@@ -231,7 +1742,9 @@ def status():
             ORDER BY scanned_at DESC
         """, (disk_id,))
         versions = c.fetchall()
-        print(f"\n💾 {label} [{platform}] | last seen: {last_seen}")
+        c.execute("SELECT COUNT(*) FROM files WHERE disk_id = ?", (disk_id,))
+        stored = c.fetchone()[0]
+        print(f"\n💾 {label} [{platform}] | last seen: {last_seen} | {stored} file rows stored")
         for v in versions:
             gb = v[3] / (1024**3)
             print(f"   v{v[0]} | {v[1][:19]} | {v[2]} files | {gb:.2f} GB")
@@ -239,19 +1752,206 @@ def status():
     # Backups
     print("\n📦 Backups:")
     for i in range(1, MAX_BACKUPS + 1):
-        bak = BACKUP_DIR / f"hades.db.bak{i}"
+        bak = backup_path(i)
         if bak.exists():
             size_kb = bak.stat().st_size / 1024
-            print(f"   bak{i}: {size_kb:.1f} KB")
+            print(f"   bak{i}: {size_kb:.1f} KB{' (gz)' if bak.suffix == '.gz' else ''}")
         else:
             print(f"   bak{i}: —")
 
-    conn.close()
     print()
 
 
+def db_pages(conn) -> tuple:
+    """(size, free) bytes of the main DB from its page counts; the WAL is not part of either."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return (conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size)
+
+
+def wal_size() -> int:
+    """Bytes of the DB's -wal file (0 when there is none)."""
+    wal = DB_PATH.with_name(DB_PATH.name + "-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+def maintenance(vacuum: bool = False, log=print) -> dict:
+    """Deferred cleanup after saves: delete file rows no kept version can see, give the space back.
+
+    Pruning cost follows the number of dead rows (an index range per disk), not the
+    size of the DB, and none of it runs inside a save. Free pages are returned with
+    incremental_vacuum; vacuum=True runs a full VACUUM instead, which also switches
+    older DBs to auto_vacuum=INCREMENTAL. Returns {rows, before, after, reclaimed, free,
+    wal_before, wal_after} (bytes): before / after / reclaimed are the main DB's pages,
+    free is what stays in it for reuse, and the WAL truncated by the checkpoint is
+    reported on its own.
+    """
+    conn = get_conn()
+    before, _ = db_pages(conn)
+    wal_before = wal_size()
+    rows = 0
+    for disk_id, oldest_kept in conn.execute(OLDEST_VERSIONS_SQL).fetchall():
+        with transaction(conn):
+            rows += conn.execute(PRUNE_FILES_SQL, (disk_id, oldest_kept)).rowcount
+
+    if vacuum:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        conn.execute("PRAGMA incremental_vacuum")
+    after, free = db_pages(conn)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+
+    report = {"rows": rows, "before": before, "after": after, "reclaimed": max(0, before - after), "free": free,
+              "wal_before": wal_before, "wal_after": wal_size()}
+    log(f"[HADES] Maintenance: {rows} stale file rows pruned | "
+        f"{before / 1024**2:.1f} MB → {after / 1024**2:.1f} MB ({report['reclaimed'] / 1024**2:.1f} MB reclaimed, "
+        f"{free / 1024**2:.1f} MB free for reuse) | WAL {wal_before / 1024**2:.1f} MB → {report['wal_after'] / 1024**2:.1f} MB")
+    return report
+
+
+def print_query_plans() -> bool:
+    """Print the EXPLAIN QUERY PLAN check, return True if no hot query does a full scan."""
+    offenders = check_query_plans()
+    print(f"\n=== HADES QUERY PLANS ({len(HOT_QUERIES)} hot queries, {len(PLAN_STATS)} stats profiles) ===")
+    for name, detail in offenders:
+        print(f"   ❌ {name}: {detail}")
+    if not offenders:
+        print("   ✅ No full table scans")
+    print()
+    return not offenders
+
+
+# Pre-versioning schema (the original init_db): a full copy of every file per version, keyed by path
+LEGACY_SCHEMA = """
+    CREATE TABLE disks (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        label       TEXT UNIQUE NOT NULL,
+        serial      TEXT,
+        platform    TEXT,
+        last_seen   TEXT
+    );
+    CREATE TABLE scan_versions (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        scanned_at  TEXT NOT NULL,
+        file_count  INTEGER DEFAULT 0,
+        total_bytes INTEGER DEFAULT 0
+    );
+    CREATE TABLE files (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        version_id  INTEGER NOT NULL REFERENCES scan_versions(id) ON DELETE CASCADE,
+        path        TEXT NOT NULL,
+        size_bytes  INTEGER DEFAULT 0,
+        modified_at TEXT
+    );
+    CREATE TABLE diff_log (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        disk_id     INTEGER NOT NULL REFERENCES disks(id) ON DELETE CASCADE,
+        from_ver    INTEGER,
+        to_ver      INTEGER NOT NULL,
+        added       INTEGER DEFAULT 0,
+        removed     INTEGER DEFAULT 0,
+        modified    INTEGER DEFAULT 0,
+        logged_at   TEXT NOT NULL
+    )
+"""
+
+# History written into LEGACY_SCHEMA by check_migrations(): label -> versions of {path: (size, modified_at)};
+# covers changed, removed, re-added and untouched files, root-level and non-ASCII paths, missing mtimes
+LEGACY_SAMPLE = {
+    "ARCHIV": [
+        {"/a.txt": (10, "2023-01-01T10:00:00"), "/Photos/2019/img 1.jpg": (2048, "2023-02-03T04:05:06.123456"),
+         "/Photos/2019/img2.jpg": (4096, "2023-02-03T04:05:07"), "/Docs/ünnep.pdf": (500, None)},
+        {"/a.txt": (12, "2023-03-01T10:00:00"), "/Photos/2019/img 1.jpg": (2048, "2023-02-03T04:05:06.123456"),
+         "/Docs/ünnep.pdf": (500, None), "/Docs/new.md": (1, "2023-03-02T00:00:00")},
+        {"/a.txt": (12, "2023-03-01T10:00:00"), "/Photos/2019/img2.jpg": (4096, "2023-02-03T04:05:07")},
+    ],
+    "USB": [{"/x.bin": (1, "2024-05-05T05:05:05")}],
+}
+
+
+def check_migrations() -> bool:
+    """Migrate a pre-versioning DB through every MIGRATIONS step, return True if no data was lost.
+
+    init_db() runs twice in a child process with a temp HOME, so the real DB is
+    never touched. Checked afterwards: the latest schema_version, the disks,
+    versions and diff_log rows, every version's exact (path, size, mtime_ns) set,
+    integrity / foreign keys, and that the second init_db() migrates nothing.
+    """
+    latest = MIGRATIONS[-1][0]
+    print(f"\n=== HADES MIGRATION CHECK (pre-versioning DB → schema {latest}) ===")
+    failures = []
+
+    def check(what, ok, detail=""):
+        print(f"   {'✅' if ok else '❌'} {what}{f': {detail}' if detail and not ok else ''}")
+        if not ok:
+            failures.append(what)
+
+    with tempfile.TemporaryDirectory(prefix="hades_migrate_") as home:
+        db = Path(home) / HADES_DIR.relative_to(Path.home()) / DB_PATH.name
+        db.parent.mkdir(parents=True)
+        conn = sqlite3.connect(db)
+        conn.executescript(LEGACY_SCHEMA)
+        expected, diffs = {}, 0
+        with conn:
+            for label, versions in LEGACY_SAMPLE.items():
+                disk_id = conn.execute("INSERT INTO disks (label, platform, last_seen) VALUES (?, 'linux', ?)",
+                                       (label, "2024-06-01T00:00:00")).lastrowid
+                prev = None
+                for i, files in enumerate(versions):
+                    ver_id = conn.execute(
+                        "INSERT INTO scan_versions (disk_id, scanned_at, file_count, total_bytes) VALUES (?,?,?,?)",
+                        (disk_id, f"2024-06-0{i + 1}T00:00:00", len(files), sum(f[0] for f in files.values()))
+                    ).lastrowid
+                    conn.executemany("INSERT INTO files (version_id, path, size_bytes, modified_at) VALUES (?,?,?,?)",
+                                     [(ver_id, path, size, modified) for path, (size, modified) in files.items()])
+                    if prev:
+                        conn.execute("INSERT INTO diff_log (disk_id, from_ver, to_ver, logged_at) VALUES (?,?,?,?)",
+                                     (disk_id, prev, ver_id, f"2024-06-0{i + 1}T00:00:00"))
+                        diffs += 1
+                    expected[ver_id] = {path: (size, _iso_to_ns(modified)) for path, (size, modified) in files.items()}
+                    prev = ver_id
+        conn.close()
+
+        env = {**os.environ, "HOME": home, "USERPROFILE": home}
+        runs = [subprocess.run([sys.executable, __file__, "status"], env=env, capture_output=True, text=True)
+                for _ in range(2)]
+        for i, run in enumerate(runs, 1):
+            check(f"init_db run {i}", run.returncode == 0, (run.stderr or run.stdout).strip()[-500:])
+        check("second init_db migrates nothing", "Schema migration" not in runs[1].stdout)
+
+        conn = sqlite3.connect(db)
+        try:
+            applied = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+            check(f"schema_version 1..{latest}", applied == [v for v, _, _ in MIGRATIONS], str(applied))
+            labels = [row[0] for row in conn.execute("SELECT label FROM disks ORDER BY id")]
+            check("disks kept", labels == list(LEGACY_SAMPLE), str(labels))
+            versions = [row[0] for row in conn.execute("SELECT id FROM scan_versions ORDER BY id")]
+            check("versions kept", versions == list(expected), str(versions))
+            check("diff_log kept", conn.execute("SELECT COUNT(*) FROM diff_log").fetchone()[0] == diffs)
+            for ver_id, files in expected.items():
+                got = {row[0]: (row[1], row[2]) for row in conn.execute(VERSION_FILES_SQL, (ver_id,))}
+                check(f"version {ver_id}: {len(files)} files", got == files,
+                      f"missing {sorted(files.keys() - got.keys())}, extra {sorted(got.keys() - files.keys())}, "
+                      f"changed {sorted(p for p in files.keys() & got.keys() if files[p] != got[p])}")
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            check("integrity_check", integrity == "ok", integrity)
+            orphans = conn.execute("PRAGMA foreign_key_check").fetchall()
+            check("foreign_key_check", not orphans, str(orphans[:5]))
+        finally:
+            conn.close()
+    print()
+    return not failures
+
+
 # --- DEMO / TEST ---
-if __name__ == "__main__":
+def _ns(iso: str) -> int:
+    return int(datetime.fromisoformat(iso).timestamp()) * 10**9
+
+
+def demo():
     print("=== HADES DB - Init & Demo ===\n")
     init_db()
 
@@ -259,9 +1959,9 @@ if __name__ == "__main__":
     disk_id = get_or_create_disk("GRANIT", serial="SN-001", platform="darwin")
 
     fake_scan_1 = {
-        "/Volumes/GRANIT/Photos/img001.jpg": {"size": 3_200_000, "modified": "2024-01-10T10:00:00"},
-        "/Volumes/GRANIT/Photos/img002.jpg": {"size": 2_800_000, "modified": "2024-01-11T11:00:00"},
-        "/Volumes/GRANIT/Docs/notes.txt":    {"size": 12_000,    "modified": "2024-03-01T09:00:00"},
+        "/Volumes/GRANIT/Photos/img001.jpg": {"size": 3_200_000, "mtime_ns": _ns("2024-01-10T10:00:00")},
+        "/Volumes/GRANIT/Photos/img002.jpg": {"size": 2_800_000, "mtime_ns": _ns("2024-01-11T11:00:00")},
+        "/Volumes/GRANIT/Docs/notes.txt":    {"size": 12_000,    "mtime_ns": _ns("2024-03-01T09:00:00")},
     }
 
     last = get_last_version(disk_id)
@@ -280,9 +1980,9 @@ if __name__ == "__main__":
     # Simulate second scan with changes
     print("\n--- Simulating second scan with changes ---")
     fake_scan_2 = {
-        "/Volumes/GRANIT/Photos/img001.jpg": {"size": 3_200_000, "modified": "2024-01-10T10:00:00"},
-        "/Volumes/GRANIT/Photos/img003.jpg": {"size": 4_100_000, "modified": "2024-06-01T15:00:00"},  # new
-        "/Volumes/GRANIT/Docs/notes.txt":    {"size": 15_000,    "modified": "2024-06-15T12:00:00"},  # modified
+        "/Volumes/GRANIT/Photos/img001.jpg": {"size": 3_200_000, "mtime_ns": _ns("2024-01-10T10:00:00")},
+        "/Volumes/GRANIT/Photos/img003.jpg": {"size": 4_100_000, "mtime_ns": _ns("2024-06-01T15:00:00")},  # new
+        "/Volumes/GRANIT/Docs/notes.txt":    {"size": 15_000,    "mtime_ns": _ns("2024-06-15T12:00:00")},  # modified
         # img002 removed
     }
 
@@ -296,3 +1996,35 @@ if __name__ == "__main__":
         print("[HADES] No changes - skip.")
 
     status()
+    print_query_plans()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES database tools")
+    parser.add_argument("command", nargs="?", default="demo",
+                        choices=["demo", "status", "check-plans", "check-migrations", "backup", "verify-backups",
+                                 "restore", "maintenance"])
+    parser.add_argument("--gen", type=int, default=1, help="backup generation for restore (1 = newest)")
+    parser.add_argument("--compress", action="store_true", help="gzip older generations on backup")
+    parser.add_argument("--vacuum", action="store_true", help="maintenance: full VACUUM instead of incremental")
+    args = parser.parse_args()
+    if args.command == "maintenance":
+        init_db()
+        maintenance(vacuum=args.vacuum)
+    elif args.command == "backup":
+        init_db()
+        rotate_backup(compress=args.compress or None)
+    elif args.command == "verify-backups":
+        sys.exit(0 if verify_backups() else 1)
+    elif args.command == "restore":
+        restore_backup(args.gen)
+    elif args.command == "status":
+        init_db()
+        status()
+    elif args.command == "check-migrations":
+        sys.exit(0 if check_migrations() else 1)
+    elif args.command == "check-plans":
+        init_db()
+        sys.exit(0 if print_query_plans() else 1)
+    else:
+        demo()
@@ -0,0 +1,177 @@
+"""
+HADES v2 - hades_dupes.py
+Duplicate finder across disks: size groups (SQL) -> partial hash -> full hash
+Hashes are cached in the DB per (disk, path, size, mtime), shared with hades_checksum
+"""
+
+import os
+import sys
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_db import (
+    DUPE_CANDIDATES_SQL, DUPE_GROUPS_SQL, HASH_PARTIAL_SQL, HASH_FULL_SQL, HASH_PRUNE_SQL,
+    init_db, session, transaction, get_conn
+)
+from hades_scan import detect_disks, format_bytes
+from hades_checksum import file_digest
+
+DUPES_MIN_SIZE = 1024**2      # smaller files are not worth reclaiming
+PARTIAL_BYTES = 16 * 1024     # hashed from both ends of the file
+HASH_WORKERS = 4
+
+
+def partial_hash(path, size):
+    """blake2b of the first and last PARTIAL_BYTES (the whole file when it is shorter than both)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(PARTIAL_BYTES))
+        if size > 2 * PARTIAL_BYTES:
+            f.seek(size - PARTIAL_BYTES)
+        h.update(f.read())
+    return h.digest()
+
+
+def _readable(cand, mounts):
+    """Absolute path of a candidate on a mounted disk whose size/mtime still match the DB, else None."""
+    mount = mounts.get(cand["label"])
+    if mount is None:
+        return None
+    path = f"{mount}{cand['folder']}/{cand['name']}"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if st.st_size != cand["size"] or st.st_mtime_ns != cand["mtime_ns"]:
+        return None  # changed since the last scan: rescan first
+    return path
+
+
+def _hash_all(pool, fn, jobs):
+    """Run fn(*args) for [(cand, args)] on the pool, return [(cand, digest)] (unreadable files left out)."""
+    def run(job):
+        cand, args = job
+        try:
+            return cand, fn(*args)
+        except OSError:
+            return cand, None
+    return [(cand, digest) for cand, digest in pool.map(run, jobs) if digest is not None]
+
+
+def load_candidates(min_size):
+    """Size groups with more than one open file, as {size: [candidate dict]}."""
+    rows = get_conn().execute(DUPE_CANDIDATES_SQL, (min_size,)).fetchall()
+    rows.sort(key=lambda r: r[5])
+    return {
+        size: [{"disk_id": r[0], "label": r[1], "dir_id": r[2], "folder": r[3], "name": r[4],
+                "size": r[5], "mtime_ns": r[6], "partial": r[7], "digest": r[8]} for r in group]
+        for size, group in groupby(rows, key=lambda r: r[5])
+    }
+
+
+def find_dupes(min_size=DUPES_MIN_SIZE, workers=HASH_WORKERS, log=print):
+    """Refresh the hash cache for every duplicate candidate on the mounted disks.
+
+    Only files that still share a size after the SQL grouping are read, only
+    their two ends at first, and only files whose partial hashes collide are
+    read in full. Cached hashes are reused while size and mtime are unchanged.
+    Returns {partial, full} hash counts.
+    """
+    conn = get_conn()
+    with transaction(conn):
+        pruned = conn.execute(HASH_PRUNE_SQL).rowcount
+    if pruned:
+        log(f"[HADES] Dropped {pruned} hashes of files that are gone")
+
+    mounts = {d["label"]: str(d["mount_point"]) for d in detect_disks()}
+    groups = load_candidates(min_size)
+    log(f"[HADES] {sum(map(len, groups.values()))} candidates in {len(groups)} size groups"
+        f" | mounted: {', '.join(sorted(mounts)) or '—'}")
+
+    counts = {"partial": 0, "full": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 1. Partial hashes, only in size groups with two or more comparable files
+        jobs = []
+        for cands in groups.values():
+            for cand in cands:
+                cand["path"] = _readable(cand, mounts)
+            comparable = [c for c in cands if c["partial"] is not None or c["path"]]
+            if len(comparable) < 2:
+                continue
+            jobs += [(cand, (cand["path"], cand["size"])) for cand in comparable if cand["partial"] is None]
+        partials = _hash_all(pool, partial_hash, jobs)
+        now = datetime.now().isoformat()
+        with transaction(conn):
+            for cand, digest in partials:
+                cand["partial"] = digest
+                conn.execute(HASH_PARTIAL_SQL, (cand["disk_id"], cand["dir_id"], cand["name"],
+                                                cand["size"], cand["mtime_ns"], digest, now))
+        counts["partial"] = len(partials)
+
+        # 2. Full hashes, only where a partial hash is shared
+        jobs = []
+        for cands in groups.values():
+            by_partial = {}
+            for cand in cands:
+                if cand["partial"] is not None:
+                    by_partial.setdefault(cand["partial"], []).append(cand)
+            for same in by_partial.values():
+                if len(same) < 2:
+                    continue
+                jobs += [(cand, (cand["path"],)) for cand in same if cand["digest"] is None and cand["path"]]
+        digests = _hash_all(pool, file_digest, jobs)
+        now = datetime.now().isoformat()
+        with transaction(conn):
+            for cand, digest in digests:
+                conn.execute(HASH_FULL_SQL, (digest, now, cand["disk_id"], cand["dir_id"], cand["name"]))
+        counts["full"] = len(digests)
+
+    log(f"[HADES] Hashed {counts['partial']} partial, {counts['full']} full")
+    return counts
+
+
+def dupe_groups():
+    """Current duplicate groups from the hash cache, biggest reclaimable first.
+
+    [{digest, size, files: [(label, folder, name, mtime_ns)], reclaimable}];
+    a group whose other copies changed or vanished since hashing drops out.
+    """
+    groups = []
+    for (digest, size), rows in groupby(get_conn().execute(DUPE_GROUPS_SQL), key=lambda r: (r[0], r[4])):
+        files = [(label, folder, name, mtime_ns) for _, label, folder, name, _, mtime_ns in rows]
+        if len(files) > 1:
+            groups.append({"digest": digest, "size": size, "files": files, "reclaimable": size * (len(files) - 1)})
+    groups.sort(key=lambda g: g["reclaimable"], reverse=True)
+    return groups
+
+
+def print_dupes(groups, limit=20):
+    total = sum(g["reclaimable"] for g in groups)
+    print(f"\n=== HADES DUPLICATES: {len(groups)} groups | {format_bytes(total)} reclaimable ===")
+    for g in groups[:limit]:
+        print(f"\n♊ {len(g['files'])} x {format_bytes(g['size'])} | {format_bytes(g['reclaimable'])} reclaimable")
+        for label, folder, name, _ in g["files"]:
+            print(f"   💾 {label}: {folder}/{name}")
+    if len(groups) > limit:
+        print(f"\n   ... {len(groups) - limit} more groups (see the export sheet)")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES duplicate finder")
+    parser.add_argument("--min-size", type=float, default=DUPES_MIN_SIZE / 1024**2,
+                        help="ignore files smaller than this many MB")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="hashing threads")
+    parser.add_argument("--cached", action="store_true", help="report from the hash cache, read no files")
+    parser.add_argument("--limit", type=int, default=20, help="groups to print")
+    args = parser.parse_args()
+    with session():
+        init_db()
+        if not args.cached:
+            find_dupes(int(args.min_size * 1024**2), max(1, args.workers))
+        print_dupes(dupe_groups(), args.limit)
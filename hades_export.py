@@ -4,50 +4,61 @@ Excel dashboard export with charts, color coding, and disk sheets
 """
 
 import sys
-import sqlite3
+import csv
+import gzip
+import json
+import hashlib
+import shutil
+import zipfile
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
 from datetime import datetime
 from pathlib import Path
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import (
-    Font, PatternFill, Alignment, Border, Side
+    Font, PatternFill, Alignment, Border, Side, NamedStyle
 )
-from openpyxl.chart import BarChart, PieChart, Reference
+from openpyxl.chart import BarChart, LineChart, PieChart, Reference
 from openpyxl.chart.series import DataPoint
 from openpyxl.utils import get_column_letter
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+sys.path.insert(0, str(Path(__file__).parent))
+import hades_db
+from hades_db import (
+    VERSION_ENTRIES_SQL, VERSION_SHEET_SQL, DIFF_HISTORY_SQL, SIZE_BUCKET_LABELS, CAT_OTHER, METRICS_LOG,
+    init_db, session, get_conn, format_mtime,
+    get_top_dirs, get_top_files, get_size_histogram, get_category_stats, get_ext_stats, get_scan_trend,
+)
+from hades_metrics import Metrics, write_json_log
+from hades_dupes import dupe_groups
+from hades_checksum import get_mismatches
 
 HADES_DIR = Path.home() / "Desktop" / "HADES"
-DB_PATH = HADES_DIR / "hades.db"
 EXPORT_PATH = HADES_DIR / f"HADES_export_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
-
-def find_last_export():
-    """Megkeresi a legutóbbi export fájlt."""
-    exports = sorted(HADES_DIR.glob("HADES_export_*.xlsx"), reverse=True)
-    # Az éppen most generálandót kihagyjuk
-    for f in exports:
-        if f != EXPORT_PATH:
-            return f
-    return None
-
-def load_cached_sheets(last_export_path):
-    """Betölti a korábbi export sheet snapshot-jait (label -> version_id)."""
-    if not last_export_path:
-        return {}
-    try:
-        from openpyxl import load_workbook
-        wb = load_workbook(last_export_path, read_only=True)
-        cached = {}
-        for sheet in wb.sheetnames:
-            # A2 cellában van: "Scan: ... | N fájl | X GB"
-            if sheet.startswith("💾 "):
-                ws = wb[sheet]
-                label = sheet.replace("💾 ", "").strip()
-                a2 = ws["A2"].value or ""
-                cached[label] = a2  # snapshot string
-        wb.close()
-        return cached
-    except Exception as e:
-        print(f"[HADES] Cache betöltés sikertelen: {e}")
-        return {}
+# Disk sheet layout verzió: ha a sheet kinézete változik, emelni kell (régi cache érvénytelen)
+EXPORT_CACHE_FORMAT = 3
+# Excel sor limit; e fölött a disk sheet folytatás sheetekre bomlik
+SHEET_MAX_ROWS = 1_048_576
+SHEET_HEADER_ROWS = 4
+# CSV / Parquet export: ennyi sor jön egyszerre a DB kurzorról
+DATA_CHUNK_ROWS = 50_000
+DATA_GZIP_LEVEL = 6
+# Dashboard rollup szekciók (a save-kori dir_rollup / top fájl / hisztogram táblákból)
+DASH_TOP_DIRS = 5          # lemezenként
+DASH_DIR_DEPTH = 2         # /Mappa és /Mappa/Almappa szint
+DASH_TOP_FILES = 10        # összesen
+DASH_TOP_EXTS = 15         # összesen
+DASH_CHART_ROWS = 22       # ennyi sort takarnak a diagramok
+DASH_TREND_SCANS = 10      # scan idő trend: lemezenként az utolsó N scan (scan_metrics)
 
 # --- Colors ---
 C_HEADER_BG    = "1a1a2e"   # Sötétkék - fejléc háttér
@@ -65,18 +76,95 @@ def thin_border():
     s = Side(style="thin", color="CCCCCC")
     return Border(left=s, right=s, top=s, bottom=s)
 
-def header_style(cell, bg=C_HEADER_BG, fg=C_HEADER_FG, size=11, bold=True):
-    cell.font = Font(name="Arial", bold=bold, color=fg, size=size)
-    cell.fill = PatternFill("solid", start_color=bg)
-    cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    cell.border = thin_border()
-
-def data_style(cell, bold=False, color="000000", bg=None, align="left"):
-    cell.font = Font(name="Arial", bold=bold, color=color, size=10)
-    cell.alignment = Alignment(horizontal=align, vertical="center")
-    cell.border = thin_border()
-    if bg:
-        cell.fill = PatternFill("solid", start_color=bg)
+def _named(name, size=10, bold=False, italic=False, color="000000", bg=None, align="left",
+           wrap=False, indent=0, border=True, vertical="center"):
+    return NamedStyle(
+        name=name,
+        font=Font(name="Arial", bold=bold, italic=italic, color=color, size=size),
+        fill=PatternFill("solid", start_color=bg) if bg else PatternFill(),
+        alignment=Alignment(horizontal=align, vertical=vertical, wrap_text=wrap, indent=indent),
+        border=thin_border() if border else Border(),
+    )
+
+def header_named(name, bg=C_HEADER_BG, fg=C_HEADER_FG, size=11, bold=True):
+    return _named(name, size=size, bold=bold, color=fg, bg=bg, align="center", wrap=True)
+
+def named_styles():
+    """Minden cellastílus egyszer, névvel: a cellák csak hivatkoznak rájuk (nincs cellánkénti Font/Fill)."""
+    return [
+        _named("hades_title", size=16, bold=True, color="FFFFFF", bg=C_DASH_BG, align="center", border=False),
+        _named("hades_subtitle", size=9, italic=True, color="AAAAAA", bg=C_DASH_BG, align="center",
+               border=False, vertical=None),
+        _named("hades_sheet_title", size=14, bold=True, color="FFFFFF", bg=C_HEADER_BG, align="center", border=False),
+        _named("hades_history_title", size=14, bold=True, color="FFFFFF", bg=C_DASH_BG, align="center", border=False),
+        _named("hades_sheet_info", size=9, italic=True, color="666666", align="center", border=False, vertical=None),
+        header_named("hades_header"),
+        header_named("hades_header_accent", bg=C_ACCENT),
+        header_named("hades_header_purple", bg=C_PURPLE, size=12),
+        _named("hades_suggestion", color="333333", indent=1),
+        *[_named(f"hades_data_{align}_{bg}", bg=bg, align=align)
+          for align in ("left", "right", "center") for bg in ("FFFFFF", C_ROW_ALT)],
+        *[_named(f"hades_size_{bg}", bold=True, color="FFFFFF", bg=bg, align=align)
+          for bg, align in ((C_RED, "right"), (C_ORANGE, "right"))],
+        *[_named(f"hades_gb_{bg}", bold=True, color="FFFFFF", bg=bg, align="center")
+          for bg in (C_RED, C_ORANGE, C_GREEN, C_GRAY)],
+    ]
+
+_sheet_xml = None
+
+def sheet_xml_supported():
+    """Megvannak-e az openpyxl belsők (wb._cell_styles, ws._writer.out, cell._style), amikre
+    a sheet cache, a párhuzamos render és a gyors cellagyártás épül.
+
+    A requirements.txt a tesztelt openpyxl tartományra köt; ha egy másik verzióból
+    hiányoznak, az export cache és process pool nélkül, sima write-only írással fut.
+    """
+    global _sheet_xml
+    if _sheet_xml is None:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.close()
+        out = getattr(getattr(ws, "_writer", None), "out", None)
+        _sheet_xml = bool(hasattr(getattr(wb, "_cell_styles", None), "add") and out and Path(out).exists()
+                          and hasattr(WriteOnlyCell(ws), "_style"))
+        if out and Path(out).exists():
+            Path(out).unlink()
+    return _sheet_xml
+
+def add_named_styles(wb):
+    for style in named_styles():
+        wb.add_named_style(style)
+        # Fix cellXfs index minden stílusnak, használati sorrendtől függetlenül:
+        # így egy régi export sheet XML-jének s="N" hivatkozásai az újban is érvényesek
+        if sheet_xml_supported():
+            wb._cell_styles.add(style.as_tuple())
+
+def styled(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def data_cell(ws, value, bg="FFFFFF", align="left"):
+    return styled(ws, value, f"hades_data_{align}_{bg}")
+
+def style_cells(ws, names):
+    """name -> cellagyártó a forró ciklusnak: a névvel keresés egyszer fut, utána csak StyleArray másolás."""
+    if not sheet_xml_supported():
+        return {name: (lambda value, name=name: styled(ws, value, name)) for name in names}
+    def factory(style):
+        def make(value):
+            cell = WriteOnlyCell(ws, value=value)
+            cell._style = copy(style)
+            return cell
+        return make
+    return {name: factory(styled(ws, None, name)._style) for name in names}
+
+def merged_row(ws, row, value, style, last_col="H", height=None):
+    """Egy összevont (A:last_col) sor, a soron következő sorszámra."""
+    ws.merged_cells.add(f"A{row}:{last_col}{row}")
+    if height:
+        ws.row_dimensions[row].height = height
+    ws.append([styled(ws, value, style)])
 
 def size_color(gb):
     if gb >= 50:   return C_RED
@@ -91,8 +179,8 @@ def format_mb(b):
     return round(b / (1024**2), 2)
 
 def load_disk_data():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """Lemezek, legfrissebb verzió és history - a fájlokat build_disk_sheet olvassa kurzorról."""
+    c = get_conn().cursor()
 
     # Összes lemez
     c.execute("SELECT id, label, platform, last_seen FROM disks ORDER BY label")
@@ -109,72 +197,53 @@ def load_disk_data():
         ver = c.fetchone()
 
         # Változás history
-        c.execute("""
-            SELECT logged_at, added, removed, modified
-            FROM diff_log WHERE disk_id=?
-            ORDER BY logged_at DESC LIMIT 10
-        """, (disk_id,))
+        c.execute(DIFF_HISTORY_SQL, (disk_id,))
         diffs = c.fetchall()
 
-        # Fájlok legfrissebb verzióból
-        files = []
-        if ver:
-            c.execute("""
-                SELECT path, size_bytes, modified_at
-                FROM files WHERE version_id=?
-                ORDER BY size_bytes DESC
-            """, (ver[0],))
-            files = c.fetchall()
-
         result.append({
             "id": disk_id,
             "label": label,
             "platform": platform,
             "last_seen": last_seen,
             "version": ver,
-            "files": files,
-            "diffs": diffs
+            "diffs": diffs,
+            # Rollupok: a mentéskor számolt táblákból, lemezmérettől független idő alatt
+            "top_dirs": get_top_dirs(ver[0], DASH_DIR_DEPTH, DASH_TOP_DIRS) if ver else [],
+            "top_files": get_top_files(ver[0], DASH_TOP_FILES) if ver else [],
+            "histogram": get_size_histogram(ver[0]) if ver else [],
+            "categories": get_category_stats(ver[0]) if ver else [],
+            "extensions": get_ext_stats(ver[0]) if ver else [],
+            # Scan idők, a legrégebbi elöl (a trend diagramhoz)
+            "scans": get_scan_trend(disk_id, DASH_TREND_SCANS)[::-1],
         })
 
-    conn.close()
     return result
 
 
+def iter_disk_files(disk):
+    """A lemez legfrissebb verziójának fájljai kategóriával, méret szerint csökkenőben, kurzorról (nincs fetchall)."""
+    ver = disk["version"]
+    if not ver:
+        return iter(())
+    return get_conn().execute(VERSION_SHEET_SQL + " ORDER BY f.size_bytes DESC", (CAT_OTHER, ver[0]))
+
+
 def build_dashboard(wb, disks):
-    ws = wb.active
-    ws.title = "📊 Dashboard"
+    ws = wb.create_sheet(title="📊 Dashboard")
     ws.sheet_view.showGridLines = False
+    ws.freeze_panes = "A5"
+    for col, w in zip("ABCDEFGH", [16, 12, 12, 14, 14, 22, 14, 14]):
+        ws.column_dimensions[col].width = w
 
     # Cím
-    ws.merge_cells("A1:H1")
-    ws["A1"] = "🔱 HADES – Hard Disk Explorer & Storage"
-    ws["A1"].font = Font(name="Arial", bold=True, color="FFFFFF", size=16)
-    ws["A1"].fill = PatternFill("solid", start_color=C_DASH_BG)
-    ws["A1"].alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[1].height = 40
-
-    ws.merge_cells("A2:H2")
-    ws["A2"] = f"Generálva: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    ws["A2"].font = Font(name="Arial", color="AAAAAA", size=9, italic=True)
-    ws["A2"].fill = PatternFill("solid", start_color=C_DASH_BG)
-    ws["A2"].alignment = Alignment(horizontal="center")
-    ws.row_dimensions[2].height = 18
+    merged_row(ws, 1, "🔱 HADES – Hard Disk Explorer & Storage", "hades_title", height=40)
+    merged_row(ws, 2, f"Generálva: {datetime.now().strftime('%Y-%m-%d %H:%M')}", "hades_subtitle", height=18)
+    ws.append([])
 
     # Lemez összefoglaló fejléc
     headers = ["💾 Lemez", "Platform", "Fájlok", "Méret (GB)", "Szabad (est.)", "Utoljára látva", "Státusz", "Sheet"]
     ws.row_dimensions[4].height = 28
-    for i, h in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=i, value=h)
-        header_style(cell)
-
-    ws.column_dimensions["A"].width = 16
-    ws.column_dimensions["B"].width = 12
-    ws.column_dimensions["C"].width = 12
-    ws.column_dimensions["D"].width = 14
-    ws.column_dimensions["E"].width = 14
-    ws.column_dimensions["F"].width = 22
-    ws.column_dimensions["G"].width = 14
-    ws.column_dimensions["H"].width = 14
+    ws.append([styled(ws, h, "hades_header") for h in headers])
 
     total_files = 0
     total_bytes = 0
@@ -200,31 +269,21 @@ def build_dashboard(wb, disks):
             "✅ Aktív" if ver else "❌ Nem látott",
             f"→ {disk['label']}"
         ]
-        for j, v in enumerate(vals, 1):
-            cell = ws.cell(row=i, column=j, value=v)
-            data_style(cell, bg=bg if j != 4 else None)
-            if j == 4:
-                cell.fill = PatternFill("solid", start_color=col)
-                cell.font = Font(name="Arial", bold=True, color="FFFFFF", size=10)
-                cell.alignment = Alignment(horizontal="center", vertical="center")
+        ws.append([styled(ws, v, f"hades_gb_{col}") if j == 4 else data_cell(ws, v, bg)
+                   for j, v in enumerate(vals, 1)])
 
     # Összesítő sor
     sum_row = len(disks) + 5
     ws.row_dimensions[sum_row].height = 24
-    ws.merge_cells(f"A{sum_row}:B{sum_row}")
-    ws[f"A{sum_row}"] = "ÖSSZESEN"
-    header_style(ws[f"A{sum_row}"], bg=C_ACCENT)
-    ws[f"C{sum_row}"] = total_files
-    header_style(ws[f"C{sum_row}"], bg=C_ACCENT)
-    ws[f"D{sum_row}"] = format_gb(total_bytes)
-    header_style(ws[f"D{sum_row}"], bg=C_ACCENT)
+    ws.merged_cells.add(f"A{sum_row}:B{sum_row}")
+    ws.append([styled(ws, "ÖSSZESEN", "hades_header_accent"), None,
+               styled(ws, total_files, "hades_header_accent"),
+               styled(ws, format_gb(total_bytes), "hades_header_accent")])
+    ws.append([])
 
     # Javaslatok szekció
     jav_row = sum_row + 2
-    ws.merge_cells(f"A{jav_row}:H{jav_row}")
-    ws[f"A{jav_row}"] = "💡 JAVASLATOK"
-    header_style(ws[f"A{jav_row}"], bg=C_PURPLE, size=12)
-    ws.row_dimensions[jav_row].height = 28
+    merged_row(ws, jav_row, "💡 JAVASLATOK", "hades_header_purple", height=28)
 
     suggestions = []
     for disk in disks:
@@ -241,26 +300,28 @@ def build_dashboard(wb, disks):
         suggestions = ["✅ Minden lemez rendben – nincs kritikus figyelmeztetés."]
 
     for k, s in enumerate(suggestions, jav_row + 1):
-        ws.merge_cells(f"A{k}:H{k}")
-        ws[f"A{k}"] = s
-        ws[f"A{k}"].font = Font(name="Arial", size=10, color="333333")
-        ws[f"A{k}"].alignment = Alignment(horizontal="left", vertical="center", indent=1)
-        ws[f"A{k}"].border = thin_border()
-        ws.row_dimensions[k].height = 20
+        merged_row(ws, k, s, "hades_suggestion", height=20)
 
-    # --- PIE CHART ---
+    # --- Diagram adatok (J:K oszlop, a diagramok mellett) ---
     chart_row = jav_row + len(suggestions) + 3
+    for _ in range(chart_row - (jav_row + len(suggestions)) - 1):
+        ws.append([])
 
-    # Data for pie chart (hidden area)
+    # Pie: lemez -> GB, üres sor, bar: lemez -> fájlok
     data_start = chart_row
-    ws[f"J{data_start}"] = "Lemez"
-    ws[f"K{data_start}"] = "GB"
-    for idx, disk in enumerate(disks, 1):
+    bc_start = data_start + len(disks) + 2
+    pad = [None] * 9
+    ws.append(pad + ["Lemez", "GB"])
+    for disk in disks:
         ver = disk["version"]
-        gb = format_gb(ver[3]) if ver else 0
-        ws[f"J{data_start+idx}"] = disk["label"]
-        ws[f"K{data_start+idx}"] = gb
+        ws.append(pad + [disk["label"], format_gb(ver[3]) if ver else 0])
+    ws.append([])
+    ws.append(pad + ["Lemez", "Fájlok"])
+    for disk in disks:
+        ver = disk["version"]
+        ws.append(pad + [disk["label"], ver[2] if ver else 0])
 
+    # --- PIE CHART ---
     pie = PieChart()
     pie.title = "Lemezek méret szerint (GB)"
     pie.style = 10
@@ -281,127 +342,261 @@ def build_dashboard(wb, disks):
     bar.width = 14
     bar.height = 10
 
-    # Data for bar (hidden)
-    bc_start = data_start + len(disks) + 2
-    ws[f"J{bc_start}"] = "Lemez"
-    ws[f"K{bc_start}"] = "Fájlok"
-    for idx, disk in enumerate(disks, 1):
-        ver = disk["version"]
-        ws[f"J{bc_start+idx}"] = disk["label"]
-        ws[f"K{bc_start+idx}"] = ver[2] if ver else 0
-
     data_ref2 = Reference(ws, min_col=11, min_row=bc_start, max_row=bc_start+len(disks))
     labels_ref2 = Reference(ws, min_col=10, min_row=bc_start+1, max_row=bc_start+len(disks))
     bar.add_data(data_ref2, titles_from_data=True)
     bar.set_categories(labels_ref2)
     ws.add_chart(bar, f"E{chart_row}")
 
-    ws.freeze_panes = "A5"
+    # --- Rollup szekciók a diagramok alatt ---
+    row = bc_start + len(disks) + 1
+    section_row = max(chart_row + DASH_CHART_ROWS, row + 1)
+    for _ in range(section_row - row):
+        ws.append([])
+    row = build_rollup_sections(ws, disks, section_row)
+    if any(disk["scans"] for disk in disks):
+        ws.append([])
+        build_scan_trend(ws, disks, row + 1)
+
+
+def _wide_row(ws, row, first, wide, rest, bg):
+    """A | B:E összevonva | F G H adatsor."""
+    ws.merged_cells.add(f"B{row}:E{row}")
+    ws.append([data_cell(ws, first, bg), data_cell(ws, wide, bg), None, None, None]
+              + [data_cell(ws, v, bg, "right") for v in rest])
+
+
+def _section_header(ws, row, title, headers):
+    merged_row(ws, row, title, "hades_header_purple", height=28)
+    ws.merged_cells.add(f"B{row+1}:E{row+1}")
+    ws.row_dimensions[row + 1].height = 22
+    ws.append([styled(ws, headers[0], "hades_header"), styled(ws, headers[1], "hades_header"), None, None, None]
+              + [styled(ws, h, "hades_header") for h in headers[2:]])
+    return row + 2
+
+
+def build_rollup_sections(ws, disks, row):
+    """Top mappák, legnagyobb fájlok, méret eloszlás, kategóriák - fájlszintű lekérdezés nélkül."""
+    # Top mappák lemezenként
+    row = _section_header(ws, row, "📁 TOP MAPPÁK",
+                          ["💾 Lemez", "Mappa", "Fájlok", "Méret (GB)", "Lemez %"])
+    for disk in disks:
+        ver = disk["version"]
+        for path, count, total, _depth in disk["top_dirs"]:
+            bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+            share = round(100 * total / ver[3], 1) if ver[3] else 0
+            _wide_row(ws, row, disk["label"], path, [count, format_gb(total), share], bg)
+            row += 1
+    ws.append([])
+    row += 1
+
+    # Legnagyobb fájlok az összes lemezen
+    row = _section_header(ws, row, "🐘 LEGNAGYOBB FÁJLOK",
+                          ["💾 Lemez", "Fájl", "Módosítva", "Méret (GB)", "Lemez %"])
+    top_files = sorted(((size, disk["label"], disk["version"][3], folder, name, mtime_ns)
+                        for disk in disks for folder, name, size, mtime_ns in disk["top_files"]),
+                       key=lambda f: f[0], reverse=True)[:DASH_TOP_FILES]
+    for size, label, disk_bytes, folder, name, mtime_ns in top_files:
+        bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+        share = round(100 * size / disk_bytes, 1) if disk_bytes else 0
+        _wide_row(ws, row, label, f"{folder}/{name}", [format_mtime(mtime_ns), format_gb(size), share], bg)
+        row += 1
+    ws.append([])
+    row += 1
+
+    # Méret eloszlás (összes lemez)
+    row = _section_header(ws, row, "📏 MÉRET ELOSZLÁS",
+                          ["Méret", "Eloszlás (byte)", "Fájlok", "Méret (GB)", "Méret %"])
+    counts = [0] * len(SIZE_BUCKET_LABELS)
+    totals = [0] * len(SIZE_BUCKET_LABELS)
+    for disk in disks:
+        for bucket, count, total in disk["histogram"]:
+            counts[bucket] += count
+            totals[bucket] += total
+    all_bytes = sum(totals)
+    for bucket, label in enumerate(SIZE_BUCKET_LABELS):
+        bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+        share = round(100 * totals[bucket] / all_bytes, 1) if all_bytes else 0
+        _wide_row(ws, row, label, "█" * round(share / 2.5), [counts[bucket], format_gb(totals[bucket]), share], bg)
+        row += 1
+    ws.append([])
+    row += 1
+
+    # Kategóriák lemezenként + összesen (ext_rollup x extensions, SQL-ben összegezve)
+    row = _section_header(ws, row, "🗂️ KATEGÓRIÁK",
+                          ["💾 Lemez", "Kategória", "Fájlok", "Méret (GB)", "Lemez %"])
+    all_cats = {}
+    for disk in disks:
+        ver = disk["version"]
+        for cat, count, total in disk["categories"]:
+            bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+            share = round(100 * total / ver[3], 1) if ver[3] else 0
+            _wide_row(ws, row, disk["label"], cat, [count, format_gb(total), share], bg)
+            row += 1
+            prev = all_cats.get(cat, (0, 0))
+            all_cats[cat] = (prev[0] + count, prev[1] + total)
+    for cat, (count, total) in sorted(all_cats.items(), key=lambda c: c[1][1], reverse=True):
+        bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+        share = round(100 * total / all_bytes, 1) if all_bytes else 0
+        _wide_row(ws, row, "Σ Összesen", cat, [count, format_gb(total), share], bg)
+        row += 1
+    ws.append([])
+    row += 1
+
+    # Top kiterjesztések az összes lemezen
+    row = _section_header(ws, row, "🔤 TOP KITERJESZTÉSEK",
+                          ["Kiterjesztés", "Kategória", "Fájlok", "Méret (GB)", "Méret %"])
+    all_exts = {}
+    for disk in disks:
+        for ext, cat, count, total in disk["extensions"]:
+            prev = all_exts.get(ext, (cat, 0, 0))
+            all_exts[ext] = (cat, prev[1] + count, prev[2] + total)
+    top_exts = sorted(all_exts.items(), key=lambda e: e[1][2], reverse=True)[:DASH_TOP_EXTS]
+    for ext, (cat, count, total) in top_exts:
+        bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+        share = round(100 * total / all_bytes, 1) if all_bytes else 0
+        _wide_row(ws, row, ext or "(nincs)", cat, [count, format_gb(total), share], bg)
+        row += 1
+    return row
+
+
+def build_scan_trend(ws, disks, row):
+    """Scan idők lemezenként (scan_metrics): táblázat + vonaldiagram, adatai a J oszloptól."""
+    row = _section_header(ws, row, "⏱️ SCAN IDŐK",
+                          ["💾 Lemez", "Scan (mód)", "Idő (s)", "Fájl/s", "Mentés (s)"])
+    for disk in disks:
+        for started_at, mode, seconds, files, _walk, _diff, save in disk["scans"]:
+            bg = C_ROW_ALT if row % 2 == 0 else "FFFFFF"
+            rate = round(files / seconds) if files and seconds else 0
+            _wide_row(ws, row, disk["label"], f"{started_at[:16].replace('T', ' ')} ({mode})",
+                      [round(seconds, 2), rate, round(save or 0, 2)], bg)
+            row += 1
+    ws.append([])
+    row += 1
+
+    # Diagram adat: sor = az N. legutóbbi scan, oszlop = lemez
+    scanned = [disk for disk in disks if disk["scans"]]
+    n = max(len(disk["scans"]) for disk in scanned)
+    pad = [None] * 9
+    ws.append(pad + ["Scan"] + [disk["label"] for disk in scanned])
+    for i in range(n):
+        ws.append(pad + [i + 1] + [_trend_value(disk["scans"], n, i) for disk in scanned])
+
+    chart = LineChart()
+    chart.title = "Scan idő lemezenként (s)"
+    chart.style = 10
+    chart.width = 22
+    chart.height = 10
+    chart.y_axis.title = "s"
+    chart.x_axis.title = f"utolsó {n} scan"
+    data_ref = Reference(ws, min_col=11, max_col=10 + len(scanned), min_row=row, max_row=row + n)
+    chart.add_data(data_ref, titles_from_data=True)
+    chart.set_categories(Reference(ws, min_col=10, min_row=row + 1, max_row=row + n))
+    ws.add_chart(chart, f"A{row}")
+
+
+def _trend_value(scans, n, i):
+    """Jobbra igazítva: a rövidebb historyjú lemez pontjai is a legutóbbi scanekhez esnek."""
+    k = i - (n - len(scans))
+    return round(scans[k][2], 2) if k >= 0 else None
+
+
+def disk_snapshot(ver):
+    """A disk sheet A2 sora: 'Scan: ... | N fájl | X GB'."""
+    return f"Scan: {ver[1][:19] if ver else '—'} | {ver[2] if ver else 0} fájl | {format_gb(ver[3]) if ver else 0} GB"
 
 
-def build_disk_sheet(wb, disk):
+def disk_sheet_title(label, part=1):
+    return f"💾 {label}" if part == 1 else f"💾 {label} ({part})"
+
+
+def start_disk_sheet(wb, disk, part=1):
+    """Üres disk sheet fejléccel; part > 1 a folytatás sheetek (Excel sor limit felett)."""
     label = disk["label"]
-    ws = wb.create_sheet(title=f"💾 {label}")
+    ws = wb.create_sheet(title=disk_sheet_title(label, part))
     ws.sheet_view.showGridLines = False
+    ws.freeze_panes = "A5"
+    # Adatsorok magassága: alapértelmezett sormagasság, nem soronkénti dimenzió
+    ws.sheet_format.defaultRowHeight = 18
+    ws.sheet_format.customHeight = True
 
-    # Fejléc
-    ws.merge_cells("A1:F1")
-    ws["A1"] = f"💾 {label} – Fájl index"
-    ws["A1"].font = Font(name="Arial", bold=True, color="FFFFFF", size=14)
-    ws["A1"].fill = PatternFill("solid", start_color=C_HEADER_BG)
-    ws["A1"].alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[1].height = 36
+    cols = ["#", "Fájlnév", "Mappa", "Méret (MB)", "Módosítva", "Kategória"]
+    widths = [6, 35, 45, 14, 20, 14]
+    for i, w in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = w
 
-    ver = disk["version"]
-    ws.merge_cells("A2:F2")
-    ws["A2"] = f"Scan: {ver[1][:19] if ver else '—'} | {ver[2] if ver else 0} fájl | {format_gb(ver[3]) if ver else 0} GB"
-    ws["A2"].font = Font(name="Arial", color="666666", size=9, italic=True)
-    ws["A2"].alignment = Alignment(horizontal="center")
-    ws.row_dimensions[2].height = 16
+    # Fejléc
+    title = f"💾 {label} – Fájl index" + (f" ({part}. rész)" if part > 1 else "")
+    merged_row(ws, 1, title, "hades_sheet_title", last_col="F", height=36)
+    merged_row(ws, 2, disk_snapshot(disk["version"]), "hades_sheet_info", last_col="F", height=16)
+    ws.append([])
 
     # Oszlop fejlécek
-    cols = ["#", "Fájlnév", "Mappa", "Méret (MB)", "Módosítva", "Kategória"]
-    widths = [6, 35, 45, 14, 20, 14]
     ws.row_dimensions[4].height = 26
-    for i, (h, w) in enumerate(zip(cols, widths), 1):
-        cell = ws.cell(row=4, column=i, value=h)
-        header_style(cell)
-        ws.column_dimensions[get_column_letter(i)].width = w
+    ws.append([styled(ws, h, "hades_header") for h in cols])
+    return ws
+
+
+def build_disk_sheet(wb, disk, max_rows=None):
+    """Streamelt disk sheet: soronként íródik ki, a fájlok a DB kurzorról jönnek.
+
+    Ha a fájlok nem férnek el max_rows sorban, számozott folytatás sheetek
+    jönnek létre ("💾 LABEL (2)", ...), a # oszlop folyamatosan számoz.
+    Visszaadja a létrehozott sheeteket.
+    """
+    per_sheet = (max_rows or SHEET_MAX_ROWS) - SHEET_HEADER_ROWS
+    ws = start_disk_sheet(wb, disk)
+    sheets = [ws]
 
     # Fájlok
-    for idx, (path, size, modified) in enumerate(disk["files"], 1):
-        row = idx + 4
-        ws.row_dimensions[row].height = 18
+    cell = style_cells(ws, [f"hades_data_{align}_{bg}" for align in ("left", "right") for bg in ("FFFFFF", C_ROW_ALT)]
+                       + [f"hades_size_{C_RED}", f"hades_size_{C_ORANGE}"])
+    rows = 0
+    for idx, (folder, filename, size, mtime_ns, cat) in enumerate(iter_disk_files(disk), 1):
+        if rows == per_sheet:
+            ws.auto_filter.ref = f"A4:F{rows+4}"
+            ws = start_disk_sheet(wb, disk, len(sheets) + 1)
+            sheets.append(ws)
+            rows = 0
+        rows += 1
         bg = C_ROW_ALT if idx % 2 == 0 else "FFFFFF"
+        left, right = cell[f"hades_data_left_{bg}"], cell[f"hades_data_right_{bg}"]
 
-        p = Path(path)
-        filename = p.name
-        folder = str(p.parent)
+        # Mappa és fájlnév külön jön a DB-ből (dirs tábla), nincs Path bontás
+        folder = folder or "/"
         mb = format_mb(size)
 
-        # Kategória
-        ext = p.suffix.lower()
-        if ext in [".jpg", ".jpeg", ".png", ".gif", ".heic", ".raw", ".cr2"]:
-            cat = "📷 Kép"
-        elif ext in [".mp4", ".mov", ".avi", ".mkv"]:
-            cat = "🎬 Videó"
-        elif ext in [".mp3", ".flac", ".wav", ".aac"]:
-            cat = "🎵 Zene"
-        elif ext in [".pdf", ".doc", ".docx", ".txt", ".pages"]:
-            cat = "📄 Dokument"
-        elif ext in [".zip", ".rar", ".tar", ".gz", ".7z"]:
-            cat = "📦 Archív"
-        elif ext in [".py", ".sh", ".js", ".ts", ".html", ".css"]:
-            cat = "💻 Kód"
-        else:
-            cat = "📁 Egyéb"
-
         # Méret szín
         gb = mb / 1024
-        col_bg = None
-        col_fg = "000000"
         if gb >= 50:
-            col_bg = C_RED
-            col_fg = "FFFFFF"
+            size_cell = cell[f"hades_size_{C_RED}"](mb)
         elif gb >= 20:
-            col_bg = C_ORANGE
-            col_fg = "FFFFFF"
-
-        vals = [idx, filename, folder, mb, modified[:19] if modified else "—", cat]
-        for j, v in enumerate(vals, 1):
-            cell = ws.cell(row=row, column=j, value=v)
-            if j == 4 and col_bg:
-                cell.fill = PatternFill("solid", start_color=col_bg)
-                cell.font = Font(name="Arial", bold=True, color=col_fg, size=10)
-                cell.alignment = Alignment(horizontal="right", vertical="center")
-                cell.border = thin_border()
-            else:
-                data_style(cell, bg=bg, align="right" if j in [1, 4] else "left")
-
-    # AutoFilter
-    ws.auto_filter.ref = f"A4:F{len(disk['files'])+4}"
-    ws.freeze_panes = "A5"
+            size_cell = cell[f"hades_size_{C_ORANGE}"](mb)
+        else:
+            size_cell = right(mb)
+
+        ws.append([right(idx), left(filename), left(folder), size_cell, left(format_mtime(mtime_ns)), left(cat)])
+
+    # AutoFilter (a sheet zárásakor íródik ki)
+    ws.auto_filter.ref = f"A4:F{rows+4}"
+    return sheets
 
 
 def build_history_sheet(wb, disks):
     ws = wb.create_sheet(title="📈 Változás history")
     ws.sheet_view.showGridLines = False
-
-    ws.merge_cells("A1:G1")
-    ws["A1"] = "📈 HADES – Változás history"
-    ws["A1"].font = Font(name="Arial", bold=True, color="FFFFFF", size=14)
-    ws["A1"].fill = PatternFill("solid", start_color=C_DASH_BG)
-    ws["A1"].alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[1].height = 36
+    ws.freeze_panes = "A4"
 
     headers = ["Lemez", "Időpont", "➕ Hozzáadva", "➖ Törölve", "🔄 Módosítva", "Összesen változás", "Trend"]
     widths = [16, 22, 16, 16, 16, 20, 14]
-    ws.row_dimensions[3].height = 26
-    for i, (h, w) in enumerate(zip(headers, widths), 1):
-        cell = ws.cell(row=3, column=i, value=h)
-        header_style(cell)
+    for i, w in enumerate(widths, 1):
         ws.column_dimensions[get_column_letter(i)].width = w
 
+    merged_row(ws, 1, "📈 HADES – Változás history", "hades_history_title", last_col="G", height=36)
+    ws.append([])
+    ws.row_dimensions[3].height = 26
+    ws.append([styled(ws, h, "hades_header") for h in headers])
+
     row = 4
     for disk in disks:
         for logged_at, added, removed, modified in disk["diffs"]:
@@ -411,58 +606,204 @@ def build_history_sheet(wb, disks):
             trend = "📈 Növekedés" if added > removed else ("📉 Csökkenés" if removed > added else "➡️ Stabil")
 
             vals = [disk["label"], logged_at[:19], added, removed, modified, total, trend]
-            for j, v in enumerate(vals, 1):
-                cell = ws.cell(row=row, column=j, value=v)
-                data_style(cell, bg=bg, align="center" if j > 1 else "left")
+            ws.append([data_cell(ws, v, bg, "center" if j > 1 else "left") for j, v in enumerate(vals, 1)])
             row += 1
 
     if row > 4:
         ws.auto_filter.ref = f"A3:G{row-1}"
-    ws.freeze_panes = "A4"
 
 
-def copy_sheet_from_workbook(src_path, src_title, dst_wb):
-    """Átmásol egy sheetet a régi exportból az újba."""
+def build_dupes_sheet(wb, groups):
+    """Duplikátum csoportok (hades_dupes hash cache): csoportonként a felszabadítható méret az első sorban."""
+    ws = wb.create_sheet(title="♊ Duplikátumok")
+    ws.sheet_view.showGridLines = False
+    ws.freeze_panes = "A5"
+    ws.sheet_format.defaultRowHeight = 18
+    ws.sheet_format.customHeight = True
+
+    cols = ["♊", "Lemez", "Mappa", "Fájlnév", "Méret (MB)", "Módosítva", "Felszabadítható (MB)"]
+    widths = [6, 16, 45, 35, 14, 20, 20]
+    for i, w in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = w
+
+    reclaimable = sum(g["reclaimable"] for g in groups)
+    files = sum(len(g["files"]) for g in groups)
+    merged_row(ws, 1, "♊ HADES – Duplikátumok", "hades_sheet_title", last_col="G", height=36)
+    merged_row(ws, 2, f"{len(groups)} csoport | {files} fájl | felszabadítható: {format_gb(reclaimable)} GB",
+               "hades_sheet_info", last_col="G", height=16)
+    ws.append([])
+    ws.row_dimensions[4].height = 26
+    ws.append([styled(ws, h, "hades_header") for h in cols])
+
+    cell = style_cells(ws, [f"hades_data_{align}_{bg}" for align in ("left", "right") for bg in ("FFFFFF", C_ROW_ALT)])
+    rows = 0
+    for num, group in enumerate(groups, 1):
+        if rows + len(group["files"]) > SHEET_MAX_ROWS - SHEET_HEADER_ROWS:
+            print(f"[HADES] ✂️  Duplikátumok: {len(groups) - num + 1} csoport nem fért a sheetre")
+            break
+        bg = C_ROW_ALT if num % 2 == 0 else "FFFFFF"
+        left, right = cell[f"hades_data_left_{bg}"], cell[f"hades_data_right_{bg}"]
+        mb = format_mb(group["size"])
+        for i, (label, folder, name, mtime_ns) in enumerate(group["files"]):
+            saved = right(format_mb(group["reclaimable"])) if i == 0 else left(None)
+            ws.append([right(num), left(label), left(folder or "/"), left(name), right(mb),
+                       left(format_mtime(mtime_ns)), saved])
+        rows += len(group["files"])
+    ws.auto_filter.ref = f"A4:G{rows+4}"
+
+
+def build_mismatch_sheet(wb, mismatches):
+    """Checksum eltérések (hades_checksum): változatlan méret és mtime mellett megváltozott tartalom."""
+    ws = wb.create_sheet(title="🧬 Checksum hibák")
+    ws.sheet_view.showGridLines = False
+    ws.freeze_panes = "A5"
+    ws.sheet_format.defaultRowHeight = 18
+    ws.sheet_format.customHeight = True
+
+    cols = ["Lemez", "Mappa", "Fájlnév", "Méret (MB)", "Módosítva", "Észlelve", "Állapot", "Várt hash", "Kapott hash"]
+    widths = [16, 45, 35, 14, 20, 20, 22, 20, 20]
+    for i, w in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = w
+
+    bad = sum(1 for m in mismatches if m[8])
+    merged_row(ws, 1, "🧬 HADES – Checksum hibák (bit-rot)", "hades_sheet_title", last_col="I", height=36)
+    merged_row(ws, 2, f"{len(mismatches)} eltérés | ebből {bad} fájl most is sérült",
+               "hades_sheet_info", last_col="I", height=16)
+    ws.append([])
+    ws.row_dimensions[4].height = 26
+    ws.append([styled(ws, h, "hades_header") for h in cols])
+
+    for i, (label, folder, name, size, mtime_ns, expected, actual, detected_at, still_same) in enumerate(mismatches, 1):
+        bg = C_ROW_ALT if i % 2 == 0 else "FFFFFF"
+        state = "❌ Sérült" if still_same else "➡️ Azóta változott"
+        vals = [label, folder or "/", name, format_mb(size), format_mtime(mtime_ns), detected_at[:19], state,
+                expected.hex()[:16], actual.hex()[:16]]
+        ws.append([data_cell(ws, v, bg, "right" if j == 4 else "left") for j, v in enumerate(vals, 1)])
+    ws.auto_filter.ref = f"A4:I{len(mismatches)+4}"
+
+
+# --- Export cache ---
+# Az export mellé egy manifest (.json) kerül: melyik sheet melyik scan_versions.id-ből
+# készült és melyik XML part-ban van. Változatlan lemeznél a part nyersen átkerül az
+# új xlsx-be, parse-olás nélkül.
+
+def manifest_path(xlsx_path):
+    return xlsx_path.with_suffix(".json")
+
+
+def find_last_export():
+    """A legutóbbi export, aminek van manifestje (az éppen felülírandó is jó: előbb olvasunk)."""
+    for f in sorted(HADES_DIR.glob("HADES_export_*.xlsx"), reverse=True):
+        if manifest_path(f).exists():
+            return f
+    return None
+
+
+def category_hash():
+    """Az extensions tábla (kiterjesztés -> kategória) lenyomata: a disk sheet Kategória oszlopa ebből jön."""
+    rows = get_conn().execute("SELECT ext, category FROM extensions ORDER BY ext").fetchall()
+    return hashlib.blake2b(json.dumps([CAT_OTHER, rows], ensure_ascii=False).encode(), digest_size=8).hexdigest()
+
+
+def load_manifest(xlsx_path, categories):
+    """label -> {version_id, parts: [{part, filter}]}; üres, ha a manifest hiányzik, régi, az xlsx azóta
+    módosult, vagy más kategória beosztással készült (categories: category_hash())."""
+    if not xlsx_path:
+        return {}
+    try:
+        manifest = json.loads(manifest_path(xlsx_path).read_text())
+        stat = xlsx_path.stat()
+    except (OSError, ValueError) as e:
+        print(f"[HADES] Cache manifest hiba: {e}")
+        return {}
+    # Excelben újramentett fájl: a stílus indexek már nem a mieink
+    if (manifest.get("format") != EXPORT_CACHE_FORMAT
+            or manifest.get("size") != stat.st_size or manifest.get("mtime_ns") != stat.st_mtime_ns):
+        return {}
+    # EXT_CATEGORIES szerkesztése után a version_id ugyanaz, de a Kategória oszlop már nem
+    if manifest.get("categories") != categories:
+        print("[HADES] Cache: a kategóriák változtak, minden sheet újraépül")
+        return {}
+    return manifest.get("sheets", {})
+
+
+def save_manifest(xlsx_path, disks, disk_sheets, categories):
+    sheets = {}
+    for disk in disks:
+        ver = disk["version"]
+        if ver:
+            sheets[disk["label"]] = {
+                "version_id": ver[0],
+                "parts": [{"part": ws.path[1:], "filter": ws.auto_filter.ref} for ws in disk_sheets[disk["label"]]],
+            }
+    stat = xlsx_path.stat()
+    manifest = {"format": EXPORT_CACHE_FORMAT, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "categories": categories, "sheets": sheets}
+    manifest_path(xlsx_path).write_text(json.dumps(manifest, ensure_ascii=False, indent=1))
+
+
+def attach_sheet_xml(wb, title, f_in, filter_ref):
+    """Kész worksheet XML (fájlobjektum) beillesztése egy üres write-only sheet helyére."""
+    ws = wb.create_sheet(title=title)
+    # Üres sheet lezárva: a temp fájlját a mentés változtatás nélkül a zip-be írja
+    ws.close()
+    with open(ws._writer.out, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024**2)
+    # A workbook.xml _FilterDatabase neve a sheet objektumból jön, nem az XML-ből
+    ws.auto_filter.ref = filter_ref
+    return ws
+
+
+def splice_cached_sheet(wb, disk, src_path, hit):
+    """A régi export sheet XML-jeit nyersen beteszi az új workbookba. None, ha nincs meg."""
     try:
-        from openpyxl import load_workbook
-        src_wb = load_workbook(src_path)
-        if src_title not in src_wb.sheetnames:
-            return False
-        src_ws = src_wb[src_title]
-        dst_ws = dst_wb.create_sheet(title=src_title)
-        for row in src_ws.iter_rows():
-            for cell in row:
-                dst_cell = dst_ws.cell(row=cell.row, column=cell.column, value=cell.value)
-                if cell.has_style:
-                    dst_cell.font = cell.font.copy()
-                    dst_cell.fill = cell.fill.copy()
-                    dst_cell.border = cell.border.copy()
-                    dst_cell.alignment = cell.alignment.copy()
-        # Merged cells
-        for merge in src_ws.merged_cells.ranges:
-            dst_ws.merge_cells(str(merge))
-        # Column widths
-        for col, dim in src_ws.column_dimensions.items():
-            dst_ws.column_dimensions[col].width = dim.width
-        # Row heights
-        for row, dim in src_ws.row_dimensions.items():
-            dst_ws.row_dimensions[row].height = dim.height
-        # Freeze
-        if src_ws.freeze_panes:
-            dst_ws.freeze_panes = src_ws.freeze_panes
-        # AutoFilter
-        if src_ws.auto_filter.ref:
-            dst_ws.auto_filter.ref = src_ws.auto_filter.ref
-        src_wb.close()
-        return True
-    except Exception as e:
-        print(f"[HADES] Sheet másolás hiba ({src_title}): {e}")
-        return False
-
-
-def export():
+        with zipfile.ZipFile(src_path) as src:
+            for part in hit["parts"]:
+                src.getinfo(part["part"])
+            sheets = []
+            for i, part in enumerate(hit["parts"], 1):
+                with src.open(part["part"]) as f_in:
+                    sheets.append(attach_sheet_xml(wb, disk_sheet_title(disk["label"], i), f_in, part["filter"]))
+        return sheets
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        print(f"[HADES] Cache olvasás sikertelen ({disk['label']}): {e}")
+        return None
+
+
+def render_disk_sheet(disk, out_dir, db_path, max_rows=None):
+    """Process pool worker: a disk sheet(ek) önálló XML part-ként out_dir-be, [(fájl, autofilter ref)] vissza.
+
+    Saját DB kapcsolat (db_path: a szülő DB-je; spawn alatt a modul újratöltődik,
+    a szülőben átállított DB_PATH nem öröklődik) és saját workbook, ugyanazokkal
+    a rögzített stílus indexekkel, így az XML változtatás nélkül beilleszthető a fő workbookba.
+    """
+    hades_db.DB_PATH = Path(db_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir()
+    parts = []
+    with session():
+        wb = Workbook(write_only=True)
+        add_named_styles(wb)
+        for i, ws in enumerate(build_disk_sheet(wb, disk, max_rows), 1):
+            ws.close()
+            out_path = out_dir / f"part{i}.xml"
+            shutil.move(ws._writer.out, out_path)
+            parts.append((out_path, ws.auto_filter.ref))
+    return parts
+
+
+def export(jobs=1):
+    # Egy kapcsolat az egész exporthoz (WAL: scan közben is olvasható)
+    with session():
+        init_db()
+        _export(jobs)
+
+
+def _export(jobs=1):
+    metrics = Metrics("export")
     print(f"\n[HADES] Loading database...")
-    disks = load_disk_data()
+    with metrics.phase("load"):
+        disks = load_disk_data()
 
     if not disks:
         print("[HADES] No data in database!")
@@ -470,45 +811,190 @@ def export():
 
     print(f"[HADES] Found {len(disks)} disks")
 
-    wb = Workbook()
+    # Write-only workbook: a sorok azonnal a fájlba mennek, lemezenként
+    wb = Workbook(write_only=True)
+    add_named_styles(wb)
 
-    # Cache betöltés
+    # Cache: előző export + manifest
     last_export = find_last_export()
-    cached_sheets = load_cached_sheets(last_export)
+    categories = category_hash()
+    cached = load_manifest(last_export, categories)
+    if not sheet_xml_supported():
+        print("[HADES] Cache: ez az openpyxl nem támogatja a sheet XML cache-t, minden sheet újraépül")
+        last_export, cached, jobs = None, {}, 1
     if last_export:
-        print(f"[HADES] Cache: {last_export.name} ({len(cached_sheets)} cached sheet)")
-
-    # 1. Dashboard
-    print("[HADES] Building Dashboard...")
-    build_dashboard(wb, disks)
+        print(f"[HADES] Cache: {last_export.name} ({len(cached)} cached sheet)")
+
+    def cache_hit(disk):
+        hit = cached.get(disk["label"])
+        return hit if disk["version"] and hit and hit["version_id"] == disk["version"][0] else None
+
+    # Változott lemezek sheetjei párhuzamosan, külön processzekben (spawn: a szülő DB kapcsolata nem öröklődik)
+    changed = [disk for disk in disks if not cache_hit(disk)]
+    jobs = min(jobs, len(changed))
+    pool, futures, tmp_dir = None, {}, None
+    if jobs > 1:
+        tmp_dir = Path(tempfile.mkdtemp(prefix="hades_export_"))
+        pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+        print(f"[HADES] Rendering {len(changed)} sheets on {jobs} processes...")
+        for i, disk in enumerate(changed):
+            futures[disk["label"]] = pool.submit(render_disk_sheet, disk, tmp_dir / f"disk{i}", str(hades_db.DB_PATH),
+                                                   SHEET_MAX_ROWS)
+
+    disk_sheets = {}
+    try:
+        # 1. Dashboard
+        print("[HADES] Building Dashboard...")
+        with metrics.phase("dashboard"):
+            build_dashboard(wb, disks)
+
+        # 2. Lemezenként sheet - változatlan verziónál a régi XML, különben streamelve a DB kurzorról
+        for disk in disks:
+            label = disk["label"]
+            ver = disk["version"]
+            hit = cache_hit(disk)
+            with metrics.phase("sheets"):
+                sheets = splice_cached_sheet(wb, disk, last_export, hit) if hit else None
+                if sheets:
+                    print(f"[HADES] ♻️  Sheet unchanged (v{ver[0]}), reusing cache: {label}")
+                    metrics.count("sheets_cached")
+                elif label in futures:
+                    sheets = []
+                    for i, (part, filter_ref) in enumerate(futures[label].result(), 1):
+                        with open(part, "rb") as f_in:
+                            sheets.append(attach_sheet_xml(wb, disk_sheet_title(label, i), f_in, filter_ref))
+                    print(f"[HADES] 🔄 Sheet rendered: {label} ({ver[2] if ver else 0} files)")
+                    metrics.count("sheets_built")
+                else:
+                    print(f"[HADES] 🔄 Building sheet: {label} ({ver[2] if ver else 0} files)...")
+                    sheets = build_disk_sheet(wb, disk)
+                    metrics.count("sheets_built")
+            metrics.count("rows", ver[2] if ver else 0)
+            if len(sheets) > 1:
+                print(f"[HADES] ✂️  {label}: {len(sheets)} sheetre bontva (Excel sor limit)")
+            disk_sheets[label] = sheets
+
+        with metrics.phase("extra sheets"):
+            # 3. Duplikátumok (ha hades_dupes már talált)
+            groups = dupe_groups()
+            if groups:
+                print(f"[HADES] Building Duplicates sheet ({len(groups)} groups)...")
+                build_dupes_sheet(wb, groups)
+
+            # 4. Checksum hibák (ha hades_checksum talált)
+            mismatches = get_mismatches()
+            if mismatches:
+                print(f"[HADES] Building Checksum sheet ({len(mismatches)} mismatches)...")
+                build_mismatch_sheet(wb, mismatches)
+
+            # 5. History
+            print("[HADES] Building History sheet...")
+            build_history_sheet(wb, disks)
+
+        with metrics.phase("save"):
+            wb.save(EXPORT_PATH)
+    finally:
+        if pool:
+            pool.shutdown()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    if sheet_xml_supported():
+        save_manifest(EXPORT_PATH, disks, disk_sheets, categories)
+    metrics.count("bytes", EXPORT_PATH.stat().st_size)
+    write_json_log(METRICS_LOG, {**metrics.to_dict(), "path": str(EXPORT_PATH), "jobs": jobs})
+    print(f"\n[HADES] ✅ Export kész: {EXPORT_PATH}")
+    print(f"[HADES] Méret: {EXPORT_PATH.stat().st_size / 1024:.1f} KB")
+    print(f"[HADES] ⏱️  {metrics.summary()} | összesen {metrics.seconds:.2f}s")
 
-    # 2. Lemezenként sheet - csak ha változott
-    for disk in disks:
-        label = disk["label"]
-        ver = disk["version"]
-        sheet_title = f"💾 {label}"
 
-        # Aktuális snapshot string (ugyanolyan mint amit A2-be írunk)
-        current_snap = f"Scan: {ver[1][:19] if ver else '—'} | {ver[2] if ver else 0} fájl | {format_gb(ver[3]) if ver else 0} GB"
+# --- Adat exportok (CSV / Parquet) ---
+# Gépi feldolgozásra, Excel limitek nélkül: nyers byte és ns értékek,
+# a sorok DATA_CHUNK_ROWS-os darabokban jönnek a kurzorról (nincs fetchall).
 
-        if label in cached_sheets and cached_sheets[label] == current_snap and last_export:
-            # Nincs változás - régi sheet másolása
-            print(f"[HADES] ♻️  Sheet unchanged, copying cache: {label}")
-            if not copy_sheet_from_workbook(last_export, sheet_title, wb):
-                print(f"[HADES] Cache másolás sikertelen, regenerálás: {label}")
-                build_disk_sheet(wb, disk)
-        else:
-            print(f"[HADES] 🔄 Building sheet: {label} ({len(disk['files'])} files)...")
-            build_disk_sheet(wb, disk)
+DATA_COLUMNS = ["disk", "folder", "name", "size_bytes", "mtime_ns"]
 
-    # 3. History
-    print("[HADES] Building History sheet...")
-    build_history_sheet(wb, disks)
 
-    wb.save(EXPORT_PATH)
-    print(f"\n[HADES] ✅ Export kész: {EXPORT_PATH}")
-    print(f"[HADES] Méret: {EXPORT_PATH.stat().st_size / 1024:.1f} KB")
+def iter_data_chunks(disks, chunk_rows=DATA_CHUNK_ROWS):
+    """(label, [(folder, name, size, mtime_ns), ...]) darabok, lemezenként a legfrissebb verzióból."""
+    for disk in disks:
+        ver = disk["version"]
+        if not ver:
+            continue
+        cur = get_conn().execute(VERSION_ENTRIES_SQL, (ver[0],))
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield disk["label"], rows
+
+
+def export_csv(disks, path):
+    """CSV, .gz kiterjesztésnél gzip-pel tömörítve."""
+    if path.suffix == ".gz":
+        f = gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=DATA_GZIP_LEVEL)
+    else:
+        f = open(path, "w", newline="", encoding="utf-8")
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(DATA_COLUMNS)
+        for label, rows in iter_data_chunks(disks):
+            writer.writerows((label, folder or "/", name, size, mtime_ns) for folder, name, size, mtime_ns in rows)
+
+
+def export_parquet(disks, path):
+    """Parquet, darabonként egy row group (pyarrow kell hozzá)."""
+    schema = pa.schema([("disk", pa.string()), ("folder", pa.string()), ("name", pa.string()),
+                        ("size_bytes", pa.int64()), ("mtime_ns", pa.int64())])
+    writer = pq.ParquetWriter(str(path), schema)
+    try:
+        for label, rows in iter_data_chunks(disks):
+            folders, names, sizes, mtimes = zip(*rows)
+            writer.write_table(pa.table({
+                "disk": [label] * len(rows),
+                "folder": [folder or "/" for folder in folders],
+                "name": names,
+                "size_bytes": sizes,
+                "mtime_ns": mtimes,
+            }, schema=schema))
+    finally:
+        writer.close()
+
+
+# formátum -> (fájl kiterjesztés, exporter)
+DATA_EXPORTERS = {
+    "csv": (".csv", export_csv),
+    "csv.gz": (".csv.gz", export_csv),
+    "parquet": (".parquet", export_parquet),
+}
+
+
+def export_data(fmt):
+    """Streamelt CSV / Parquet export az EXPORT_PATH mellé, ugyanazzal a névvel."""
+    suffix, exporter = DATA_EXPORTERS[fmt]
+    if exporter is export_parquet and pa is None:
+        print("[HADES] ❌ Parquet exporthoz pyarrow kell: pip install pyarrow")
+        return
+    path = EXPORT_PATH.with_suffix(suffix)
+    with session():
+        init_db()
+        print(f"\n[HADES] Loading database...")
+        disks = load_disk_data()
+        if not disks:
+            print("[HADES] No data in database!")
+            return
+        print(f"[HADES] Writing {fmt}: {len(disks)} disks...")
+        exporter(disks, path)
+    print(f"\n[HADES] ✅ Export kész: {path}")
+    print(f"[HADES] Méret: {path.stat().st_size / 1024:.1f} KB")
 
 
 if __name__ == "__main__":
-    export()
+    parser = argparse.ArgumentParser(description="HADES Excel export")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="render changed disk sheets on N processes (output is identical to serial)")
+    parser.add_argument("--format", choices=["xlsx", *DATA_EXPORTERS], default="xlsx",
+                        help="xlsx (dashboard + sheets) or a flat file index for scripts")
+    args = parser.parse_args()
+    if args.format == "xlsx":
+        export(jobs=max(1, args.jobs))
+    else:
+        export_data(args.format)
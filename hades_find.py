@@ -0,0 +1,96 @@
+"""
+HADES v2 - hades_find.py
+"Which disk is this file on?" - path search across every disk's latest version
+Backed by the file_search FTS5 trigram index that save_new_version keeps current
+"""
+
+import sys
+import json
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_db import FIND_FILES_SQL, init_db, session, get_conn, has_search, rebuild_search
+from hades_scan import format_bytes
+
+FIND_LIMIT = 100
+
+# Mode -> condition on file_search s. LIKE is case-insensitive and index-assisted from
+# 3 characters on; the instr/substr half keeps '_' and '%' in the term literal.
+FIND_MODES = {
+    "contains": "s.name LIKE '%' || ?3 || '%' AND instr(lower(s.name), lower(?3)) > 0",
+    "prefix": "s.name LIKE ?3 || '%' AND substr(lower(s.name), 1, length(?3)) = lower(?3)",
+    "folder": "s.folder LIKE '%' || ?3 || '%' AND instr(lower(s.folder), lower(?3)) > 0",
+    "glob": "s.name GLOB ?3",
+    "path glob": "s.name GLOB ?3 AND s.folder GLOB ?4",
+}
+
+
+def find_files(term, mode="contains", label=None, limit=FIND_LIMIT):
+    """Open files matching term, as [(label, folder, name, size, mtime_ns)] sorted by disk and path.
+
+    mode is contains / prefix (file name, case-insensitive), folder (substring of
+    the folder path) or glob (case-sensitive, on the name; a pattern with '/' is
+    split and its folder part is globbed against the folder, e.g. '*/Photos/*.jpg').
+    """
+    params = [label, limit, term]
+    if mode == "glob" and "/" in term:
+        folder, _, name = term.rpartition("/")
+        mode, params = "path glob", [label, limit, name, folder]
+    sql = FIND_FILES_SQL.format(where=FIND_MODES[mode])
+    return get_conn().execute(sql, params).fetchall()
+
+
+def format_mtime_ms(mtime_ns):
+    if mtime_ns is None:
+        return "—"
+    return datetime.fromtimestamp(mtime_ns / 1e9).isoformat(sep=" ", timespec="milliseconds")
+
+
+def print_matches(rows, limit):
+    for label, folder, name, size, mtime_ns in rows:
+        print(f"💾 {label:<12} {format_bytes(size or 0):>10}  {format_mtime_ms(mtime_ns)}  {folder}/{name}")
+    more = " (limit reached, use --limit)" if len(rows) == limit else ""
+    print(f"\n[HADES] {len(rows)} matches{more}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES path search across all disks")
+    parser.add_argument("term", nargs="?", help="part of a file name (or a glob / prefix, see below)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--prefix", action="store_const", dest="mode", const="prefix",
+                       help="file names starting with term")
+    group.add_argument("--glob", action="store_const", dest="mode", const="glob",
+                       help="term is a case-sensitive glob, e.g. '*.MOV' or '*/Photos/*/IMG_*'")
+    group.add_argument("--folder", action="store_const", dest="mode", const="folder",
+                       help="files in folders whose path contains term")
+    parser.add_argument("--disk", help="only this disk label")
+    parser.add_argument("--limit", type=int, default=FIND_LIMIT, help="max matches")
+    parser.add_argument("--json", action="store_true", help="one JSON object per match (mtime_ms = epoch ms)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the search index from the DB")
+    args = parser.parse_args()
+    if not args.term and not args.rebuild:
+        parser.error("a search term is required")
+
+    # --json keeps stdout to match objects only; status lines (init, migrations, rebuild) go to stderr
+    with redirect_stdout(sys.stderr if args.json else sys.stdout), session():
+        init_db()
+        conn = get_conn()
+        if args.rebuild and not rebuild_search(conn):
+            sys.exit(1)
+        if not args.term:
+            sys.exit(0)
+        if not has_search(conn):
+            print("[HADES] No search index (needs SQLite with FTS5 trigram), see --rebuild")
+            sys.exit(1)
+        rows = find_files(args.term, args.mode or "contains", args.disk, args.limit)
+
+    if args.json:
+        for label, folder, name, size, mtime_ns in rows:
+            print(json.dumps({"disk": label, "path": f"{folder}/{name}", "size": size,
+                              "mtime_ms": None if mtime_ns is None else mtime_ns // 10**6}, ensure_ascii=False))
+    else:
+        print_matches(rows, args.limit)
+    sys.exit(0 if rows else 1)
@@ -0,0 +1,99 @@
+"""
+HADES v2 - hades_metrics.py
+Lightweight instrumentation: per-phase timers and counters, JSON log
+No HADES imports here: hades_db records its save phases through phase()
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class Metrics:
+    """Wall time and counters per phase of one run (one disk's scan, one export).
+
+    Phases may overlap (the walk runs while the writer stages its batches) and
+    nested ones are counted in their parent too (insert is part of save).
+    Phases that run in several pieces add up.
+    """
+
+    def __init__(self, kind, label=None):
+        self.kind = kind
+        self.label = label
+        self.started_at = datetime.now().isoformat()
+        self.phases = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self._start
+
+    def summary(self):
+        """'walk 1.2s | stat 0.4s | ...' in the order the phases first ran."""
+        return " | ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+
+    def to_dict(self):
+        return {"event": self.kind, "label": self.label, "started_at": self.started_at,
+                "seconds": round(self.seconds, 4),
+                "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+                "counters": self.counters}
+
+
+# Metrics that phase() / count() record into, per thread: a scan on the watch worker and
+# an export on another thread each only ever see their own
+_local = threading.local()
+
+
+def _active():
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def recording(metrics):
+    """Make metrics the target of phase() and count() in this thread for the duration of the block."""
+    previous, _local.metrics = _active(), metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+@contextmanager
+def phase(name):
+    """Time the block into this thread's active Metrics; a no-op when nothing is recording."""
+    active = _active()
+    if active is None:
+        yield None
+        return
+    with active.phase(name) as metrics:
+        yield metrics
+
+
+def count(name, n=1):
+    active = _active()
+    if active is not None:
+        active.count(name, n)
+
+
+def write_json_log(path, record):
+    """Append record as one JSON line (jq / pandas.read_json(lines=True) friendly)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": datetime.now().isoformat(), **record}, ensure_ascii=False) + "\n")
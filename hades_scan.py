@@ -6,18 +6,39 @@ Cross-platform: Darwin (macOS) / Linux
 
 import os
 import sys
+import argparse
 import platform
+import queue
+import re
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from hades_db import (
-    init_db, get_or_create_disk, get_last_version,
-    get_version_files, compute_diff, save_new_version
+    ROOT_DIR_ID, METRICS_LOG, init_db, session, get_or_create_disk, get_last_version,
+    get_version_dirs, get_last_full_scan, begin_stage, stage_batch, stage_copy_dirs, stage_totals,
+    end_stage, compute_staged_diff, save_staged_version, save_scan_metrics, maintenance
 )
+from hades_metrics import Metrics, recording, write_json_log
 
 SCAN_DEPTH = 7
 EXCLUDE_DIRS = {".Trashes", ".Spotlight-V100"}
+# Incremental scans trust unchanged dir mtimes, so files rewritten in place go unseen
+# until the next full scan; one is forced after this many incremental scans / days
+FULL_SCAN_EVERY = 10
+FULL_SCAN_MAX_DAYS = 30
+STAGE_BATCH = 10_000       # rows per batch handed from a walker to the DB writer
+STAGE_QUEUE_DEPTH = 4      # batches in flight per walker before it blocks
+PARALLEL_PENDING = 2       # directory listings in flight per --workers thread
+PROGRESS_TTY_INTERVAL = 0.5    # seconds between redraws of the live walk line on a terminal
+PROGRESS_LOG_INTERVAL = 10     # ... and between progress lines when stdout is a file / pipe
+MOUNTINFO = "/proc/self/mountinfo"
+_MOUNTINFO_ESCAPE = re.compile(rb"\\([0-7]{3})")
 
 def get_platform():
     return "darwin" if platform.system() == "Darwin" else "linux"
@@ -29,6 +50,28 @@ def get_mount_root():
     media = Path(f"/media/{user}")
     return media if media.exists() else Path("/mnt")
 
+def parse_mountinfo(data):
+    """{mount point: source} from the bytes of a mountinfo file (see proc(5))."""
+    mounts = {}
+    for line in data.splitlines():
+        fields = line.split(b" ")
+        try:
+            sep = fields.index(b"-", 6)
+        except ValueError:
+            continue
+        # Spaces, tabs, newlines and backslashes in paths are written as \ooo
+        point = os.fsdecode(_MOUNTINFO_ESCAPE.sub(lambda m: bytes([int(m.group(1), 8)]), fields[4]))
+        mounts[point] = os.fsdecode(fields[sep + 2]) if len(fields) > sep + 2 else ""
+    return mounts
+
+def is_mounted(path):
+    """Mount point check that also sees bind mounts of the same filesystem (os.path.ismount does not)."""
+    try:
+        with open(MOUNTINFO, "rb") as f:
+            return str(path) in parse_mountinfo(f.read())
+    except OSError:
+        return os.path.ismount(path)
+
 def detect_disks():
     mount_root = get_mount_root()
     found = []
@@ -41,36 +84,157 @@ def detect_disks():
             found.append({"label": entry.name, "mount_point": entry, "platform": get_platform()})
     return found
 
-def scan_files(mount_point, max_depth=SCAN_DEPTH):
-    files = {}
-    skipped = 0
-    mount_str = str(mount_point)
-    def _scan(path, depth):
-        nonlocal skipped
-        if depth > max_depth:
-            return
-        try:
-            for entry in path.iterdir():
+def _list_dir(path, depth, max_depth, prefix_len, rows):
+    """List one directory, append (rel_path, size, mtime_ns) to rows.
+
+    Returns (subdirs to descend, skipped count, ns spent in stat calls).
+    """
+    subdirs = []
+    skipped = stat_ns = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
                 try:
-                    if entry.is_symlink():
-                        continue
-                    if entry.is_dir():
+                    # d_type is cached on the DirEntry; symlinks are neither dir nor file here
+                    if entry.is_dir(follow_symlinks=False):
                         if entry.name in EXCLUDE_DIRS:
                             skipped += 1
-                            continue
-                        _scan(entry, depth + 1)
-                    elif entry.is_file():
-                        rel_path = str(entry).replace(mount_str, "")
-                        stat = entry.stat()
-                        files[rel_path] = {"size": stat.st_size, "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()}
-                except (PermissionError, OSError):
+                        elif depth < max_depth:
+                            subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        t = time.perf_counter_ns()
+                        stat = entry.stat(follow_symlinks=False)
+                        stat_ns += time.perf_counter_ns() - t
+                        rows.append((entry.path[prefix_len:], stat.st_size, stat.st_mtime_ns))
+                except OSError:
                     pass
-        except PermissionError:
-            pass
-    _scan(mount_point, 0)
+    except OSError:
+        pass
+    return subdirs, skipped, stat_ns
+
+def _dir_state(path):
+    """(mtime_ns, inode) of a directory, or None if it can't be stat'ed."""
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino)
+
+def _iter_parallel(mount_str, max_depth, prefix_len, workers, dirs, counts):
+    """Hand directories to a thread pool, yield each listing's rows as it completes."""
+    def _task(path, depth):
+        rows = []
+        state = _dir_state(path) if dirs is not None else None
+        subdirs, skipped, stat_ns = _list_dir(path, depth, max_depth, prefix_len, rows)
+        return rows, subdirs, skipped, stat_ns, depth, path, state
+    # Only PARALLEL_PENDING listings per worker are submitted at a time; the rest wait as
+    # bare paths on a stack. A finished listing holds all its rows until they are yielded,
+    # so while the consumer is blocked (generator suspended) the pool runs dry instead of
+    # buffering the whole walk frontier past max_memory_mb.
+    max_pending = workers * PARALLEL_PENDING
+    todo = [(mount_str, 0)]
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while todo or pending:
+            while todo and len(pending) < max_pending:
+                pending.add(pool.submit(_task, *todo.pop()))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rows, subdirs, n, stat_ns, depth, path, state = fut.result()
+                counts["skipped"] += n
+                counts["stat_ns"] += stat_ns
+                counts["dirs"] += 1
+                if state:
+                    dirs[path[prefix_len:]] = state
+                todo.extend((d, depth + 1) for d in subdirs)
+                yield from rows
+
+def iter_files(mount_point, max_depth=SCAN_DEPTH, workers=1, log=print, dirs=None, metrics=None):
+    """Walk mount_point with os.scandir, yield (rel_path, size, mtime_ns) per file.
+
+    If dirs is a dict, it is filled with {rel_dir: (mtime_ns, inode)} for every
+    listed directory, so the next scan can run incrementally. Time spent in stat
+    calls and the listed dir count go into metrics (a hades_metrics.Metrics).
+    """
+    mount_str = str(Path(mount_point))
+    prefix_len = len(mount_str)
+    counts = {"skipped": 0, "stat_ns": 0, "dirs": 0}
+    if workers > 1:
+        yield from _iter_parallel(mount_str, max_depth, prefix_len, workers, dirs, counts)
+    else:
+        # Explicit stack instead of recursion: (dir path, depth)
+        stack = [(mount_str, 0)]
+        while stack:
+            path, depth = stack.pop()
+            if dirs is not None:
+                state = _dir_state(path)
+                if state:
+                    dirs[path[prefix_len:]] = state
+            rows = []
+            subdirs, n, stat_ns = _list_dir(path, depth, max_depth, prefix_len, rows)
+            counts["skipped"] += n
+            counts["stat_ns"] += stat_ns
+            counts["dirs"] += 1
+            stack.extend((d, depth + 1) for d in subdirs)
+            yield from rows
+    if counts["skipped"]:
+        log(f"[HADES] Skipped {counts['skipped']} excluded dirs {EXCLUDE_DIRS}")
+    if metrics:
+        metrics.add("stat", counts["stat_ns"] / 1e9)
+        metrics.count("dirs_listed", counts["dirs"])
+
+def scan_files(mount_point, max_depth=SCAN_DEPTH, workers=1, log=print, dirs=None):
+    """Walk mount_point, return {rel_path: {size, mtime_ns}} (see iter_files)."""
+    return {path: {"size": size, "mtime_ns": mtime}
+            for path, size, mtime in iter_files(mount_point, max_depth, workers, log, dirs)}
+
+def iter_files_incremental(mount_point, prev_dirs, reused, max_depth=SCAN_DEPTH, log=print, dirs=None,
+                           metrics=None):
+    """Like iter_files, but only re-lists dirs whose (mtime, inode) changed.
+
+    Unchanged dirs are appended to reused (their files are carried forward from
+    the DB by the caller) and their subdirs are taken from prev_dirs. A file
+    rewritten in place does not touch its dir's mtime, so such edits are only
+    picked up by a full scan.
+    """
+    if dirs is None:
+        dirs = {}
+    mount_str = str(Path(mount_point))
+    prefix_len = len(mount_str)
+
+    children = {}
+    for d in prev_dirs:
+        if d:
+            children.setdefault(d.rpartition("/")[0], []).append(d)
+
+    skipped = relisted = stat_ns_total = 0
+    stack = [(mount_str, 0)]
+    while stack:
+        path, depth = stack.pop()
+        rel = path[prefix_len:]
+        state = _dir_state(path)
+        if state is None:
+            continue
+        dirs[rel] = state
+        if prev_dirs.get(rel) == state:
+            reused.append(rel)
+            if depth < max_depth:
+                stack.extend((mount_str + d, depth + 1) for d in children.get(rel, ()))
+        else:
+            relisted += 1
+            rows = []
+            subdirs, n, stat_ns = _list_dir(path, depth, max_depth, prefix_len, rows)
+            skipped += n
+            stat_ns_total += stat_ns
+            stack.extend((d, depth + 1) for d in subdirs)
+            yield from rows
     if skipped:
-        print(f"[HADES] Skipped {skipped} excluded dirs {EXCLUDE_DIRS}")
-    return files
+        log(f"[HADES] Skipped {skipped} excluded dirs {EXCLUDE_DIRS}")
+    log(f"[HADES] Incremental: {relisted} dirs re-listed, {len(reused)} unchanged")
+    if metrics:
+        metrics.add("stat", stat_ns_total / 1e9)
+        metrics.count("dirs_listed", relisted)
+        metrics.count("dirs_reused", len(reused))
 
 def format_bytes(b):
     for unit in ["B","KB","MB","GB","TB"]:
@@ -78,48 +242,296 @@ def format_bytes(b):
             return f"{b:.1f} {unit}"
         b /= 1024
 
-def run_scan(label=None):
-    init_db()
-    plat = get_platform()
-    print(f"\n[HADES] Platform: {plat.upper()}")
-    print(f"[HADES] Detecting disks...\n")
-    disks = detect_disks()
-    if not disks:
-        print("[HADES] No external disks found.")
-        return
-    if label:
-        disks = [d for d in disks if d["label"].upper() == label.upper()]
-        if not disks:
-            print(f"[HADES] Disk not found: {label}")
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is bytes on macOS, KB on Linux)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if get_platform() == "darwin" else rss / 1024
+
+def current_rss_mb():
+    """Current RSS in MB where /proc is available, else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+class Progress:
+    """Live files/s and bytes/s of a walk: redrawn in place on a terminal, one line per interval otherwise."""
+
+    def __init__(self, label, stream=None):
+        self.label = label
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = PROGRESS_TTY_INTERVAL if self.tty else PROGRESS_LOG_INTERVAL
+        self.files = self.bytes = 0
+        self._last = time.perf_counter()
+        self._last_files = self._last_bytes = 0
+        self._drawn = False
+
+    def update(self, files, nbytes):
+        self.files += files
+        self.bytes += nbytes
+        now = time.perf_counter()
+        if now - self._last < self.interval:
             return
-    for disk in disks:
-        print(f"{'='*50}")
-        print(f"💾 {disk['label']} @ {disk['mount_point']}")
-        print(f"{'='*50}")
-        disk_id = get_or_create_disk(label=disk["label"], platform=plat)
-        print(f"[HADES] Scanning... (max depth: {SCAN_DEPTH})")
-        start = datetime.now()
-        files = scan_files(disk["mount_point"])
-        elapsed = (datetime.now() - start).total_seconds()
-        total_size = sum(f["size"] for f in files.values())
-        print(f"[HADES] Found {len(files)} files | {format_bytes(total_size)} | {elapsed:.1f}s")
-        last = get_last_version(disk_id)
+        # Rate over the last interval, not since the start: a slow folder shows up right away
+        dt = now - self._last
+        line = (f"[HADES] ⏳ {self.label}: {self.files:,} files | {format_bytes(self.bytes)} | "
+                f"{(self.files - self._last_files) / dt:,.0f} files/s | "
+                f"{format_bytes((self.bytes - self._last_bytes) / dt)}/s")
+        self._last, self._last_files, self._last_bytes = now, self.files, self.bytes
+        if self.tty:
+            self.stream.write("\r" + line.ljust(100))
+            self._drawn = True
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def done(self):
+        """Clear the live line so the next log line starts clean."""
+        if self._drawn:
+            self.stream.write("\r" + " " * 100 + "\r")
+            self.stream.flush()
+            self._drawn = False
+
+def pipeline_limits(max_memory_mb=None):
+    """Batch size, queue depth and SQLite pragmas that fit a memory ceiling (None = defaults)."""
+    if not max_memory_mb:
+        return {"batch_size": STAGE_BATCH, "queue_depth": STAGE_QUEUE_DEPTH, "pragmas": {}}
+    # A quarter of the ceiling for rows in flight (~250 B per row), a quarter for the page cache
+    in_flight = max_memory_mb * 1024**2 // 4
+    batch_size = max(500, min(STAGE_BATCH, in_flight // (250 * STAGE_QUEUE_DEPTH)))
+    cache_kib = max_memory_mb * 1024 // 4
+    return {
+        "batch_size": int(batch_size),
+        "queue_depth": STAGE_QUEUE_DEPTH,
+        "pragmas": {"cache_size": -cache_kib, "mmap_size": min(256, max_memory_mb // 4) * 1024**2},
+    }
+
+def _print_header(disk, log=print):
+    log(f"{'='*50}")
+    log(f"💾 {disk['label']} @ {disk['mount_point']}")
+    log(f"{'='*50}")
+
+def _full_scan_due(disk_id):
+    """Why the next scan of disk_id has to be a full one, or None if an incremental one will do."""
+    last_full = get_last_full_scan(disk_id)
+    if last_full is None:
+        return "no full scan on record"
+    started_at, since = last_full
+    if since >= FULL_SCAN_EVERY:
+        return f"{since} incremental scans since the last full one"
+    days = (datetime.now() - datetime.fromisoformat(started_at)).days
+    if days >= FULL_SCAN_MAX_DAYS:
+        return f"last full scan {days} days ago"
+    return None
+
+def _prepare_disk(disk, plat, full=False):
+    """Register the disk and load the dir states of its last version (for incremental scans)."""
+    job = {"disk": disk, "disk_id": get_or_create_disk(label=disk["label"], platform=plat)}
+    job["last"] = get_last_version(job["disk_id"])
+    job["old_dirs"] = job["full_due"] = None
+    if job["last"] and not full:
+        job["full_due"] = _full_scan_due(job["disk_id"])
+        if not job["full_due"]:
+            job["old_dirs"] = get_version_dirs(job["last"]["id"]) or None
+    return job
+
+def _walk_disk(job, workers, limits, out, log=print):
+    """Walker thread: push (job, batch) into out, then (job, None) when done or (job, exc) on error."""
+    disk, metrics = job["disk"], job["metrics"]
+    job["dirs"], job["reused"] = {}, []
+    try:
+        with metrics.phase("walk"):
+            if job["old_dirs"] is not None:
+                log(f"[HADES] Incremental scan... (max depth: {SCAN_DEPTH})")
+                rows = iter_files_incremental(disk["mount_point"], job["old_dirs"], job["reused"], log=log,
+                                              dirs=job["dirs"], metrics=metrics)
+            else:
+                if job["full_due"]:
+                    log(f"[HADES] Full scan due: {job['full_due']}")
+                log(f"[HADES] Scanning... (max depth: {SCAN_DEPTH}, workers: {workers})")
+                rows = iter_files(disk["mount_point"], workers=workers, log=log, dirs=job["dirs"], metrics=metrics)
+            while True:
+                batch = list(islice(rows, limits["batch_size"]))
+                if not batch:
+                    break
+                out.put((job, batch))
+        out.put((job, None))
+    except BaseException as e:
+        out.put((job, e))
+
+def _save_disk(job):
+    """Finish the staged scan: copy-forward, diff in SQL, save. Only ever called from the writer thread."""
+    disk_id, last, metrics = job["disk_id"], job["last"], job["metrics"]
+    if job["reused"]:
+        with metrics.phase("stage"):
+            stage_copy_dirs(disk_id, job["reused"], job["cache"])
+    file_count, total_size = stage_totals(disk_id)
+    elapsed = (datetime.now() - job["start"]).total_seconds()
+    print(f"[HADES] Found {file_count} files | {format_bytes(total_size)} | {elapsed:.1f}s")
+    if job["disk"].get("require_mount") and not is_mounted(job["disk"]["mount_point"]):
+        # Pulled mid-walk: the listing is partial and would be saved as mass deletions
+        print(f"[HADES] ❌ {job['disk']['label']} is no longer mounted - scan discarded.")
+        end_stage(disk_id)
+        return
+    # files / bytes of the disk, reused dirs included (the walk counters only see re-listed ones)
+    metrics.counters.update(files=file_count, bytes=total_size)
+    version_id = last["id"] if last else None
+    with recording(metrics):
         if last is None:
             print(f"[HADES] First scan - no previous version.")
-            diff = {"added": list(files.keys()), "removed": [], "modified": [], "has_changes": True}
-            save_new_version(disk_id, files, diff, prev_version_id=None)
+            diff = {"added_count": file_count, "removed_count": 0, "modified_count": 0, "has_changes": True}
+            version_id = save_staged_version(disk_id, diff, prev_version_id=None, dirs=job["dirs"])
             print(f"[HADES] ✅ Initial version saved.")
         else:
             print(f"[HADES] Previous: {last['scanned_at'][:19]} | {last['file_count']} files")
-            old_files = get_version_files(last["id"])
-            diff = compute_diff(old_files, files)
+            with metrics.phase("diff"):
+                diff = compute_staged_diff(disk_id)
             if diff["has_changes"]:
-                print(f"[HADES] Changes: +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['modified'])}")
-                save_new_version(disk_id, files, diff, prev_version_id=last["id"])
+                print(f"[HADES] Changes: +{diff['added_count']} -{diff['removed_count']} ~{diff['modified_count']}")
+                version_id = save_staged_version(disk_id, diff, prev_version_id=last["id"], dirs=job["dirs"])
                 print(f"[HADES] ✅ New version saved.")
             else:
                 print(f"[HADES] ✅ No changes - skip.")
+    end_stage(disk_id)
+
+    metrics.counters.update(added=diff["added_count"], removed=diff["removed_count"], modified=diff["modified_count"])
+    mode = "first" if last is None else ("incremental" if job["old_dirs"] is not None else "full")
+    record = {**metrics.to_dict(), "mode": mode, "version_id": version_id}
+    save_scan_metrics(disk_id, version_id, mode, record)
+    write_json_log(METRICS_LOG, record)
+    print(f"[HADES] ⏱️  {metrics.summary()} | total {metrics.seconds:.2f}s")
+
+def _run_pipeline(jobs, workers, concurrent, limits, max_memory_mb=None):
+    """Walkers stream batches through a bounded queue; this thread is the single DB writer.
+
+    Serial mode walks one disk at a time and logs live; concurrent mode walks
+    all disks at once with buffered logs, printed as one block per disk.
+    A disk whose walk fails has its stage discarded and the others carry on;
+    returns the labels of those failed disks.
+    """
+    waiting = list(jobs)
+    n_walkers = len(jobs) if concurrent else 1
+    out = queue.Queue(maxsize=limits["queue_depth"] * n_walkers)
+    cache = {"": ROOT_DIR_ID}
+    warned = False
+    failed = []
+    progress = Progress(f"{len(jobs)} disks") if concurrent else None
+
+    def _launch():
+        job = waiting.pop(0)
+        job["lines"] = []
+        job["cache"] = cache
+        job["start"] = datetime.now()
+        job["metrics"] = Metrics("scan", job["disk"]["label"])
+        # Concurrent walkers share one live line with the totals of all disks
+        job["progress"] = progress if concurrent else Progress(job["disk"]["label"])
+        if not concurrent:
+            _print_header(job["disk"])
+        begin_stage(job["disk_id"])
+        log = job["lines"].append if concurrent else print
+        threading.Thread(target=_walk_disk, args=(job, workers, limits, out, log), daemon=True).start()
+
+    running = 0
+    while waiting and running < n_walkers:
+        _launch()
+        running += 1
+    while running:
+        job, item = out.get()
+        if isinstance(item, list):
+            with job["metrics"].phase("stage"):
+                stage_batch(job["disk_id"], item, cache)
+            job["progress"].update(len(item), sum(row[1] for row in item))
+            if max_memory_mb and current_rss_mb() > max_memory_mb and limits["batch_size"] > 500:
+                # Over the ceiling: shrink the batches walkers hand over from now on
+                limits["batch_size"] = max(500, limits["batch_size"] // 2)
+                if not warned:
+                    print(f"[HADES] ⚠️  RSS {current_rss_mb():.0f} MB > {max_memory_mb} MB, shrinking batches")
+                    warned = True
+            continue
+        running -= 1
+        job["progress"].done()
+        if concurrent:
+            _print_header(job["disk"])
+            for line in job["lines"]:
+                print(line)
+        if isinstance(item, BaseException):
+            end_stage(job["disk_id"])
+            if not isinstance(item, Exception):
+                raise item
+            # e.g. an unreadable mount: only this disk's partial stage is lost
+            print(f"[HADES] ❌ Scan of {job['disk']['label']} failed: {item!r} - discarded, no version saved.")
+            failed.append(job["disk"]["label"])
+        else:
+            _save_disk(job)
         print()
+        if waiting:
+            _launch()
+            running += 1
+    return failed
+
+def run_scan(label=None, workers=1, concurrent=False, full=False, max_memory_mb=None, checksum_minutes=None,
+             disks=None):
+    """Scan the detected disks (or the given [{label, mount_point, platform}]), then clean up the DB.
+
+    Returns the labels of the disks whose scan failed (the others are saved regardless).
+    """
+    limits = pipeline_limits(max_memory_mb)
+    # One DB connection for the whole run; only the writer thread (the caller) touches it
+    with session(**limits["pragmas"]):
+        failed = _run_scan(label, workers, concurrent, full, limits, max_memory_mb, checksum_minutes, disks)
+    print(f"[HADES] Peak RSS: {peak_rss_mb():.0f} MB")
+    if failed:
+        print(f"[HADES] ❌ Failed disks: {', '.join(failed)}")
+    return failed
+
+def _run_scan(label, workers, concurrent, full, limits, max_memory_mb, checksum_minutes=None, disks=None):
+    init_db()
+    plat = get_platform()
+    print(f"\n[HADES] Platform: {plat.upper()}")
+    if disks is None:
+        print(f"[HADES] Detecting disks...\n")
+        disks = detect_disks()
+    if not disks:
+        print("[HADES] No external disks found.")
+        return []
+    if label:
+        disks = [d for d in disks if d["label"].upper() == label.upper()]
+        if not disks:
+            print(f"[HADES] Disk not found: {label}")
+            return []
+    concurrent = concurrent and len(disks) > 1
+    if concurrent:
+        print(f"[HADES] Scanning {len(disks)} disks concurrently...\n")
+    jobs = [_prepare_disk(disk, plat, full) for disk in disks]
+    failed = _run_pipeline(jobs, workers, concurrent, limits, max_memory_mb)
+    # Pruned versions leave dead file rows; clean them up once, after every disk is saved
+    start = time.perf_counter()
+    report = maintenance()
+    write_json_log(METRICS_LOG, {"event": "maintenance", "seconds": round(time.perf_counter() - start, 4), **report})
+    if checksum_minutes:
+        from hades_checksum import run_checksums
+        print(f"\n[HADES] Checksums ({checksum_minutes:g} min budget)...")
+        run_checksums([d for d in disks if d["label"] not in failed], seconds=checksum_minutes * 60)
+    return failed
 
 if __name__ == "__main__":
-    run_scan(sys.argv[1] if len(sys.argv) > 1 else None)
+    parser = argparse.ArgumentParser(description="HADES disk scanner")
+    parser.add_argument("label", nargs="?", help="scan only this disk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parallel directory listing threads (1 = serial walk)")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="scan all detected disks at the same time")
+    parser.add_argument("--full", action="store_true",
+                        help="re-list every directory. By default dirs with unchanged mtime + inode are "
+                             "skipped, which misses files rewritten in place; a full scan is forced anyway "
+                             f"every {FULL_SCAN_EVERY} scans or {FULL_SCAN_MAX_DAYS} days")
+    parser.add_argument("--max-memory", type=int, metavar="MB",
+                        help="memory ceiling: sizes batches and the SQLite cache, shrinks batches if RSS goes over")
+    parser.add_argument("--checksum", type=float, nargs="?", const=10, metavar="MINUTES",
+                        help="afterwards hash new files and re-verify old ones for up to MINUTES (default 10)")
+    args = parser.parse_args()
+    failed = run_scan(args.label, workers=max(1, args.workers), concurrent=args.concurrent, full=args.full,
+                      max_memory_mb=args.max_memory, checksum_minutes=args.checksum)
+    sys.exit(1 if failed else 0)
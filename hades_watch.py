@@ -0,0 +1,255 @@
+"""
+HADES v2 - hades_watch.py
+Mount watcher daemon: scans a disk as soon as it is mounted
+Linux: blocks in poll() on /proc/self/mountinfo (the kernel flags it on every mount
+table change), so an idle watcher costs no CPU; elsewhere the mount root is re-listed
+every WATCH_POLL_INTERVAL seconds
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import traceback
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from hades_scan import MOUNTINFO, get_platform, get_mount_root, detect_disks, parse_mountinfo, is_mounted, run_scan
+
+WATCH_DEBOUNCE = 2.0          # seconds without a mount table change before acting
+WATCH_POLL_INTERVAL = 5.0     # fallback re-list interval where mountinfo is not available
+
+
+def mounted_disks(mounts, root):
+    """{label: disk dict} of the mounts directly under root, as detect_disks() would list them."""
+    disks = {}
+    for point in mounts:
+        path = Path(point)
+        if path.parent == root and path.is_dir():
+            disks[path.name] = {"label": path.name, "mount_point": path, "platform": get_platform(),
+                                "require_mount": True}
+    return disks
+
+
+class MountWatcher:
+    """Blocks until the set of disks under the mount root changes, then reports (mounted, unmounted).
+
+    root=None follows get_mount_root() on every check, so /media/$USER is picked
+    up once the desktop creates it on the first mount.
+    """
+
+    def __init__(self, root=None, debounce=WATCH_DEBOUNCE):
+        self.root = Path(root) if root else None
+        self.debounce = debounce
+        self.file = None
+        self.poller = None
+        if get_platform() == "linux" and os.path.exists(MOUNTINFO):
+            self.file = open(MOUNTINFO, "rb")
+            self.poller = select.poll()
+            self.poller.register(self.file, select.POLLPRI | select.POLLERR)
+        self.disks = self.current()
+
+    def current(self):
+        root = self.root or get_mount_root()
+        if self.file is None:
+            return {d["label"]: {**d, "require_mount": False} for d in detect_disks()}
+        self.file.seek(0)
+        return mounted_disks(parse_mountinfo(self.file.read()), root)
+
+    def _wait(self, timeout):
+        """True if the mount table changed within timeout seconds (None = wait for ever)."""
+        if self.poller is None:
+            time.sleep(WATCH_POLL_INTERVAL if timeout is None else timeout)
+            return timeout is None
+        # Each event has to be consumed by reading the file again (done in current())
+        return bool(self.poller.poll(None if timeout is None else timeout * 1000))
+
+    def wait_for_change(self):
+        """Block until the disk set changes and has been quiet for debounce seconds."""
+        while True:
+            if not self._wait(None):
+                continue
+            self.current()
+            # Debounce: a desktop mount is often several mount table events in a row
+            while self._wait(self.debounce):
+                self.current()
+            disks = self.current()
+            mounted = [d for label, d in disks.items() if label not in self.disks]
+            unmounted = [label for label in self.disks if label not in disks]
+            self.disks = disks
+            if mounted or unmounted:
+                return mounted, unmounted
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def _export_batch():
+    """One cached export for the whole batch of scans, to a timestamped file."""
+    import hades_export
+    hades_export.EXPORT_PATH = (hades_export.HADES_DIR /
+                                f"HADES_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    hades_export.export()
+
+
+def _scan_worker(jobs, scan_kwargs, export, log=print, scan=run_scan):
+    """Consumer thread: scan queued disks one at a time (it owns the DB connection), export when idle."""
+    exported = True
+    while True:
+        try:
+            disk = jobs.get(timeout=None if exported else 0)
+        except queue.Empty:
+            disk = None
+        if disk is StopIteration:
+            return
+        # Anything failing for one disk (mount check, scan, export) is logged and the
+        # thread carries on: an uncaught error here would end it silently while the
+        # watcher kept queueing mounts nobody scans
+        try:
+            if disk is None:
+                # Queue drained after at least one scan
+                exported = True
+                _export_batch()
+            elif not (is_mounted if disk.get("require_mount") else os.path.isdir)(disk["mount_point"]):
+                log(f"[HADES] {disk['label']} was unmounted before its scan, skipped")
+            else:
+                scan(disks=[disk], **scan_kwargs)
+                exported = not export
+        except Exception:
+            what = "Export" if disk is None else f"Scan of {disk['label']}"
+            log(f"[HADES] ❌ {what} failed:\n{traceback.format_exc().rstrip()}")
+
+
+def run_watch(root=None, debounce=WATCH_DEBOUNCE, export=False, initial=False, log=print, scan=run_scan,
+              **scan_kwargs):
+    """Watch for mounts until SIGINT / SIGTERM; every newly mounted disk gets scan(disks=[disk], **scan_kwargs)."""
+    watcher = MountWatcher(root, debounce)
+    jobs = queue.Queue()
+    worker = threading.Thread(target=_scan_worker, args=(jobs, scan_kwargs, export, log, scan), name="hades-scan")
+    worker.start()
+    mode = f"poll({MOUNTINFO})" if watcher.poller else f"re-list every {WATCH_POLL_INTERVAL:g}s"
+    log(f"[HADES] Watching {watcher.root or get_mount_root()} | {mode} | "
+        f"{len(watcher.disks)} mounted: {', '.join(sorted(watcher.disks)) or '—'}")
+    if initial:
+        for disk in watcher.disks.values():
+            jobs.put(disk)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            mounted, unmounted = watcher.wait_for_change()
+            for label in unmounted:
+                log(f"[HADES] ⏏️  Unmounted: {label}")
+            for disk in mounted:
+                log(f"[HADES] 🔌 Mounted: {disk['label']} @ {disk['mount_point']} - scan queued")
+                jobs.put(disk)
+    except KeyboardInterrupt:
+        log("\n[HADES] Stopping (waiting for the running scan to finish)...")
+    finally:
+        jobs.put(StopIteration)
+        worker.join()
+        watcher.close()
+
+
+def self_test(debounce=0.3, timeout=10.0, log=print):
+    """Bind-mount round trip under a temp --root (Linux, needs root); True if every step held.
+
+    Three mounts are made one after the other; the middle one's scan raises, and the
+    third must still be scanned. Then both unmounts have to be seen and SIGINT has to
+    stop the watcher. The watcher scans through a recorder, so no DB is touched.
+    """
+    if get_platform() != "linux" or not os.path.exists(MOUNTINFO) or os.geteuid() != 0:
+        log("[HADES] Self-test needs Linux, /proc/self/mountinfo and root (bind mounts)")
+        return False
+    tmp = Path(tempfile.mkdtemp(prefix="hades_watch_"))
+    src, root = tmp / "src", tmp / "mnt"
+    labels = ["OK1", "FAIL", "OK2"]
+    for d in [src] + [root / label for label in labels]:
+        d.mkdir(parents=True)
+    (src / "file.txt").write_text("hades")
+    scanned, lines, failures = queue.Queue(), [], []
+
+    def recorder(disks, **kwargs):
+        scanned.put(disks[0]["label"])
+        if disks[0]["label"] == "FAIL":
+            raise OSError("simulated scan failure")
+
+    def expect(what, ok):
+        log(f"[HADES] {'✅' if ok else '❌'} {what}")
+        if not ok:
+            failures.append(what)
+
+    def wait_log(text):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if any(text in line for line in lines):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def drive():
+        if not wait_log("Watching"):
+            expect("watcher started", False)
+            return  # run_watch failed in setup: nothing to mount for, nobody to stop
+        mounted = []
+        try:
+            for label in labels:
+                subprocess.run(["mount", "--bind", str(src), str(root / label)], check=True)
+                mounted.append(root / label)
+                try:
+                    got = scanned.get(timeout=timeout)
+                except queue.Empty:
+                    got = None
+                expect(f"mount of {label} scanned", got == label)
+            expect("failed scan logged", wait_log("Scan of FAIL failed"))
+            for point in mounted[::2]:
+                subprocess.run(["umount", str(point)], check=True)
+                mounted.remove(point)
+            expect("unmounts seen", all(wait_log(f"Unmounted: {label}") for label in labels[::2]))
+        except Exception as e:
+            expect(f"driver: {e}", False)
+        finally:
+            for point in mounted:
+                subprocess.run(["umount", "-l", str(point)])
+            os.kill(os.getpid(), signal.SIGINT)
+
+    driver = threading.Thread(target=drive, name="hades-self-test")
+    try:
+        driver.start()
+        run_watch(root, debounce, log=lambda line: (lines.append(line), log(line)), scan=recorder)
+        driver.join()
+        expect("stopped on SIGINT", True)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if not any(str(tmp) in point for point in parse_mountinfo(open(MOUNTINFO, "rb").read())):
+            shutil.rmtree(tmp)
+    log(f"[HADES] Self-test {'failed: ' + ', '.join(failures) if failures else 'OK'}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HADES mount watcher: scan disks when they are mounted")
+    parser.add_argument("--root", help="watch mounts directly under this dir (default: /Volumes, /media/$USER or /mnt)")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="seconds the mount table must be quiet before scanning")
+    parser.add_argument("--initial", action="store_true", help="also scan the disks mounted at start")
+    parser.add_argument("--export", action="store_true", help="cached export after each batch of scans")
+    parser.add_argument("--full", action="store_true",
+                        help="full instead of incremental scans (these miss in-place rewrites until the "
+                             "periodic full scan, see hades_scan.py --help)")
+    parser.add_argument("--workers", type=int, default=1, help="directory listing threads per scan")
+    parser.add_argument("--self-test", action="store_true",
+                        help="bind-mount round trip under a temp root, no DB (Linux, root)")
+    args = parser.parse_args()
+    if args.self_test:
+        sys.exit(0 if self_test() else 1)
+    run_watch(args.root, args.debounce, args.export, args.initial, full=args.full, workers=max(1, args.workers))